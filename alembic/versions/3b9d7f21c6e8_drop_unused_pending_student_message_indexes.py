@@ -0,0 +1,37 @@
+"""Drop unused pending student message indexes
+
+Revision ID: 3b9d7f21c6e8
+Revises: 8e2f4a6c1b37
+Create Date: 2026-10-18 07:41:26.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d7f21c6e8'
+down_revision: Union[str, None] = '8e2f4a6c1b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PENDING_WHERE = dict(
+    postgresql_where=sa.text('NOT received_reaction'),
+    sqlite_where=sa.text('received_reaction = 0'),
+)
+
+
+def upgrade() -> None:
+    # group lookups and SLA scans read message_group now, these indexes only slow down writes
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_student_message_pending_user_chat_sent_at', table_name='student_message', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_student_message_pending_sent_at', table_name='student_message', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_student_message_pending_sent_at', 'student_message', ['sent_at'], unique=False, postgresql_concurrently=True, if_not_exists=True, **PENDING_WHERE)
+        op.create_index('ix_student_message_pending_user_chat_sent_at', 'student_message', ['user_id', 'chat_id', 'sent_at'], unique=False, postgresql_concurrently=True, if_not_exists=True, **PENDING_WHERE)
@@ -0,0 +1,39 @@
+"""Add partial indexes for pending student messages
+
+Revision ID: 55c41f8e1e95
+Revises: 4ff19b3335b2
+Create Date: 2026-10-18 03:18:07.656573
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '55c41f8e1e95'
+down_revision: Union[str, None] = '4ff19b3335b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PENDING_WHERE = dict(
+    postgresql_where=sa.text('NOT received_reaction'),
+    sqlite_where=sa.text('received_reaction = 0'),
+)
+
+
+def upgrade() -> None:
+    # CONCURRENTLY does not block writes to student_message, but can not run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_student_message_pending_message_group_id', 'student_message', ['message_group_id'], unique=False, postgresql_concurrently=True, if_not_exists=True, **PENDING_WHERE)
+        op.create_index('ix_student_message_pending_sent_at', 'student_message', ['sent_at'], unique=False, postgresql_concurrently=True, if_not_exists=True, **PENDING_WHERE)
+        op.create_index('ix_student_message_pending_user_chat_sent_at', 'student_message', ['user_id', 'chat_id', 'sent_at'], unique=False, postgresql_concurrently=True, if_not_exists=True, **PENDING_WHERE)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_student_message_pending_user_chat_sent_at', table_name='student_message', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_student_message_pending_sent_at', table_name='student_message', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_student_message_pending_message_group_id', table_name='student_message', postgresql_concurrently=True, if_exists=True)
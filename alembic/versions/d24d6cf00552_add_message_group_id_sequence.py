@@ -0,0 +1,50 @@
+"""Add message_group id sequence
+
+Revision ID: d24d6cf00552
+Revises: d72844a35161
+Create Date: 2026-10-18 03:57:31.010689
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd24d6cf00552'
+down_revision: Union[str, None] = 'd72844a35161'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("message_group_id_seq"), if_not_exists=True))
+    # Existing groups have hashes of their first message as ids, they are renumbered with the sequence
+    # in the order they were opened, so that hash and sequence ids never share the primary key
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE message_group_id_map ON COMMIT DROP AS
+        SELECT id AS old_id, nextval('message_group_id_seq') AS new_id
+        FROM (SELECT id FROM message_group ORDER BY first_sent_at, id) AS ordered
+        """
+    )
+    # a new id may equal the old id of another group, uniqueness is checked once all of them are renumbered
+    op.drop_constraint("message_group_pkey", "message_group", type_="primary")
+    for table, column in (
+        ("student_message", "message_group_id"),
+        ("student_message_archive", "message_group_id"),
+        ("message_group", "id"),
+    ):
+        op.execute(
+            f"""
+            UPDATE {table} SET {column} = message_group_id_map.new_id
+            FROM message_group_id_map
+            WHERE {table}.{column} = message_group_id_map.old_id
+            """
+        )
+    op.create_primary_key("message_group_pkey", "message_group", ["id"])
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence("message_group_id_seq"), if_exists=True))
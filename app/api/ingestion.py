@@ -0,0 +1,159 @@
+from typing import Sequence
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import AppConfig, get_config
+from app.service.event_processing.batch_events import process_event_batch
+from app.service.event_processing.batch_writer import StudentMessageWriter
+from app.service.event_processing.deduplication import EventDeduplicator, event_key
+from app.service.event_processing.durable_queue import DurableEventWorkers, enqueue_events
+from app.service.event_processing.events import Payload, process_event
+from app.service.event_processing.worker_pool import EventWorkerPool, QueuedEvent
+from app.service.orm.sessionmaker import get_session
+from app.service.pachca_client.client import PachcaClient, get_client
+from app.service.tasks.sla_scheduler import SlaScheduler
+
+WorkerPool = EventWorkerPool | DurableEventWorkers
+
+
+def get_worker_pool(request: Request) -> WorkerPool | None:
+    # Only set when the app runs with ingestion_mode "queue" or "durable", see app.main.lifespan
+    worker_pool: WorkerPool | None = getattr(request.app.state, "worker_pool", None)
+    return worker_pool
+
+
+def get_student_message_writer(request: Request) -> StudentMessageWriter | None:
+    writer: StudentMessageWriter | None = getattr(request.app.state, "student_message_writer", None)
+    return writer
+
+
+def get_sla_scheduler(request: Request) -> SlaScheduler | None:
+    sla_scheduler: SlaScheduler | None = getattr(request.app.state, "sla_scheduler", None)
+    return sla_scheduler
+
+
+def get_deduplicator(request: Request) -> EventDeduplicator | None:
+    deduplicator: EventDeduplicator | None = getattr(request.app.state, "deduplicator", None)
+    return deduplicator
+
+
+class EventIngestion:
+    """Accepts a webhook event: drops duplicates, then either processes it right away or hands it to workers."""
+
+    def __init__(
+        self,
+        config: AppConfig,
+        session: AsyncSession,
+        pachca_client: PachcaClient,
+        worker_pool: WorkerPool | None,
+        deduplicator: EventDeduplicator | None,
+        writer: StudentMessageWriter | None = None,
+        sla_scheduler: SlaScheduler | None = None,
+    ):
+        self.config = config
+        self.session = session
+        self.pachca_client = pachca_client
+        self.worker_pool = worker_pool
+        self.deduplicator = deduplicator
+        self.writer = writer
+        self.sla_scheduler = sla_scheduler
+
+    async def handle(self, kind: str, payload: Payload, response: Response) -> None:
+        await self.handle_batch(kind, [payload], response)
+
+    async def handle_batch(self, kind: str, payloads: Sequence[Payload], response: Response) -> None:
+        """Same as `handle` for every payload in order, but with batched queries."""
+        keyed = [(payload, event_key(kind, payload) if self.deduplicator is not None else None) for payload in payloads]
+        durable = isinstance(self.worker_pool, DurableEventWorkers)
+        claimed: list[str] = []
+        if self.deduplicator is not None:
+            keys = [key for _, key in keyed if key is not None]
+            # a durable event is processed once it is stored, so its key is committed together with the event
+            unclaimed = await self.deduplicator.claim_many(self.session, keys, lease=not durable)
+            if not durable:
+                await self.session.commit()
+            n_duplicates = len(keys) - len(unclaimed)
+            if n_duplicates > 0:
+                logger.info(f"{n_duplicates} duplicate {kind} events are dropped")
+            # Only the first occurrence of a key repeated within the batch is kept
+            unique = []
+            for payload, key in keyed:
+                if key is not None:
+                    if key not in unclaimed:
+                        continue
+                    unclaimed.remove(key)
+                    claimed.append(key)
+                unique.append((payload, key))
+            keyed = unique
+        if len(keyed) == 0:
+            await self.session.commit()
+            return
+        if durable:
+            await enqueue_events(self.session, kind, [payload for payload, _ in keyed])
+            if self.deduplicator is not None:
+                self.deduplicator.remember_many(claimed)
+            response.status_code = status.HTTP_202_ACCEPTED
+            return
+        if isinstance(self.worker_pool, EventWorkerPool):
+            accepted = [
+                (payload, key)
+                for payload, key in keyed
+                if self.worker_pool.submit(QueuedEvent(kind=kind, payload=payload))
+            ]
+            accepted_keys = [key for _, key in accepted if key is not None]
+            await self._complete(accepted_keys)
+            if len(accepted) < len(keyed):
+                # Accepted events are completed, so the whole batch may be posted again
+                await self._release([key for key in claimed if key not in accepted_keys])
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Event queue is full, {len(keyed) - len(accepted)} of {len(keyed)} events are rejected",
+                )
+            response.status_code = status.HTTP_202_ACCEPTED
+            return
+        try:
+            if len(keyed) == 1:
+                await process_event(kind, keyed[0][0], self.config, self.session, self.pachca_client, self.writer)
+            else:
+                await process_event_batch(
+                    kind, [payload for payload, _ in keyed], self.config, self.session, self.pachca_client, self.writer
+                )
+        except Exception:
+            await self._release(claimed)
+            raise
+        if self.sla_scheduler is not None:
+            self.sla_scheduler.observe(kind, [payload for payload, _ in keyed])
+        await self._complete(claimed)
+
+    async def _complete(self, keys: list[str]) -> None:
+        if self.deduplicator is not None and len(keys) > 0:
+            await self.deduplicator.complete_many(self.session, keys)
+
+    async def _release(self, keys: list[str]) -> None:
+        """Drops claims of events which failed, so that their redelivery is processed."""
+        if self.deduplicator is None or len(keys) == 0:
+            return
+        await self.session.rollback()
+        await self.deduplicator.release_many(self.session, keys)
+
+
+def get_ingestion(
+    config: AppConfig = Depends(get_config),
+    session: AsyncSession = Depends(get_session),
+    pachca_client: PachcaClient = Depends(get_client),
+    worker_pool: WorkerPool | None = Depends(get_worker_pool),
+    deduplicator: EventDeduplicator | None = Depends(get_deduplicator),
+    writer: StudentMessageWriter | None = Depends(get_student_message_writer),
+    sla_scheduler: SlaScheduler | None = Depends(get_sla_scheduler),
+) -> EventIngestion:
+    return EventIngestion(
+        config=config,
+        session=session,
+        pachca_client=pachca_client,
+        worker_pool=worker_pool,
+        deduplicator=deduplicator,
+        writer=writer,
+        sla_scheduler=sla_scheduler,
+    )
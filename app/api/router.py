@@ -1,17 +1,33 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any
 
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.api.ingestion import (
+    EventIngestion,
+    WorkerPool,
+    get_deduplicator,
+    get_ingestion,
+    get_sla_scheduler,
+    get_student_message_writer,
+    get_worker_pool,
+)
 from app.api.models import PachcaMessage, PachcaReaction, TicketStatusChange
-from app.config import AppConfig, get_config
-from app.service.event_processing.pachca_events import (
-    process_message,
-    process_reaction,
-    process_subscribe,
-    process_unsubscribe,
+from app.service.event_processing.batch_writer import StudentMessageWriter
+from app.service.event_processing.deduplication import EventDeduplicator
+from app.service.event_processing.events import (
+    EVENT_MESSAGE,
+    EVENT_REACTION,
+    EVENT_SUBSCRIBE,
+    EVENT_TICKET_STATUS_CHANGE,
+    EVENT_UNSUBSCRIBE,
 )
-from app.service.event_processing.tracker_events import process_ticket_status_change
-from app.service.orm.sessionmaker import get_session
+from app.service.orm.engine import pool_stats
+from app.service.orm.routing import SessionRouter
+from app.service.orm.sessionmaker import get_engine, get_replica_engine, get_session_router
 from app.service.pachca_client.client import PachcaClient, get_client
+from app.service.tasks.archival import StudentMessageArchiver
+from app.service.tasks.sla_scheduler import SlaScheduler
 
 router = APIRouter()
 
@@ -19,71 +35,103 @@ router = APIRouter()
 @router.post("/subscribe")
 async def subscribe(
     message: PachcaMessage,
-    config: AppConfig = Depends(get_config),
-    session: AsyncSession = Depends(get_session),
-    pachca_client: PachcaClient = Depends(get_client),
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
 ) -> None:
-    await process_subscribe(
-        message=message,
-        tracker_queue_key=config.tracker_queue_key,
-        session=session,
-        pachca_client=pachca_client,
-    )
+    await ingestion.handle(EVENT_SUBSCRIBE, message, response)
 
 
 @router.post("/unsubscribe")
 async def unsubscribe(
     message: PachcaMessage,
-    config: AppConfig = Depends(get_config),
-    session: AsyncSession = Depends(get_session),
-    pachca_client: PachcaClient = Depends(get_client),
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
 ) -> None:
-    await process_unsubscribe(
-        message=message,
-        tracker_queue_key=config.tracker_queue_key,
-        session=session,
-        pachca_client=pachca_client,
-    )
+    await ingestion.handle(EVENT_UNSUBSCRIBE, message, response)
 
 
 @router.post("/ticket_status_change")
 async def ticket_status_change(
     ticket_event: TicketStatusChange,
-    config: AppConfig = Depends(get_config),
-    session: AsyncSession = Depends(get_session),
-    pachca_client: PachcaClient = Depends(get_client),
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
 ) -> None:
-    await process_ticket_status_change(
-        ticket_event=ticket_event,
-        tracker_status_list=config.tracker_status_list,
-        session=session,
-        pachca_client=pachca_client,
-    )
+    await ingestion.handle(EVENT_TICKET_STATUS_CHANGE, ticket_event, response)
 
 
 @router.post("/message")
 async def message(
     message: PachcaMessage,
-    config: AppConfig = Depends(get_config),
-    session: AsyncSession = Depends(get_session),
-    pachca_client: PachcaClient = Depends(get_client),
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
 ) -> None:
-    await process_message(
-        message=message,
-        config=config,
-        session=session,
-        pachca_client=pachca_client,
-    )
+    await ingestion.handle(EVENT_MESSAGE, message, response)
 
 
 @router.post("/reaction")
 async def reaction(
     reaction: PachcaReaction,
-    session: AsyncSession = Depends(get_session),
-    pachca_client: PachcaClient = Depends(get_client),
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
 ) -> None:
-    await process_reaction(
-        reaction=reaction,
-        session=session,
-        pachca_client=pachca_client,
-    )
+    await ingestion.handle(EVENT_REACTION, reaction, response)
+
+
+@router.post("/ticket_status_change/batch")
+async def ticket_status_change_batch(
+    ticket_events: list[TicketStatusChange],
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
+) -> None:
+    await ingestion.handle_batch(EVENT_TICKET_STATUS_CHANGE, ticket_events, response)
+
+
+@router.post("/message/batch")
+async def message_batch(
+    messages: list[PachcaMessage],
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
+) -> None:
+    await ingestion.handle_batch(EVENT_MESSAGE, messages, response)
+
+
+@router.post("/reaction/batch")
+async def reaction_batch(
+    reactions: list[PachcaReaction],
+    response: Response,
+    ingestion: EventIngestion = Depends(get_ingestion),
+) -> None:
+    await ingestion.handle_batch(EVENT_REACTION, reactions, response)
+
+
+def get_archiver(request: Request) -> StudentMessageArchiver | None:
+    archiver: StudentMessageArchiver | None = getattr(request.app.state, "archiver", None)
+    return archiver
+
+
+@router.get("/stats")
+async def stats(
+    pachca_client: PachcaClient = Depends(get_client),
+    worker_pool: WorkerPool | None = Depends(get_worker_pool),
+    deduplicator: EventDeduplicator | None = Depends(get_deduplicator),
+    writer: StudentMessageWriter | None = Depends(get_student_message_writer),
+    archiver: StudentMessageArchiver | None = Depends(get_archiver),
+    sla_scheduler: SlaScheduler | None = Depends(get_sla_scheduler),
+    engine: AsyncEngine = Depends(get_engine),
+    replica_engine: AsyncEngine | None = Depends(get_replica_engine),
+    session_router: SessionRouter = Depends(get_session_router),
+) -> dict[str, Any]:
+    return {
+        "pachca_pool": pachca_client.pool_stats(),
+        "user_cache": pachca_client.user_cache.stats(),
+        "pachca_outbound": pachca_client.dispatcher.stats(),
+        "pachca_breakers": pachca_client.breaker_stats(),
+        "worker_pool": worker_pool.stats() if worker_pool is not None else None,
+        "deduplication": deduplicator.stats() if deduplicator is not None else None,
+        "student_message_writer": writer.stats() if writer is not None else None,
+        "db_pool": pool_stats(engine),
+        "db_replica_pool": pool_stats(replica_engine) if replica_engine is not None else None,
+        "session_router": session_router.stats(),
+        "archival": archiver.stats() if archiver is not None else None,
+        "sla_scheduler": sla_scheduler.stats() if sla_scheduler is not None else None,
+    }
@@ -1,10 +1,9 @@
 from functools import lru_cache
+from typing import Literal
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
-load_dotenv()
-
 
 class AppConfig(BaseSettings):
     pachca_token: str
@@ -15,8 +14,70 @@ class AppConfig(BaseSettings):
     message_group_time_frame_seconds: int = 1 * 60 * 60  # 1h
     response_sla_seconds: int = 55 * 60  # 55 min
     response_sla_notifications_period_seconds: int = 10 * 60  # 10 min
+    # "queue" and "durable" acknowledge webhooks before processing, "durable" persists them in inbound_event first
+    ingestion_mode: Literal["sync", "queue", "durable"] = "sync"
+    ingestion_queue_size: int = 1000
+    ingestion_workers: int = 8
+    ingestion_shutdown_timeout_seconds: float = 10.0
+    ingestion_batch_size: int = 20
+    ingestion_max_attempts: int = 5
+    ingestion_retry_delay_seconds: float = 30.0
+    ingestion_poll_interval_seconds: float = 0.5
+    ingestion_lease_seconds: float = 5 * 60  # 5 min
+    student_message_batch_enabled: bool = False
+    student_message_batch_window_seconds: float = 0.005  # 5 ms
+    student_message_batch_max_size: int = 100
+    dedup_enabled: bool = True
+    dedup_memory_size: int = 100_000
+    dedup_claim_lease_seconds: float = 5 * 60  # 5 min
+    dedup_retention_seconds: int = 7 * 24 * 60 * 60  # 1 week
+    dedup_prune_period_seconds: int = 60 * 60  # 1h
+    # read-only work, e.g. SLA polling, goes to the replica while it lags less than replica_max_lag_seconds
+    storage_replica_dsn: str | None = None
+    replica_max_lag_seconds: float = 30.0
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 30 * 60  # 30 min
+    db_pool_pre_ping: bool = False  # a round trip per checkout, recycling already drops old connections
+    db_echo: bool = False
+    db_prepared_statement_cache_size: int = 100  # 0 disables the asyncpg cache, e.g. behind pgbouncer
+    db_statement_timeout_ms: int | None = None  # server side timeout of a single statement
+    pachca_pool_limit: int = 100
+    pachca_pool_limit_per_host: int = 0  # 0 means no per host limit
+    pachca_keepalive_timeout_seconds: float = 30.0
+    pachca_dns_cache_ttl_seconds: int = 5 * 60  # 5 min
+    pachca_connect_timeout_seconds: float = 5.0
+    pachca_request_timeout_seconds: float = 30.0
+    pachca_send_rate_per_second: float = 5.0
+    pachca_send_burst: int = 10
+    pachca_send_concurrency: int = 5
+    pachca_send_max_attempts: int = 5
+    pachca_send_retry_base_delay_seconds: float = 0.5
+    pachca_send_retry_max_delay_seconds: float = 30.0
+    pachca_breaker_failure_threshold: int = 5
+    pachca_breaker_recovery_timeout_seconds: float = 30.0
+    pachca_hedge_delay_seconds: float | None = None  # hedging of GET requests is disabled by default
+    telegram_breaker_failure_threshold: int = 3
+    telegram_breaker_recovery_timeout_seconds: float = 60.0
+    outbox_batch_size: int = 100
+    outbox_max_attempts: int = 10
+    outbox_poll_interval_seconds: float = 1.0
+    outbox_lease_seconds: float = 5 * 60  # 5 min
+    archive_enabled: bool = False
+    archive_max_age_seconds: int = 30 * 24 * 60 * 60  # 30 days
+    archive_batch_size: int = 1000
+    archive_period_seconds: int = 60 * 60  # 1h
+    user_cache_max_size: int = 10_000
+    user_cache_ttl_seconds: float = 10 * 60  # 10 min
+    user_cache_negative_ttl_seconds: float = 60  # 1 min
+    user_role_max_age_seconds: int = 24 * 60 * 60  # 1 day
+    warmup_chat_ids: set[int] = set()  # student and expert chats whose members are fetched on startup
+    warmup_concurrency: int = 10
 
 
 @lru_cache
 def get_config() -> AppConfig:
+    # .env is loaded on the first use rather than on import, STORAGE_DSN is read from the environment as well
+    load_dotenv()
     return AppConfig()  # type: ignore
@@ -1,49 +1,223 @@
 import asyncio
+import os
 import traceback
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
+from datetime import datetime
 from typing import AsyncGenerator
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from loguru import logger
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from app.api.router import router
 from app.config import get_config
-from app.service.orm.sessionmaker import sessionmaker
+from app.service.event_processing.batch_writer import StudentMessageWriter
+from app.service.event_processing.deduplication import EventDeduplicator
+from app.service.event_processing.durable_queue import DurableEventWorkers
+from app.service.event_processing.events import Payload, process_event
+from app.service.event_processing.worker_pool import EventWorkerPool, QueuedEvent
+from app.service.orm.engine import create_engine
+from app.service.orm.routing import SessionRouter
+from app.service.pachca_client import PachcaClient
+from app.service.resilience import CircuitOpenError
+from app.service.tasks.archival import StudentMessageArchiver
+from app.service.tasks.cache_warmup import warm_up_user_cache
+from app.service.tasks.outbox import deliver_outbox
 from app.service.tasks.response_sla_notification import notify_about_pending_questions
-from app.service.telegram_client import get_client as get_telegram_client
+from app.service.tasks.sla_scheduler import SlaScheduler
+from app.service.telegram_client import TelegramClient
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    async def periodic_task() -> None:
-        logger.info("Notification poller started")
+    async def check_sla(check_time: datetime) -> int:
+        logger.info(f"Current time is {check_time}")
+        async with session_router.read_session() as session:
+            n_overdue = await notify_about_pending_questions(
+                session=session,
+                telegram_client=telegram_client,
+                config=config,
+                check_time=check_time,
+            )
+        logger.info("Notifications sent successfully")
+        return n_overdue
+
+    async def sla_task(sla_scheduler: SlaScheduler) -> None:
+        try:
+            async with sessionmaker() as session:
+                await sla_scheduler.load(session)
+        except Exception:
+            # groups past their deadline are still found by the first check, later ones once new messages come
+            logger.error(traceback.format_exc())
+        await sla_scheduler.run()
+
+    async def warm_up_task(pachca_client: PachcaClient) -> None:
+        logger.info("Cache warm-up started")
+        try:
+            async with sessionmaker() as session:
+                await warm_up_user_cache(session=session, pachca_client=pachca_client, config=get_config())
+        except Exception:
+            logger.error(traceback.format_exc())
+
+    async def outbox_task(pachca_client: PachcaClient) -> None:
+        logger.info("Outbox sender started")
+        config = get_config()
         while True:
-            check_time = datetime.now(tz=timezone.utc)
-            logger.info(f"Current time is {check_time}")
             try:
-                config = get_config()
-                telegram_client = await anext(get_telegram_client())
                 async with sessionmaker() as session:
-                    await notify_about_pending_questions(
+                    n_delivered = await deliver_outbox(
                         session=session,
-                        telegram_client=telegram_client,
-                        config=config,
-                        check_time=check_time,
+                        pachca_client=pachca_client,
+                        batch_size=config.outbox_batch_size,
+                        max_attempts=config.outbox_max_attempts,
+                        lease_seconds=config.outbox_lease_seconds,
                     )
-                logger.info("Notifications sent successfully")
             except Exception:
                 logger.error(traceback.format_exc())
-                # retry in a short period
-                await asyncio.sleep(10)
-            else:
-                # wait properly
-                await asyncio.sleep(config.response_sla_notifications_period_seconds)
+                n_delivered = 0
+            # keep draining without a pause while there is a backlog
+            if n_delivered < config.outbox_batch_size:
+                await asyncio.sleep(config.outbox_poll_interval_seconds)
+
+    async def dedup_prune_task(deduplicator: EventDeduplicator) -> None:
+        while True:
+            await asyncio.sleep(config.dedup_prune_period_seconds)
+            try:
+                async with sessionmaker() as session:
+                    n_deleted = await deduplicator.prune(session, config.dedup_retention_seconds)
+                logger.info(f"Pruned {n_deleted} processed event keys")
+            except Exception:
+                logger.error(traceback.format_exc())
+
+    async def archival_task(archiver: StudentMessageArchiver) -> None:
+        logger.info("Student message archival started")
+        while True:
+            try:
+                await archiver.run()
+            except Exception:
+                logger.error(traceback.format_exc())
+            await asyncio.sleep(config.archive_period_seconds)
+
+    config = get_config()
+    engine = create_engine(os.environ["STORAGE_DSN"], config)
+    sessionmaker = async_sessionmaker(bind=engine)
+    app.state.engine = engine
+    app.state.sessionmaker = sessionmaker
+    replica_engine = None
+    if config.storage_replica_dsn is not None:
+        replica_engine = create_engine(config.storage_replica_dsn, config)
+        app.state.replica_engine = replica_engine
+    session_router = SessionRouter(
+        primary=sessionmaker,
+        replica=async_sessionmaker(bind=replica_engine) if replica_engine is not None else None,
+        max_lag_seconds=config.replica_max_lag_seconds,
+    )
+    app.state.session_router = session_router
+    # Single telegram client for the app lifetime, so that its circuit breaker state is kept between polls
+    telegram_client = TelegramClient(
+        token=config.telegram_token,
+        breaker_failure_threshold=config.telegram_breaker_failure_threshold,
+        breaker_recovery_timeout_seconds=config.telegram_breaker_recovery_timeout_seconds,
+    )
+    sla_scheduler = SlaScheduler(
+        check=check_sla,
+        response_sla_seconds=config.response_sla_seconds,
+        reminder_period_seconds=config.response_sla_notifications_period_seconds,
+    )
+    app.state.sla_scheduler = sla_scheduler
+    async with PachcaClient.from_config(config) as pachca_client:
+        app.state.pachca_client = pachca_client
+        writer = None
+        if config.student_message_batch_enabled:
+            writer = StudentMessageWriter(
+                sessionmaker=sessionmaker,
+                config=config,
+                flush_interval_seconds=config.student_message_batch_window_seconds,
+                max_batch_size=config.student_message_batch_max_size,
+            )
+            app.state.student_message_writer = writer
+
+        async def handle_event(kind: str, payload: Payload) -> None:
+            async with sessionmaker() as session:
+                await process_event(kind, payload, config, session, pachca_client, writer)
+            sla_scheduler.observe(kind, [payload])
+
+        async def handle_queued_event(event: QueuedEvent) -> None:
+            await handle_event(event.kind, event.payload)
+
+        worker_pool: EventWorkerPool | DurableEventWorkers | None = None
+        if config.ingestion_mode == "queue":
+            worker_pool = EventWorkerPool(
+                handler=handle_queued_event,
+                max_size=config.ingestion_queue_size,
+                n_workers=config.ingestion_workers,
+            )
+        elif config.ingestion_mode == "durable":
+            worker_pool = DurableEventWorkers(
+                sessionmaker=sessionmaker,
+                handler=handle_event,
+                n_workers=config.ingestion_workers,
+                batch_size=config.ingestion_batch_size,
+                max_attempts=config.ingestion_max_attempts,
+                retry_delay_seconds=config.ingestion_retry_delay_seconds,
+                poll_interval_seconds=config.ingestion_poll_interval_seconds,
+                lease_seconds=config.ingestion_lease_seconds,
+            )
+        if worker_pool is not None:
+            worker_pool.start()
+            app.state.worker_pool = worker_pool
+        dedup_prune = None
+        if config.dedup_enabled:
+            app.state.deduplicator = EventDeduplicator(
+                max_size=config.dedup_memory_size,
+                claim_lease_seconds=config.dedup_claim_lease_seconds,
+            )
+            dedup_prune = asyncio.create_task(dedup_prune_task(app.state.deduplicator))
+        archival = None
+        if config.archive_enabled:
+            app.state.archiver = StudentMessageArchiver(
+                sessionmaker=sessionmaker,
+                max_age_seconds=config.archive_max_age_seconds,
+                batch_size=config.archive_batch_size,
+            )
+            archival = asyncio.create_task(archival_task(app.state.archiver))
+        warm_up = asyncio.create_task(warm_up_task(pachca_client))
+        outbox = asyncio.create_task(outbox_task(pachca_client))
+        sla = asyncio.create_task(sla_task(sla_scheduler))
+        yield
+        if isinstance(worker_pool, EventWorkerPool):
+            await worker_pool.stop(timeout_seconds=config.ingestion_shutdown_timeout_seconds)
+        elif isinstance(worker_pool, DurableEventWorkers):
+            await worker_pool.stop()
+        if writer is not None:
+            await writer.close()
+        tasks = [task for task in (sla, outbox, warm_up, dedup_prune, archival) if task is not None]
+        for task in tasks:
+            task.cancel()
+        # cancelled tasks may still be releasing connections and clients they use
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await telegram_client.bot.session.close()
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+
+async def circuit_open_handler(request: Request, exc: CircuitOpenError) -> JSONResponse:
+    # Upstream is known to be down, ask the webhook sender to retry later instead of failing with 500
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after_seconds)))},
+    )
+
 
-    task = asyncio.create_task(periodic_task())
-    yield
-    task.cancel()
+def create_app() -> FastAPI:
+    """Builds the application, config, engine and clients are created on startup in `lifespan`."""
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.add_exception_handler(CircuitOpenError, circuit_open_handler)  # type: ignore[arg-type]
+    return app
 
 
-app = FastAPI(lifespan=lifespan)
-app.include_router(router)
+app = create_app()
@@ -0,0 +1,175 @@
+from datetime import datetime
+from typing import Sequence
+
+from loguru import logger
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage, PachcaReaction, TicketStatusChange
+from app.config import AppConfig
+from app.service.event_processing.batch_writer import StudentMessageWriter
+from app.service.event_processing.events import (
+    EVENT_MESSAGE,
+    EVENT_REACTION,
+    EVENT_TICKET_STATUS_CHANGE,
+    Payload,
+)
+from app.service.event_processing.message_groups import answer_groups
+from app.service.event_processing.pachca_events import (
+    insert_new_student_messages,
+    process_expert_message,
+    process_student_mesage,
+)
+from app.service.event_processing.tracker_events import notify_subscribers
+from app.service.event_processing.user_roles import ROLE_EXPERT, ROLE_STUDENT, get_user_roles
+from app.service.orm import dialect
+from app.service.orm.models import StudentMessage, ThreadTicketSub, UserRole
+from app.service.pachca_client import PachcaClient
+
+
+async def process_message_batch(
+    messages: Sequence[PachcaMessage],
+    config: AppConfig,
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    writer: StudentMessageWriter | None = None,
+) -> None:
+    """Processes messages in the given order, the same way as `process_message` called for each of them.
+
+    Authors are looked up at once, runs of new student messages are inserted with set based SQL,
+    other messages go through the regular handlers.
+    """
+    if writer is not None:
+        await writer.flush(session)
+    user_roles = await get_user_roles(
+        session, pachca_client, [message.user_id for message in messages], config.user_role_max_age_seconds
+    )
+    new_student_messages: list[tuple[PachcaMessage, UserRole]] = []
+    for message in messages:
+        user_role = user_roles.get(message.user_id)
+        if user_role is None:
+            logger.info(f"Message {message.id} is ignored because its author {message.user_id} is not found")
+            continue
+        if user_role.role == ROLE_STUDENT and message.event == "new":
+            new_student_messages.append((message, user_role))
+            continue
+        # Earlier new messages have to be stored before the message which may refer to them
+        await insert_new_student_messages(new_student_messages, config, session)
+        new_student_messages = []
+        if user_role.role == ROLE_STUDENT:
+            await process_student_mesage(message, config, session, user_role)
+        elif user_role.role == ROLE_EXPERT:
+            await process_expert_message(message, config, session, user_role)
+        else:
+            logger.info(f"Message {message.id} is ignored because it is not from student or expert")
+    await insert_new_student_messages(new_student_messages, config, session)
+
+
+async def process_reaction_batch(
+    reactions: Sequence[PachcaReaction],
+    config: AppConfig,
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    writer: StudentMessageWriter | None = None,
+) -> None:
+    """Marks message groups reacted by experts with one SELECT and one UPDATE.
+
+    A group reacted several times in the batch gets the time of the earliest reaction.
+    """
+    reactions = [reaction for reaction in reactions if reaction.event == "new"]
+    if len(reactions) == 0:
+        return
+    user_roles = await get_user_roles(
+        session, pachca_client, [reaction.user_id for reaction in reactions], config.user_role_max_age_seconds
+    )
+    reactions = [
+        reaction
+        for reaction in reactions
+        if reaction.user_id in user_roles and user_roles[reaction.user_id].role == ROLE_EXPERT
+    ]
+    if len(reactions) == 0:
+        return
+    if writer is not None:
+        await writer.flush(session)
+    stmt = (
+        select(StudentMessage.message_id, StudentMessage.message_group_id)
+        .where(~StudentMessage.received_reaction)
+        .where(StudentMessage.message_id.in_({reaction.message_id for reaction in reactions}))
+    )
+    message_groups: dict[int, int] = {row.message_id: row.message_group_id for row in await session.execute(stmt)}
+    reacted_at: dict[int, datetime] = {}
+    for reaction in reactions:
+        message_group_id = message_groups.get(reaction.message_id)
+        if message_group_id is None:
+            logger.info(f"Reacted message {reaction.message_id} was not tracked as pending student message")
+            continue
+        reacted_at[message_group_id] = min(reacted_at.get(message_group_id, reaction.created_at), reaction.created_at)
+    if len(reacted_at) == 0:
+        return
+    stmt_update = (
+        update(StudentMessage)
+        .where(StudentMessage.message_group_id.in_(reacted_at))
+        .where(~StudentMessage.received_reaction)
+        .values(
+            received_reaction=True,
+            received_reaction_at=case(
+                *(
+                    (StudentMessage.message_group_id == message_group_id, dialect.timestamp(at))
+                    for message_group_id, at in reacted_at.items()
+                )
+            ),
+            reaction_message_id=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await answer_groups(session, reacted_at)
+    await session.execute(stmt_update)
+    await session.commit()
+    logger.info(f"Marked {len(reacted_at)} message groups as reacted")
+
+
+async def process_ticket_status_change_batch(
+    ticket_events: Sequence[TicketStatusChange],
+    tracker_status_list: set[str],
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+) -> None:
+    """Notifies subscribers of all tracked status changes, subscriptions are read with one query."""
+    ticket_events = [
+        ticket_event
+        for ticket_event in ticket_events
+        if len(tracker_status_list) == 0 or ticket_event.status in tracker_status_list
+    ]
+    if len(ticket_events) == 0:
+        return
+    stmt = select(ThreadTicketSub).where(
+        ThreadTicketSub.issue_key.in_({ticket_event.issue_key for ticket_event in ticket_events})
+    )
+    subs = (await session.execute(stmt)).scalars().all()
+    await notify_subscribers(
+        [(ticket_event, sub) for ticket_event in ticket_events for sub in subs if sub.issue_key == ticket_event.issue_key],
+        pachca_client,
+    )
+
+
+async def process_event_batch(
+    kind: str,
+    payloads: Sequence[Payload],
+    config: AppConfig,
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    writer: StudentMessageWriter | None = None,
+) -> None:
+    """Batch counterpart of `process_event` for message, reaction and ticket status change events, commits too."""
+    if kind == EVENT_MESSAGE and all(isinstance(payload, PachcaMessage) for payload in payloads):
+        messages = [payload for payload in payloads if isinstance(payload, PachcaMessage)]
+        await process_message_batch(messages, config, session, pachca_client, writer)
+    elif kind == EVENT_REACTION and all(isinstance(payload, PachcaReaction) for payload in payloads):
+        reactions = [payload for payload in payloads if isinstance(payload, PachcaReaction)]
+        await process_reaction_batch(reactions, config, session, pachca_client, writer)
+    elif kind == EVENT_TICKET_STATUS_CHANGE and all(isinstance(payload, TicketStatusChange) for payload in payloads):
+        ticket_events = [payload for payload in payloads if isinstance(payload, TicketStatusChange)]
+        await process_ticket_status_change_batch(ticket_events, config.tracker_status_list, session, pachca_client)
+    else:
+        raise ValueError(f"Unexpected payloads for {kind} event batch")
+    await session.commit()
@@ -0,0 +1,151 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.models import PachcaMessage
+from app.config import AppConfig
+from app.service.event_processing.message_groups import assign_message_groups
+from app.service.orm import dialect
+from app.service.orm.models import StudentMessage, StudentMessageText, UserRole
+
+Row = dict[str, Any]
+
+
+async def insert_student_messages(session: AsyncSession, rows: list[Row], skip_existing: bool = False) -> None:
+    """Inserts student_message rows with multi-row INSERTs, their `text` goes to student_message_text.
+
+    Already stored messages fail the insert unless `skip_existing` is set. Does not commit.
+    """
+    messages = [{column: value for column, value in row.items() if column != "text"} for row in rows]
+    texts = [{"message_id": row["message_id"], "text": row["text"]} for row in rows]
+    if not skip_existing:
+        await session.execute(insert(StudentMessage).values(messages))
+        await session.execute(insert(StudentMessageText).values(texts))
+        return
+    await session.execute(
+        dialect.insert(session, StudentMessage)
+        .values(messages)
+        .on_conflict_do_nothing(index_elements=[StudentMessage.message_id])
+    )
+    await session.execute(
+        dialect.insert(session, StudentMessageText)
+        .values(texts)
+        .on_conflict_do_nothing(index_elements=[StudentMessageText.message_id])
+    )
+
+
+@dataclass
+class _PendingRow:
+    message: PachcaMessage
+    user_role: UserRole
+    future: "asyncio.Future[None]"
+
+
+class StudentMessageWriter:
+    """Accumulates new student messages and inserts them with one multi-row INSERT per flush.
+
+    Message groups are assigned in the same transaction right before the insert, see `assign_message_groups`.
+
+    A flush happens `flush_interval_seconds` after the first row of a batch arrives or as soon as
+    `max_batch_size` rows are collected. Every `write` call returns once its row is committed.
+    Batches are flushed one at a time in the order they were collected, so that a later message
+    never opens a group before an earlier one. The flush takes a connection from the same pool,
+    so `write` and `flush` commit the session of the caller before waiting, which returns its connection.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        config: AppConfig,
+        flush_interval_seconds: float,
+        max_batch_size: int,
+    ):
+        self._sessionmaker = sessionmaker
+        self._config = config
+        self._flush_interval_seconds = flush_interval_seconds
+        self._max_batch_size = max_batch_size
+        self._pending: list[_PendingRow] = []
+        self._timer: asyncio.Task[None] | None = None
+        self._flushes: set[asyncio.Task[None]] = set()
+        # asyncio.Lock wakes up waiters in FIFO order
+        self._flush_lock = asyncio.Lock()
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+
+    async def write(self, message: PachcaMessage, user_role: UserRole, session: AsyncSession | None = None) -> None:
+        if session is not None:
+            await session.commit()
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingRow(message, user_role, future))
+        if len(self._pending) >= self._max_batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        await future
+
+    async def flush(self, session: AsyncSession | None = None) -> None:
+        """Commits everything written so far, including batches which are being flushed right now."""
+        if session is not None:
+            await session.commit()
+        if self._pending:
+            self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._flush_interval_seconds)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush_in_order(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_in_order(self, batch: list[_PendingRow]) -> None:
+        async with self._flush_lock:
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[_PendingRow]) -> None:
+        try:
+            async with self._sessionmaker() as session:
+                rows = await assign_message_groups(session, [(p.message, p.user_role) for p in batch], self._config)
+                await insert_student_messages(session, rows)
+                await session.commit()
+        except Exception as error:
+            if len(batch) == 1:
+                self.failed_rows += 1
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(error)
+                return
+            # one bad row (e.g. a duplicate) must not fail the whole batch, so fall back to row by row inserts
+            logger.warning(f"Batch insert of {len(batch)} student messages failed, inserting one by one")
+            for pending in batch:
+                await self._flush([pending])
+            return
+        self.flushed_batches += 1
+        self.flushed_rows += len(batch)
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_result(None)
+
+    async def close(self) -> None:
+        await self.flush()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "flushed_batches": self.flushed_batches,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+        }
+
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage, PachcaReaction
+from app.service.event_processing.events import Payload
+from app.service.orm import dialect
+from app.service.orm.models import ProcessedEvent
+
+
+def event_key(kind: str, payload: Payload) -> str | None:
+    """Identity of a webhook delivery, None for events which may legitimately repeat."""
+    if isinstance(payload, PachcaMessage):
+        return f"{kind}:{payload.type}:{payload.event}:{payload.id}:{payload.user_id}"
+    if isinstance(payload, PachcaReaction):
+        return f"{kind}:{payload.type}:{payload.event}:{payload.message_id}:{payload.user_id}"
+    # a ticket may be moved to the same status again after being reopened
+    return None
+
+
+class EventDeduplicator:
+    """Drops repeated webhook deliveries using an in-memory LRU of recent keys backed by processed_event table.
+
+    A key is claimed before its event is processed, so concurrent deliveries of the same event are processed once.
+    A claim is leased for `claim_lease_seconds` until the event is completed: if processing fails the claim
+    is released, if the process dies the lease expires, either way a redelivery is processed.
+    Callers which commit the claim in the same transaction as the work skip the lease.
+    """
+
+    def __init__(self, max_size: int, claim_lease_seconds: float = 5 * 60):
+        self._max_size = max_size
+        self._claim_lease_seconds = claim_lease_seconds
+        # keys of completed events only, claims in progress may still be released
+        self._keys: OrderedDict[str, None] = OrderedDict()
+        self.unique = 0
+        self.duplicates_memory = 0
+        self.duplicates_db = 0
+
+    def _remember(self, key: str) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self._max_size:
+            self._keys.popitem(last=False)
+
+    async def claim(self, session: AsyncSession, key: str, lease: bool = True) -> bool:
+        """Returns whether the key is claimed by this call, False for duplicates."""
+        return key in await self.claim_many(session, [key], lease)
+
+    async def claim_many(self, session: AsyncSession, keys: list[str], lease: bool = True) -> set[str]:
+        """Batch version of `claim`, claims all keys missing in memory with a single INSERT, does not commit.
+
+        Returns the claimed keys, a key repeated in `keys` is claimed once. Keys with an expired lease
+        are claimed again. Without `lease` the keys are completed as soon as the caller commits.
+        """
+        known = {key for key in keys if key in self._keys}
+        for key in known:
+            self._keys.move_to_end(key)
+        self.duplicates_memory += len(known)
+        unknown = [key for key in dict.fromkeys(keys) if key not in known]
+        if len(unknown) == 0:
+            return set()
+        now = datetime.now(timezone.utc)
+        claimed_until = now + timedelta(seconds=self._claim_lease_seconds) if lease else None
+        insert_stmt = dialect.insert(session, ProcessedEvent).values(
+            [{"key": key, "claimed_until": claimed_until, "created_at": now} for key in unknown]
+        )
+        stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[ProcessedEvent.key],
+            set_={"claimed_until": insert_stmt.excluded.claimed_until, "created_at": insert_stmt.excluded.created_at},
+            where=ProcessedEvent.claimed_until < dialect.timestamp(now),
+        ).returning(ProcessedEvent.key)
+        claimed = set((await session.execute(stmt)).scalars().all())
+        self.unique += len(claimed)
+        self.duplicates_db += len(unknown) - len(claimed)
+        return claimed
+
+    def remember_many(self, keys: list[str]) -> None:
+        """Keeps keys claimed without a lease in memory once the caller committed them."""
+        for key in keys:
+            self._remember(key)
+
+    async def complete_many(self, session: AsyncSession, keys: list[str]) -> None:
+        """Marks claimed keys as processed, commits."""
+        if len(keys) == 0:
+            return
+        self.remember_many(keys)
+        await session.execute(
+            update(ProcessedEvent).where(ProcessedEvent.key.in_(keys)).values(claimed_until=None)
+        )
+        await session.commit()
+
+    async def release_many(self, session: AsyncSession, keys: list[str]) -> None:
+        """Drops claims of events which were not processed, commits."""
+        if len(keys) == 0:
+            return
+        self.unique -= len(keys)
+        await session.execute(
+            delete(ProcessedEvent).where(ProcessedEvent.key.in_(keys)).where(ProcessedEvent.claimed_until.is_not(None))
+        )
+        await session.commit()
+
+    async def prune(self, session: AsyncSession, retention_seconds: int) -> int:
+        """Deletes keys older than the retention period, returns the number of deleted keys."""
+        threshold = datetime.now(timezone.utc) - timedelta(seconds=retention_seconds)
+        result = await session.execute(delete(ProcessedEvent).where(ProcessedEvent.created_at < threshold))
+        await session.commit()
+        return result.rowcount
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._keys),
+            "unique": self.unique,
+            "duplicates_memory": self.duplicates_memory,
+            "duplicates_db": self.duplicates_db,
+        }
@@ -0,0 +1,158 @@
+import asyncio
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Sequence
+
+from loguru import logger
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.service.event_processing.events import EVENT_PAYLOAD_MODELS, Payload
+from app.service.orm import dialect
+from app.service.orm.models import InboundEvent
+
+STATUS_PENDING = "pending"
+STATUS_DEAD = "dead"
+
+EventHandler = Callable[[str, Payload], Awaitable[None]]
+
+
+async def enqueue_event(session: AsyncSession, kind: str, payload: Payload) -> None:
+    await enqueue_events(session, kind, [payload])
+
+
+async def enqueue_events(session: AsyncSession, kind: str, payloads: Sequence[Payload]) -> None:
+    session.add_all([InboundEvent(kind=kind, payload=payload.model_dump(mode="json")) for payload in payloads])
+    await session.commit()
+
+
+class DurableEventWorkers:
+    """Workers processing webhook events persisted in the inbound_event table.
+
+    Workers lease batches in a short transaction: due rows are picked with FOR UPDATE SKIP LOCKED and their
+    `available_at` is moved `lease_seconds` ahead, so other workers in any number of replicas skip them
+    while they are processed outside of any transaction. Events of a crashed worker become available again
+    when the lease expires, so it has to outlast processing of a batch. Claims count as attempts.
+    Processed events are deleted in a second short transaction, failed ones are retried after a delay
+    and marked dead after `max_attempts`.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        handler: EventHandler,
+        n_workers: int,
+        batch_size: int,
+        max_attempts: int,
+        retry_delay_seconds: float,
+        poll_interval_seconds: float,
+        lease_seconds: float = 5 * 60,
+    ):
+        self._sessionmaker = sessionmaker
+        self._handler = handler
+        self._n_workers = n_workers
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._retry_delay_seconds = retry_delay_seconds
+        self._poll_interval_seconds = poll_interval_seconds
+        self._lease_seconds = lease_seconds
+        self._workers: list[asyncio.Task[None]] = []
+        self.processed = 0
+        self.failed = 0
+        self.dead = 0
+        self.last_lag_seconds = 0.0
+
+    async def process_batch(self, session: AsyncSession) -> int:
+        """Claims and processes one batch of due events, returns the number of claimed events.
+
+        The session is committed after claiming, so no connection is held while the handler runs.
+        """
+        now = datetime.now(timezone.utc)
+        due_ids = (
+            select(InboundEvent.id)
+            .where(InboundEvent.status == STATUS_PENDING)
+            .where(InboundEvent.available_at <= now)
+            .order_by(InboundEvent.id)
+            .limit(self._batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(InboundEvent)
+            .where(InboundEvent.id.in_(due_ids.scalar_subquery()))
+            .values(
+                available_at=now + timedelta(seconds=self._lease_seconds),
+                attempts=InboundEvent.attempts + 1,
+            )
+            .returning(
+                InboundEvent.id,
+                InboundEvent.kind,
+                InboundEvent.payload,
+                InboundEvent.attempts,
+                InboundEvent.created_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        events = sorted((await session.execute(stmt)).all(), key=lambda event: event.id)
+        await session.commit()
+
+        processed_ids = []
+        failed = []
+        for event in events:
+            self.last_lag_seconds = (now - dialect.as_utc(event.created_at)).total_seconds()
+            try:
+                payload = EVENT_PAYLOAD_MODELS[event.kind].model_validate(event.payload)
+                await self._handler(event.kind, payload)
+            except Exception:
+                failed.append((event, traceback.format_exc()))
+            else:
+                processed_ids.append(event.id)
+                self.processed += 1
+
+        if processed_ids:
+            await session.execute(delete(InboundEvent).where(InboundEvent.id.in_(processed_ids)))
+        for event, error in failed:
+            if event.attempts >= self._max_attempts:
+                values: dict[str, Any] = dict(status=STATUS_DEAD, last_error=error)
+                self.dead += 1
+                logger.error(f"Inbound event {event.id} is dead after {event.attempts} attempts")
+            else:
+                available_at = datetime.now(timezone.utc) + timedelta(seconds=self._retry_delay_seconds)
+                values = dict(available_at=available_at, last_error=error)
+                self.failed += 1
+                logger.warning(f"Inbound event {event.id} failed (attempt {event.attempts}), will retry")
+            await session.execute(update(InboundEvent).where(InboundEvent.id == event.id).values(**values))
+        await session.commit()
+        return len(events)
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._n_workers)]
+        logger.info(f"Started {self._n_workers} durable event workers")
+
+    async def stop(self) -> None:
+        # Claimed but unprocessed events are picked up again when their lease expires
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self) -> None:
+        while True:
+            started_at = time.monotonic()
+            try:
+                async with self._sessionmaker() as session:
+                    n_claimed = await self.process_batch(session)
+            except Exception:
+                logger.error(traceback.format_exc())
+                n_claimed = 0
+            if n_claimed < self._batch_size:
+                await asyncio.sleep(max(0.0, self._poll_interval_seconds - (time.monotonic() - started_at)))
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "workers": len(self._workers),
+            "processed": self.processed,
+            "failed": self.failed,
+            "dead": self.dead,
+            "last_lag_seconds": self.last_lag_seconds,
+        }
@@ -0,0 +1,82 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage, PachcaReaction, TicketStatusChange
+from app.config import AppConfig
+from app.service.event_processing.batch_writer import StudentMessageWriter
+from app.service.event_processing.pachca_events import (
+    process_message,
+    process_reaction,
+    process_subscribe,
+    process_unsubscribe,
+)
+from app.service.event_processing.tracker_events import process_ticket_status_change
+from app.service.pachca_client import PachcaClient
+
+EVENT_SUBSCRIBE = "subscribe"
+EVENT_UNSUBSCRIBE = "unsubscribe"
+EVENT_TICKET_STATUS_CHANGE = "ticket_status_change"
+EVENT_MESSAGE = "message"
+EVENT_REACTION = "reaction"
+
+Payload = PachcaMessage | PachcaReaction | TicketStatusChange
+
+EVENT_PAYLOAD_MODELS: dict[str, type[Payload]] = {
+    EVENT_SUBSCRIBE: PachcaMessage,
+    EVENT_UNSUBSCRIBE: PachcaMessage,
+    EVENT_TICKET_STATUS_CHANGE: TicketStatusChange,
+    EVENT_MESSAGE: PachcaMessage,
+    EVENT_REACTION: PachcaReaction,
+}
+
+
+def partition_key(kind: str, payload: Payload) -> str:
+    """Key of the conversation the event belongs to, events with equal keys must be processed in order.
+
+    Messages of everyone in a chat, including its threads, share the key of the chat, so that a student
+    message group is built in the order its messages arrived and an expert reply is never processed
+    before the message it answers. A reaction carries no chat, it is keyed by its message, see
+    `EventWorkerPool.submit` for how it follows the message.
+    """
+    if isinstance(payload, PachcaMessage):
+        chat_id = payload.thread.message_chat_id if payload.thread is not None else payload.chat_id
+        return f"chat:{chat_id}"
+    if isinstance(payload, PachcaReaction):
+        return f"message:{payload.message_id}"
+    return f"ticket:{payload.issue_key}"
+
+
+async def process_event(
+    kind: str,
+    payload: Payload,
+    config: AppConfig,
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    writer: StudentMessageWriter | None = None,
+) -> None:
+    """Runs the handler of a webhook event of the given kind, the same one the webhook route would run.
+
+    The session is committed once the handler returns, so that author roles refreshed by a handler
+    which wrote nothing else are stored too.
+    """
+    if kind == EVENT_SUBSCRIBE and isinstance(payload, PachcaMessage):
+        await process_subscribe(message=payload, tracker_queue_key=config.tracker_queue_key, session=session)
+    elif kind == EVENT_UNSUBSCRIBE and isinstance(payload, PachcaMessage):
+        await process_unsubscribe(message=payload, tracker_queue_key=config.tracker_queue_key, session=session)
+    elif kind == EVENT_TICKET_STATUS_CHANGE and isinstance(payload, TicketStatusChange):
+        await process_ticket_status_change(
+            ticket_event=payload,
+            tracker_status_list=config.tracker_status_list,
+            session=session,
+            pachca_client=pachca_client,
+        )
+    elif kind == EVENT_MESSAGE and isinstance(payload, PachcaMessage):
+        await process_message(
+            message=payload, config=config, session=session, pachca_client=pachca_client, writer=writer
+        )
+    elif kind == EVENT_REACTION and isinstance(payload, PachcaReaction):
+        await process_reaction(
+            reaction=payload, config=config, session=session, pachca_client=pachca_client, writer=writer
+        )
+    else:
+        raise ValueError(f"Unexpected {type(payload).__name__} payload for {kind} event")
+    await session.commit()
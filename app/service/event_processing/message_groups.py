@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import case, delete, func, literal, or_, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage
+from app.config import AppConfig
+from app.service.orm import dialect
+from app.service.orm.models import MESSAGE_GROUP_ID_SEQ, MessageGroup, StudentMessage, UserRole
+
+GROUP_PENDING = "pending"
+GROUP_ANSWERED = "answered"
+
+# namespace of advisory locks serializing group assignment of a student
+_LOCK_MESSAGE_GROUP = 1
+
+Row = dict[str, Any]
+
+# attempts of assign_message_group, another one is only needed when the chosen group is answered concurrently
+_ASSIGN_MAX_ATTEMPTS = 3
+
+
+def new_group(message: PachcaMessage, user_role: UserRole, config: AppConfig) -> Row:
+    """Columns of a group opened by the message, except its id."""
+    return dict(
+        user_id=message.user_id,
+        chat_id=message.chat_id,
+        thread_message_id=message.thread.message_id if message.thread is not None else None,
+        thread_chat_id=message.thread.message_chat_id if message.thread is not None else None,
+        course=user_role.course,
+        first_message_id=message.id,
+        first_sent_at=message.created_at,
+        last_sent_at=message.created_at,
+        deadline=message.created_at + timedelta(seconds=config.response_sla_seconds),
+        status=GROUP_PENDING,
+        answered_at=None,
+        reaction_message_id=None,
+    )
+
+
+async def assign_message_group(
+    session: AsyncSession,
+    message: PachcaMessage,
+    user_role: UserRole,
+    config: AppConfig,
+    thread_root_group_id: int | None = None,
+    lock: bool = True,
+) -> int:
+    """Adds the message to the latest pending group it continues or opens a new one, returns the group id.
+
+    The group is chosen and written with one INSERT ... SELECT: an open group turns it into an update of
+    last_sent_at via ON CONFLICT, otherwise a new group with an id from the sequence is inserted.
+    Assignments of the same student are serialized by a lock, so concurrent messages never open two groups,
+    `lock` is off only when the caller already holds it. The group of the thread root is looked up
+    in student_message unless it is passed in `thread_root_group_id`. Does not commit.
+    """
+    if lock:
+        await dialect.lock(session, _LOCK_MESSAGE_GROUP, message.user_id)
+    time_frame = timedelta(seconds=config.message_group_time_frame_seconds)
+    same_conversation = MessageGroup.chat_id == message.chat_id
+    if thread_root_group_id is not None:
+        same_conversation = or_(same_conversation, MessageGroup.id == thread_root_group_id)
+    elif message.thread is not None:
+        root_group_id = (
+            select(StudentMessage.message_group_id)
+            .where(StudentMessage.message_id == message.thread.message_id)
+            .scalar_subquery()
+        )
+        same_conversation = or_(same_conversation, MessageGroup.id == root_group_id)
+    open_group_id = (
+        select(MessageGroup.id)
+        .where(MessageGroup.status == GROUP_PENDING)
+        .where(MessageGroup.user_id == message.user_id)
+        .where(same_conversation)
+        .where(MessageGroup.last_sent_at >= message.created_at - time_frame)
+        .order_by(MessageGroup.last_sent_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    group = new_group(message, user_role, config)
+    insert_stmt = dialect.insert(session, MessageGroup).from_select(
+        ["id", *group],
+        # SQLite needs a WHERE clause to tell ON CONFLICT from a join constraint
+        select(
+            func.coalesce(open_group_id, dialect.next_id(session, MESSAGE_GROUP_ID_SEQ, MessageGroup.id)),
+            *(literal(value, MessageGroup.__table__.c[column].type) for column, value in group.items()),
+        ).where(true()),
+    )
+    stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[MessageGroup.id],
+        set_={
+            "last_sent_at": case(
+                (insert_stmt.excluded.last_sent_at > MessageGroup.last_sent_at, insert_stmt.excluded.last_sent_at),
+                else_=MessageGroup.last_sent_at,
+            )
+        },
+        # the group may have been answered after it was chosen, the next attempt does not find it anymore
+        where=MessageGroup.status == GROUP_PENDING,
+    ).returning(MessageGroup.id)
+    for _ in range(_ASSIGN_MAX_ATTEMPTS):
+        message_group_id: int | None = (await session.execute(stmt)).scalar_one_or_none()
+        if message_group_id is not None:
+            return message_group_id
+    raise RuntimeError(f"Message group of message {message.id} was not assigned in {_ASSIGN_MAX_ATTEMPTS} attempts")
+
+
+async def assign_message_groups(
+    session: AsyncSession,
+    messages: list[tuple[PachcaMessage, UserRole]],
+    config: AppConfig,
+) -> list[Row]:
+    """`assign_message_group` for new messages in order, returns their student_message rows. Does not commit.
+
+    Locks of all authors are taken up front in the order of user ids, so that concurrent batches
+    do not deadlock. Thread roots from the same batch are not stored yet and are resolved in memory.
+    """
+    for user_id in sorted({message.user_id for message, _ in messages}):
+        await dialect.lock(session, _LOCK_MESSAGE_GROUP, user_id)
+    message_group_ids: dict[int, int] = {}
+    rows = []
+    for message, user_role in messages:
+        root_id = message.thread.message_id if message.thread is not None else None
+        message_group_id = await assign_message_group(
+            session,
+            message,
+            user_role,
+            config,
+            thread_root_group_id=message_group_ids.get(root_id) if root_id is not None else None,
+            lock=False,
+        )
+        message_group_ids[message.id] = message_group_id
+        rows.append(student_message_row(message, message_group_id, user_role))
+    return rows
+
+
+def student_message_row(message: PachcaMessage, message_group_id: int, user_role: UserRole) -> Row:
+    return dict(
+        message_id=message.id,
+        message_group_id=message_group_id,
+        user_id=message.user_id,
+        chat_id=message.chat_id,
+        thread_message_id=message.thread.message_id if message.thread is not None else None,
+        thread_chat_id=message.thread.message_chat_id if message.thread is not None else None,
+        text=message.content,
+        received_reaction=False,
+        sent_at=message.created_at,
+        course=user_role.course,
+    )
+
+
+async def answer_groups(
+    session: AsyncSession,
+    answered_at: dict[int, datetime],
+    reaction_message_id: int | None = None,
+) -> None:
+    """Marks pending groups as answered at the given times, does not commit."""
+    if len(answered_at) == 0:
+        return
+    stmt = (
+        update(MessageGroup)
+        .where(MessageGroup.id.in_(answered_at))
+        .where(MessageGroup.status == GROUP_PENDING)
+        .values(
+            status=GROUP_ANSWERED,
+            answered_at=case(
+                *(
+                    (MessageGroup.id == message_group_id, dialect.timestamp(at))
+                    for message_group_id, at in answered_at.items()
+                )
+            ),
+            reaction_message_id=reaction_message_id,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(stmt)
+
+
+async def refresh_group(session: AsyncSession, message_group_id: int, config: AppConfig) -> None:
+    """Recomputes the group from its remaining messages after a deletion, deletes the group if it is empty."""
+    stmt = (
+        select(StudentMessage.message_id, StudentMessage.sent_at)
+        .where(StudentMessage.message_group_id == message_group_id)
+        .order_by(StudentMessage.sent_at, StudentMessage.message_id)
+        .limit(1)
+    )
+    first = (await session.execute(stmt)).one_or_none()
+    if first is None:
+        await session.execute(delete(MessageGroup).where(MessageGroup.id == message_group_id))
+        return
+    last_sent_at = (
+        select(func.max(StudentMessage.sent_at))
+        .where(StudentMessage.message_group_id == message_group_id)
+        .scalar_subquery()
+    )
+    first_sent_at = dialect.as_utc(first.sent_at)
+    await session.execute(
+        update(MessageGroup)
+        .where(MessageGroup.id == message_group_id)
+        .values(
+            first_message_id=first.message_id,
+            first_sent_at=first_sent_at,
+            last_sent_at=last_sent_at,
+            deadline=first_sent_at + timedelta(seconds=config.response_sla_seconds),
+        )
+        .execution_options(synchronize_session=False)
+    )
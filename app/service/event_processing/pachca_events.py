@@ -1,97 +1,94 @@
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 
 from loguru import logger
-from sqlalchemy import TIMESTAMP, cast, select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
 from app.api.models import PachcaMessage, PachcaReaction
 from app.config import AppConfig
-from app.service.orm.models import StudentMessage, ThreadTicketSub
+from app.service.event_processing.batch_writer import StudentMessageWriter, insert_student_messages
+from app.service.event_processing.message_groups import (
+    answer_groups,
+    assign_message_group,
+    assign_message_groups,
+    refresh_group,
+    student_message_row,
+)
+from app.service.event_processing.user_roles import ROLE_EXPERT, ROLE_STUDENT, get_user_role
+from app.service.orm import dialect
+from app.service.orm.models import OutboxMessage, StudentMessage, StudentMessageText, ThreadTicketSub, UserRole
 from app.service.pachca_client import PachcaClient
-from app.service.pachca_client.models import User
+
+
+def find_issue_keys(content: str, tracker_queue_key: str) -> list[str]:
+    """Distinct issue keys mentioned in the message, in order of appearance."""
+    return list(dict.fromkeys(re.findall(f"{tracker_queue_key}-\\d+", content)))
 
 
 async def process_subscribe(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ) -> None:
-    issue_key = re.findall(f"{tracker_queue_key}-\\d+", message.content)
-    if len(issue_key) == 0:
+    issue_keys = find_issue_keys(message.content, tracker_queue_key)
+    if len(issue_keys) == 0:
         logger.info("No issue key found in {}", message.content)
         return
-    issue_key = issue_key[0]
+    # Only actually inserted rows are returned, so concurrent deliveries of the same command do not race
     stmt = (
-        select(ThreadTicketSub)
-        .where(ThreadTicketSub.issue_key == issue_key)
-        .where(ThreadTicketSub.chat_id == message.chat_id)
-    )
-    result = (await session.execute(stmt)).scalar_one_or_none()
-    if result is None:
-        sub = ThreadTicketSub(
-            issue_key=issue_key,
-            chat_id=message.chat_id,
-            message_id=message.id,
-        )
-        session.add(sub)
-        await pachca_client.send_message(
-            chat_id=message.chat_id,
-            text=f"Я сообщу вам об изменении статуса тикета {issue_key}",
-            parent_message_id=message.id,
-        )
-        await session.commit()
-    else:
-        await pachca_client.send_message(
-            chat_id=message.chat_id,
-            text=f"Тикет {issue_key} уже отслеживается в этом треде",
-            parent_message_id=message.id,
+        dialect.insert(session, ThreadTicketSub)
+        .values(
+            [
+                dict(
+                    issue_key=issue_key,
+                    chat_id=message.chat_id,
+                    message_id=message.id,
+                    created_at=datetime.now(timezone.utc),
+                )
+                for issue_key in issue_keys
+            ]
         )
+        .on_conflict_do_nothing(index_elements=[ThreadTicketSub.issue_key, ThreadTicketSub.chat_id])
+        .returning(ThreadTicketSub.issue_key)
+    )
+    subscribed = set((await session.execute(stmt)).scalars().all())
+    reply = "\n".join(
+        f"Я сообщу вам об изменении статуса тикета {issue_key}"
+        if issue_key in subscribed
+        else f"Тикет {issue_key} уже отслеживается в этом треде"
+        for issue_key in issue_keys
+    )
+    # The reply is delivered by the outbox sender after commit, see app.service.tasks.outbox
+    session.add(OutboxMessage(chat_id=message.chat_id, text=reply, parent_message_id=message.id))
+    await session.commit()
 
 
 async def process_unsubscribe(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ) -> None:
-    issue_key = re.findall(f"{tracker_queue_key}-\\d+", message.content)
-    if len(issue_key) == 0:
+    issue_keys = find_issue_keys(message.content, tracker_queue_key)
+    if len(issue_keys) == 0:
         logger.info("No issue key found in {}", message.content)
         return
-    issue_key = issue_key[0]
     stmt = (
-        select(ThreadTicketSub)
-        .where(ThreadTicketSub.issue_key == issue_key)
+        delete(ThreadTicketSub)
+        .where(ThreadTicketSub.issue_key.in_(issue_keys))
         .where(ThreadTicketSub.chat_id == message.chat_id)
+        .returning(ThreadTicketSub.issue_key)
     )
-    result = (await session.execute(stmt)).scalar_one_or_none()
-    if result is None:
-        await pachca_client.send_message(
-            chat_id=message.chat_id,
-            text=f"Тикет {issue_key} не отслеживался в этом треде",
-            parent_message_id=message.id,
-        )
-    else:
-        await session.delete(result)
-        await pachca_client.send_message(
-            chat_id=message.chat_id,
-            text=f"Тикет {issue_key} больше не отслеживается в этом треде",
-            parent_message_id=message.id,
-        )
-        await session.commit()
-
-
-def user_is_expert(user: User) -> bool:
-    return any(
-        "expert_HardDE" in t or "expert_StartDE" in t or "curator_StartDE" in t or "curator_HardDE" in t
-        for t in user.list_tags
+    unsubscribed = set((await session.execute(stmt)).scalars().all())
+    reply = "\n".join(
+        f"Тикет {issue_key} больше не отслеживается в этом треде"
+        if issue_key in unsubscribed
+        else f"Тикет {issue_key} не отслеживался в этом треде"
+        for issue_key in issue_keys
     )
-
-
-def user_is_student(user: User) -> bool:
-    return any(re.match(r"HardDE_\d+|StartDE_\d+", t) is not None for t in user.list_tags)
+    session.add(OutboxMessage(chat_id=message.chat_id, text=reply, parent_message_id=message.id))
+    await session.commit()
 
 
 async def react_to_message_group(
@@ -99,26 +96,34 @@ async def react_to_message_group(
     student_message: StudentMessage,
     received_reaction_at: datetime,
     reaction_message_id: int | None = None,
-) -> None:
-    stmt = select(StudentMessage).where(StudentMessage.message_group_id == student_message.message_group_id)
-    results = (await session.execute(stmt)).scalars().all()
-    for r in results:
-        r.received_reaction = True
-        r.received_reaction_at = received_reaction_at
-        r.reaction_message_id = reaction_message_id
-        session.add(r)
+) -> list[int]:
+    """Marks the group and all its pending messages as reacted, returns ids of updated messages."""
+    await answer_groups(session, {student_message.message_group_id: received_reaction_at}, reaction_message_id)
+    stmt = (
+        update(StudentMessage)
+        .where(StudentMessage.message_group_id == student_message.message_group_id)
+        .where(~StudentMessage.received_reaction)
+        .values(
+            received_reaction=True,
+            received_reaction_at=received_reaction_at,
+            reaction_message_id=reaction_message_id,
+        )
+        .returning(StudentMessage.message_id)
+    )
+    return list((await session.execute(stmt)).scalars().all())
 
 
 async def process_student_mesage(
     message: PachcaMessage,
     config: AppConfig,
     session: AsyncSession,
-    user: User,
+    user_role: UserRole,
+    writer: StudentMessageWriter | None = None,
 ) -> None:
     if message.event == "new":
-        await process_new_student_message(message, config, session, user)
+        await process_new_student_message(message, config, session, user_role, writer)
     elif message.event == "delete":
-        await process_deleted_student_message(message, config, session, user)
+        await process_deleted_student_message(message, config, session, user_role, writer)
     else:
         logger.info(f"Unprocessed message event: {message.event}")
 
@@ -127,63 +132,62 @@ async def process_new_student_message(
     message: PachcaMessage,
     config: AppConfig,
     session: AsyncSession,
-    user: User,
+    user_role: UserRole,
+    writer: StudentMessageWriter | None = None,
 ) -> None:
-    stmt = (
-        select(StudentMessage)
-        .where(~StudentMessage.received_reaction)
-        .where(StudentMessage.user_id == message.user_id)
-        .where(
-            (StudentMessage.chat_id == message.chat_id)
-            | (StudentMessage.message_id == message.thread.message_id if message.thread is not None else False)
-        )
-        .where(
-            cast(message.created_at, TIMESTAMP(timezone=True))
-            <= StudentMessage.sent_at + timedelta(seconds=config.message_group_time_frame_seconds)
-        )
-    )
-    results = (await session.execute(stmt)).scalars().all()
-    if len(results) == 0:
-        message_group_id = hash((message.user_id, message.chat_id, message.created_at))
-        logger.info(f"Received message {message.id} from new message group: {message_group_id}")
-    else:
-        message_group_id = results[0].message_group_id
-        logger.info(f"Received message {message.id} from existing message group: {message_group_id}")
+    if writer is not None:
+        # the group is assigned when the batch is flushed
+        await writer.write(message, user_role, session)
+        logger.info(f"Received message {message.id}")
+        return
+    message_group_id = await assign_message_group(session, message, user_role, config)
+    await insert_student_messages(session, [student_message_row(message, message_group_id, user_role)])
+    await session.commit()
+    logger.info(f"Received message {message.id} from message group: {message_group_id}")
 
-    course = None
-    if any(re.match(r"HardDE_\d+", tag) for tag in user.list_tags):
-        course = "HardDE"
-    elif any(re.match(r"StartDE_\d+", tag) for tag in user.list_tags):
-        course = "StartDE"
 
-    new_msg = StudentMessage(
-        message_id=message.id,
-        message_group_id=message_group_id,
-        user_id=message.user_id,
-        chat_id=message.chat_id,
-        thread_message_id=message.thread.message_id if message.thread is not None else None,
-        thread_chat_id=message.thread.message_chat_id if message.thread is not None else None,
-        text=message.content,
-        received_reaction=False,
-        sent_at=message.created_at,
-        course=course,
-    )
-    session.add(new_msg)
+async def insert_new_student_messages(
+    messages: list[tuple[PachcaMessage, UserRole]],
+    config: AppConfig,
+    session: AsyncSession,
+) -> None:
+    """Set based `process_new_student_message` for consecutive new messages of students.
+
+    Messages are assigned to groups in order within one transaction and inserted with one multi-row INSERT.
+    Already stored messages are skipped, so batches may be replayed.
+    """
+    stmt = select(StudentMessage.message_id).where(StudentMessage.message_id.in_([m.id for m, _ in messages]))
+    stored = set((await session.execute(stmt)).scalars().all())
+    messages = [(message, user_role) for message, user_role in messages if message.id not in stored]
+    if len(messages) == 0:
+        return
+    rows = await assign_message_groups(session, messages, config)
+    await insert_student_messages(session, rows, skip_existing=True)
     await session.commit()
+    logger.info(f"Inserted {len(rows)} student messages")
 
 
 async def process_deleted_student_message(
     message: PachcaMessage,
     config: AppConfig,
     session: AsyncSession,
-    user: User,
+    user_role: UserRole,
+    writer: StudentMessageWriter | None = None,
 ) -> None:
-    stmt = select(StudentMessage).where(StudentMessage.message_id == message.id)
-    res = (await session.execute(stmt)).scalar_one_or_none()
-    if res is None:
+    if writer is not None:
+        # The deleted message may still be waiting for its insert
+        await writer.flush(session)
+    stmt = (
+        delete(StudentMessage)
+        .where(StudentMessage.message_id == message.id)
+        .returning(StudentMessage.message_group_id)
+    )
+    message_group_id = (await session.execute(stmt)).scalar_one_or_none()
+    if message_group_id is None:
         logger.info(f"Message {message.id} was not tracked")
         return
-    await session.delete(res)
+    await session.execute(delete(StudentMessageText).where(StudentMessageText.message_id == message.id))
+    await refresh_group(session, message_group_id, config)
     await session.commit()
     logger.info(f"Successfuly deleted message {message.id}")
 
@@ -192,12 +196,17 @@ async def process_expert_message(
     message: PachcaMessage,
     config: AppConfig,
     session: AsyncSession,
-    user: User,
+    user_role: UserRole,
+    writer: StudentMessageWriter | None = None,
 ) -> None:
+    if writer is not None:
+        # The student message being answered may still be waiting for its insert
+        await writer.flush(session)
     # Direct reply
     if message.parent_message_id is not None:
         stmt = (
             select(StudentMessage)
+            .options(load_only(StudentMessage.message_id, StudentMessage.message_group_id))
             .where(~StudentMessage.received_reaction)
             .where(StudentMessage.message_id == message.parent_message_id)
         )
@@ -212,6 +221,7 @@ async def process_expert_message(
     elif message.thread is not None:
         stmt = (
             select(StudentMessage)
+            .options(load_only(StudentMessage.message_id, StudentMessage.message_group_id))
             .where(~StudentMessage.received_reaction)
             .where(StudentMessage.message_id == message.thread.message_id)
         )
@@ -227,13 +237,14 @@ async def process_expert_message(
         return
     # If we are here, it means reply to some message from pending message group is received
     # We may mark all messages from that group as reacted to
-    await react_to_message_group(
+    message_ids = await react_to_message_group(
         session=session,
         student_message=result,
         received_reaction_at=message.created_at,
         reaction_message_id=message.id,
     )
     await session.commit()
+    logger.info(f"Message {message.id} answered messages {message_ids}")
 
 
 async def process_message(
@@ -241,30 +252,42 @@ async def process_message(
     config: AppConfig,
     session: AsyncSession,
     pachca_client: PachcaClient,
+    writer: StudentMessageWriter | None = None,
 ) -> None:
-    user = await pachca_client.get_user(message.user_id)
-    if user_is_student(user):
-        await process_student_mesage(message, config, session, user)
-    elif user_is_expert(user):
-        await process_expert_message(message, config, session, user)
+    user_role = await get_user_role(session, pachca_client, message.user_id, config.user_role_max_age_seconds)
+    if user_role is None:
+        logger.info(f"Message {message.id} is ignored because its author {message.user_id} is not found")
+        return
+    if user_role.role == ROLE_STUDENT:
+        await process_student_mesage(message, config, session, user_role, writer)
+    elif user_role.role == ROLE_EXPERT:
+        await process_expert_message(message, config, session, user_role, writer)
     else:
         logger.info(f"Message {message.id} is ignored because it is not from student or expert")
 
 
 async def process_reaction(
     reaction: PachcaReaction,
+    config: AppConfig,
     session: AsyncSession,
     pachca_client: PachcaClient,
+    writer: StudentMessageWriter | None = None,
 ) -> None:
     if reaction.event != "new":
         logger.info("Reaction deletions are skipped")
         return
-    user = await pachca_client.get_user(reaction.user_id)
-    if not user_is_expert(user):
+    user_role = await get_user_role(session, pachca_client, reaction.user_id, config.user_role_max_age_seconds)
+    if user_role is None:
+        logger.info(f"Reaction is ignored because its author {reaction.user_id} is not found")
+        return
+    if user_role.role != ROLE_EXPERT:
         logger.info("Reactions not from experts are skipped")
         return
+    if writer is not None:
+        await writer.flush(session)
     stmt = (
         select(StudentMessage)
+        .options(load_only(StudentMessage.message_id, StudentMessage.message_group_id))
         .where(~StudentMessage.received_reaction)
         .where(StudentMessage.message_id == reaction.message_id)
     )
@@ -272,9 +295,10 @@ async def process_reaction(
     if result is None:
         logger.info(f"Reacted message {reaction.message_id} was not tracked as pending student message")
         return
-    await react_to_message_group(
+    message_ids = await react_to_message_group(
         session=session,
         student_message=result,
         received_reaction_at=reaction.created_at,
     )
     await session.commit()
+    logger.info(f"Reaction to message {reaction.message_id} answered messages {message_ids}")
@@ -9,29 +9,22 @@ from app.service.orm.models import ThreadTicketSub
 from app.service.pachca_client import PachcaClient
 
 
-async def process_ticket_status_change(
-    ticket_event: TicketStatusChange,
-    tracker_status_list: set[str],
-    session: AsyncSession,
+async def notify_subscribers(
+    notifications: list[tuple[TicketStatusChange, ThreadTicketSub]],
     pachca_client: PachcaClient,
 ) -> None:
-    if len(tracker_status_list) > 0 and ticket_event.status not in tracker_status_list:
-        logger.info("Status %s is not tracked", ticket_event.issue_key)
-        return
-    stmt = select(ThreadTicketSub).where(ThreadTicketSub.issue_key == ticket_event.issue_key)
-    result = await session.execute(stmt)
-    tasks = []
-    for sub in result.scalars():
-        tasks.append(
-            asyncio.create_task(
-                pachca_client.send_message(
-                    chat_id=sub.chat_id,
-                    text=f"Тикет {ticket_event.issue_key} был переведён в статус {ticket_event.status}",
-                    parent_message_id=sub.message_id,
-                )
+    # Rate limiting and concurrency are handled by the client dispatcher, so all messages are submitted at once
+    results = await asyncio.gather(
+        *(
+            pachca_client.send_message(
+                chat_id=sub.chat_id,
+                text=f"Тикет {ticket_event.issue_key} был переведён в статус {ticket_event.status}",
+                parent_message_id=sub.message_id,
             )
-        )
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+            for ticket_event, sub in notifications
+        ),
+        return_exceptions=True,
+    )
     n_exceptions = sum(1 if isinstance(r, Exception) else 0 for r in results)
     if n_exceptions > 0:
         logger.warning(
@@ -42,3 +35,17 @@ async def process_ticket_status_change(
         for r in results:
             if isinstance(r, Exception):
                 logger.error(r)
+
+
+async def process_ticket_status_change(
+    ticket_event: TicketStatusChange,
+    tracker_status_list: set[str],
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+) -> None:
+    if len(tracker_status_list) > 0 and ticket_event.status not in tracker_status_list:
+        logger.info("Status %s is not tracked", ticket_event.issue_key)
+        return
+    stmt = select(ThreadTicketSub).where(ThreadTicketSub.issue_key == ticket_event.issue_key)
+    result = await session.execute(stmt)
+    await notify_subscribers([(ticket_event, sub) for sub in result.scalars()], pachca_client)
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.service.orm import dialect
+from app.service.orm.models import UserRole
+from app.service.pachca_client import PachcaClient, UserNotFoundError
+from app.service.pachca_client.models import User
+from app.service.resilience import CircuitOpenError
+
+# Failures of the Pachca lookup under which a stale classification is still better than none
+UPSTREAM_ERRORS = (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError)
+
+ROLE_STUDENT = "student"
+ROLE_EXPERT = "expert"
+ROLE_OTHER = "other"
+
+
+def user_is_expert(user: User) -> bool:
+    return any(
+        "expert_HardDE" in t or "expert_StartDE" in t or "curator_StartDE" in t or "curator_HardDE" in t
+        for t in user.list_tags
+    )
+
+
+def user_is_student(user: User) -> bool:
+    return any(re.match(r"HardDE_\d+|StartDE_\d+", t) is not None for t in user.list_tags)
+
+
+def user_course(user: User) -> str | None:
+    if any(re.match(r"HardDE_\d+", tag) for tag in user.list_tags):
+        return "HardDE"
+    elif any(re.match(r"StartDE_\d+", tag) for tag in user.list_tags):
+        return "StartDE"
+    return None
+
+
+def tags_hash(tags: list[str]) -> str:
+    return hashlib.sha1("\n".join(sorted(tags)).encode()).hexdigest()
+
+
+def classify_user(user: User) -> tuple[str, str | None]:
+    if user_is_student(user):
+        return ROLE_STUDENT, user_course(user)
+    elif user_is_expert(user):
+        return ROLE_EXPERT, None
+    return ROLE_OTHER, None
+
+
+async def save_user_role(
+    session: AsyncSession,
+    user: User,
+    refreshed_at: datetime,
+    current: UserRole | None = None,
+) -> UserRole:
+    """Upserts the classification of the user, does not commit.
+
+    The user is classified again only if the tags changed since the `current` classification.
+    """
+    user_tags_hash = tags_hash(user.list_tags)
+    if current is not None and current.tags_hash == user_tags_hash:
+        role, course = current.role, current.course
+    else:
+        role, course = classify_user(user)
+    user_role = UserRole(
+        user_id=user.id,
+        role=role,
+        course=course,
+        tags_hash=user_tags_hash,
+        refreshed_at=refreshed_at,
+    )
+    stmt = dialect.insert(session, UserRole).values(
+        user_id=user_role.user_id,
+        role=user_role.role,
+        course=user_role.course,
+        tags_hash=user_role.tags_hash,
+        refreshed_at=user_role.refreshed_at,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserRole.user_id],
+        set_={
+            "role": stmt.excluded.role,
+            "course": stmt.excluded.course,
+            "tags_hash": stmt.excluded.tags_hash,
+            "refreshed_at": stmt.excluded.refreshed_at,
+        },
+    )
+    await session.execute(stmt)
+    return user_role
+
+
+async def get_user_role(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    user_id: int,
+    max_age_seconds: int,
+) -> UserRole | None:
+    """Returns persisted classification of the user, refreshing it from Pachca if it is missing or stale.
+
+    Returns None if the user does not exist in Pachca. A stale classification is returned if Pachca can not be
+    reached, the error is raised only if there is none. A refreshed classification is committed by the caller.
+    """
+    now = datetime.now(timezone.utc)
+    user_role = await session.get(UserRole, user_id)
+    if user_role is not None and dialect.as_utc(user_role.refreshed_at) > now - timedelta(seconds=max_age_seconds):
+        return user_role
+    try:
+        user = await pachca_client.get_user(user_id)
+    except UserNotFoundError:
+        return None
+    except UPSTREAM_ERRORS as e:
+        if user_role is None:
+            raise
+        logger.warning(f"Using stale role of user {user_id}, refresh failed: {e!r}")
+        return user_role
+    return await save_user_role(session, user, refreshed_at=now, current=user_role)
+
+
+async def get_user_roles(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    user_ids: list[int],
+    max_age_seconds: int,
+) -> dict[int, UserRole]:
+    """Batch version of `get_user_role`: one query for persisted roles, stale ones are refreshed concurrently.
+
+    Users which do not exist in Pachca are missing in the result, stale roles are kept if Pachca can not be reached.
+    Refreshed classifications are committed by the caller.
+    """
+    now = datetime.now(timezone.utc)
+    user_ids = list(dict.fromkeys(user_ids))
+    stmt = select(UserRole).where(UserRole.user_id.in_(user_ids))
+    user_roles = {user_role.user_id: user_role for user_role in (await session.execute(stmt)).scalars()}
+    # Detached so that roles stay readable after commits of the batch, which expire session objects
+    for user_role in user_roles.values():
+        session.expunge(user_role)
+    stale = [
+        user_id
+        for user_id in user_ids
+        if user_id not in user_roles
+        or dialect.as_utc(user_roles[user_id].refreshed_at) <= now - timedelta(seconds=max_age_seconds)
+    ]
+    users = await asyncio.gather(*(pachca_client.get_user(user_id) for user_id in stale), return_exceptions=True)
+    for user_id, user in zip(stale, users):
+        if isinstance(user, UserNotFoundError):
+            user_roles.pop(user_id, None)
+        elif isinstance(user, UPSTREAM_ERRORS) and user_id in user_roles:
+            logger.warning(f"Using stale role of user {user_id}, refresh failed: {user!r}")
+        elif isinstance(user, BaseException):
+            raise user
+        else:
+            user_roles[user_id] = await save_user_role(session, user, refreshed_at=now, current=user_roles.get(user_id))
+    return user_roles
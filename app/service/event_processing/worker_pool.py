@@ -0,0 +1,114 @@
+import asyncio
+import time
+import traceback
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from app.api.models import PachcaMessage, PachcaReaction
+from app.service.event_processing.events import Payload, partition_key
+
+
+@dataclass
+class QueuedEvent:
+    kind: str
+    payload: Payload
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class EventWorkerPool:
+    """Bounded in-memory queues of webhook events processed by a fixed number of workers.
+
+    Every worker owns a lane, events are put to lanes by their partition key, see `partition_key`,
+    so events of the same conversation are processed one by one in the order they were submitted
+    while different conversations are processed concurrently. A reaction goes to the lane of its message
+    if the message was submitted recently enough to still be queued.
+    Events are lost if the process dies before they are processed.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[QueuedEvent], Awaitable[None]],
+        max_size: int,
+        n_workers: int,
+    ):
+        self._handler = handler
+        self._max_size = max_size
+        lane_size = -(-max_size // n_workers)
+        self._lanes: list[asyncio.Queue[QueuedEvent]] = [asyncio.Queue(maxsize=lane_size) for _ in range(n_workers)]
+        self._workers: list[asyncio.Task[None]] = []
+        # partition keys of the last `max_size` submitted messages, a queued message is always among them
+        self._message_keys: OrderedDict[int, str] = OrderedDict()
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def submit(self, event: QueuedEvent) -> bool:
+        """Enqueues the event without waiting, returns False if the lane of the event is full."""
+        key = partition_key(event.kind, event.payload)
+        if isinstance(event.payload, PachcaReaction):
+            key = self._message_keys.get(event.payload.message_id, key)
+        # crc32 rather than hash() so that lanes do not depend on PYTHONHASHSEED
+        lane = self._lanes[zlib.crc32(key.encode()) % len(self._lanes)]
+        try:
+            lane.put_nowait(event)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        if isinstance(event.payload, PachcaMessage):
+            self._message_keys[event.payload.id] = key
+            self._message_keys.move_to_end(event.payload.id)
+            while len(self._message_keys) > self._max_size:
+                self._message_keys.popitem(last=False)
+        return True
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work(lane)) for lane in self._lanes]
+        logger.info(f"Started {len(self._lanes)} event workers")
+
+    async def stop(self, timeout_seconds: float) -> None:
+        """Gives workers `timeout_seconds` to process what is already queued, then cancels them."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(lane.join() for lane in self._lanes)), timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._depth()} queued events were not processed before shutdown")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self, lane: asyncio.Queue[QueuedEvent]) -> None:
+        while True:
+            event = await lane.get()
+            lag = time.monotonic() - event.enqueued_at
+            self.last_lag_seconds = lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            try:
+                await self._handler(event)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.error(f"Failed to process {event.kind} event: {traceback.format_exc()}")
+            finally:
+                lane.task_done()
+
+    def _depth(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "depth": self._depth(),
+            "max_lane_depth": max(lane.qsize() for lane in self._lanes),
+            "max_size": self._max_size,
+            "workers": len(self._workers),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+        }
@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import TIMESTAMP, BindParameter, ColumnElement, Sequence, Table, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import DeclarativeBase, InstrumentedAttribute
+
+
+def insert(session: AsyncSession, entity: type[DeclarativeBase] | Table) -> postgresql.Insert | sqlite.Insert:
+    """INSERT construct of the session's dialect, so that ON CONFLICT clauses are available."""
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(entity)
+    return sqlite.insert(entity)
+
+
+def as_utc(dttm: datetime) -> datetime:
+    """SQLite does not store timezone, values read from it are naive UTC datetimes."""
+    return dttm if dttm.tzinfo is not None else dttm.replace(tzinfo=timezone.utc)
+
+
+def timestamp(dttm: datetime) -> BindParameter[datetime]:
+    """Bound timestamp with an explicit type, for places where it can not be inferred from a column, e.g. CASE."""
+    return literal(dttm, TIMESTAMP(timezone=True))
+
+
+def next_id(session: AsyncSession, sequence: Sequence, column: InstrumentedAttribute[int]) -> ColumnElement[int]:
+    """Next value of the sequence, SQLite has no sequences and takes the id after the largest one instead."""
+    if session.get_bind().dialect.name == "postgresql":
+        return sequence.next_value()
+    return select(func.coalesce(func.max(column), 0) + 1).scalar_subquery()
+
+
+async def lock(session: AsyncSession, namespace: int, key: int) -> None:
+    """Transaction level advisory lock on Postgres, SQLite serializes writing transactions anyway."""
+    if session.get_bind().dialect.name == "postgresql":
+        await session.execute(select(func.pg_advisory_xact_lock(namespace, key)))
@@ -0,0 +1,87 @@
+import time
+from typing import Any
+
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+from app.config import AppConfig
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool which keeps track of how long checkouts wait for a free connection.
+
+    Time spent opening new connections is tracked separately.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.connects = 0
+        self.connect_seconds_total = 0.0
+        self.connect_seconds_max = 0.0
+        # connect time of records created by checkouts which are still in progress
+        self._connect_seconds: dict[ConnectionPoolEntry, float] = {}
+
+    def _create_connection(self) -> ConnectionPoolEntry:
+        started_at = time.monotonic()
+        record = super()._create_connection()
+        connect_seconds = time.monotonic() - started_at
+        self.connects += 1
+        self.connect_seconds_total += connect_seconds
+        self.connect_seconds_max = max(self.connect_seconds_max, connect_seconds)
+        self._connect_seconds[record] = connect_seconds
+        return record
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started_at = time.monotonic()
+        record = None
+        try:
+            record = super()._do_get()
+            return record
+        finally:
+            connect_seconds = self._connect_seconds.pop(record, 0.0) if record is not None else 0.0
+            wait_seconds = time.monotonic() - started_at - connect_seconds
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+def create_engine(dsn: str, config: AppConfig) -> AsyncEngine:
+    kwargs: dict[str, Any] = {"echo": config.db_echo, "pool_pre_ping": config.db_pool_pre_ping}
+    if make_url(dsn).get_backend_name() == "postgresql":
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout_seconds,
+            pool_recycle=config.db_pool_recycle_seconds,
+            connect_args={
+                "prepared_statement_cache_size": config.db_prepared_statement_cache_size,
+                "server_settings": (
+                    {"statement_timeout": str(config.db_statement_timeout_ms)}
+                    if config.db_statement_timeout_ms is not None
+                    else {}
+                ),
+            },
+        )
+    return create_async_engine(url=dsn, **kwargs)
+
+
+def pool_stats(engine: AsyncEngine) -> dict[str, Any]:
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return {"status": pool.status()}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": pool.checkouts,
+        "wait_seconds_total": pool.wait_seconds_total,
+        "wait_seconds_max": pool.wait_seconds_max,
+        "connects": pool.connects,
+        "connect_seconds_total": pool.connect_seconds_total,
+        "connect_seconds_max": pool.connect_seconds_max,
+    }
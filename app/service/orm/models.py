@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
+from typing import Any
 
-from sqlalchemy import TIMESTAMP, BigInteger
+from sqlalchemy import JSON, TIMESTAMP, BigInteger, Index, Sequence, text
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
 )
@@ -23,8 +24,21 @@ class ThreadTicketSub(Base):
     created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
 
 
+def pending_only() -> dict[str, Any]:
+    """Dialect options making an index partial over messages without reaction."""
+    # SQLite planner matches partial indexes by WHERE terms as they are rendered in queries
+    return {
+        "postgresql_where": text("NOT received_reaction"),
+        "sqlite_where": text("received_reaction = 0"),
+    }
+
+
 class StudentMessage(Base):
     __tablename__ = "student_message"
+    __table_args__ = (
+        # group update of react_to_message_group
+        Index("ix_student_message_pending_message_group_id", "message_group_id", **pending_only()),
+    )
 
     message_id: Mapped[int] = mapped_column(primary_key=True)
     message_group_id: Mapped[int] = mapped_column(BigInteger())
@@ -32,10 +46,116 @@ class StudentMessage(Base):
     chat_id: Mapped[int]
     thread_message_id: Mapped[int | None] = mapped_column(default=None)
     thread_chat_id: Mapped[int | None] = mapped_column(default=None)
-    text: Mapped[str]
     received_reaction: Mapped[bool] = mapped_column(default=False)
     received_reaction_at: Mapped[datetime | None] = mapped_column(default=None)
     reaction_message_id: Mapped[int | None] = mapped_column(default=None)
     sent_at: Mapped[datetime]
     created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
     course: Mapped[str | None] = mapped_column(default=None)
+
+
+class StudentMessageText(Base):
+    """Text of a student message, kept apart so that scans of student_message stay narrow."""
+
+    __tablename__ = "student_message_text"
+
+    message_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    text: Mapped[str]
+
+
+class StudentMessageArchive(Base):
+    """Reacted student messages moved out of student_message by the archival job."""
+
+    __tablename__ = "student_message_archive"
+
+    message_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    message_group_id: Mapped[int] = mapped_column(BigInteger())
+    user_id: Mapped[int]
+    chat_id: Mapped[int]
+    thread_message_id: Mapped[int | None]
+    thread_chat_id: Mapped[int | None]
+    text: Mapped[str]
+    received_reaction: Mapped[bool]
+    received_reaction_at: Mapped[datetime | None]
+    reaction_message_id: Mapped[int | None]
+    sent_at: Mapped[datetime]
+    created_at: Mapped[datetime]
+    course: Mapped[str | None]
+    archived_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+
+
+MESSAGE_GROUP_ID_SEQ = Sequence("message_group_id_seq")
+
+
+class MessageGroup(Base):
+    """Consecutive messages of a student waiting for a reaction of an expert, one row per group."""
+
+    __tablename__ = "message_group"
+    __table_args__ = (
+        # SLA scan of notify_about_pending_questions
+        Index("ix_message_group_status_deadline", "status", "deadline"),
+        # open group lookup of process_new_student_message
+        Index("ix_message_group_user_id_status", "user_id", "status"),
+    )
+
+    # ids come from the sequence, SQLite takes the id after the largest one instead
+    id: Mapped[int] = mapped_column(BigInteger(), MESSAGE_GROUP_ID_SEQ, primary_key=True, autoincrement=False)
+    user_id: Mapped[int]
+    chat_id: Mapped[int]
+    thread_message_id: Mapped[int | None] = mapped_column(default=None)
+    thread_chat_id: Mapped[int | None] = mapped_column(default=None)
+    course: Mapped[str | None] = mapped_column(default=None)
+    first_message_id: Mapped[int]
+    first_sent_at: Mapped[datetime]
+    last_sent_at: Mapped[datetime]
+    deadline: Mapped[datetime]
+    status: Mapped[str] = mapped_column(default="pending")
+    answered_at: Mapped[datetime | None] = mapped_column(default=None)
+    reaction_message_id: Mapped[int | None] = mapped_column(default=None)
+
+
+class UserRole(Base):
+    __tablename__ = "user_role"
+
+    user_id: Mapped[int] = mapped_column(primary_key=True)
+    role: Mapped[str]
+    course: Mapped[str | None] = mapped_column(default=None)
+    tags_hash: Mapped[str]
+    refreshed_at: Mapped[datetime]
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_message"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    chat_id: Mapped[int]
+    text: Mapped[str]
+    parent_message_id: Mapped[int | None] = mapped_column(default=None)
+    attempts: Mapped[int] = mapped_column(default=0)
+    last_error: Mapped[str | None] = mapped_column(default=None)
+    # messages leased by a sender are skipped by others until then
+    locked_until: Mapped[datetime | None] = mapped_column(default=None)
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+
+
+class InboundEvent(Base):
+    __tablename__ = "inbound_event"
+    __table_args__ = (Index("ix_inbound_event_status_available_at", "status", "available_at"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str]
+    payload: Mapped[dict[str, Any]] = mapped_column(JSON())
+    status: Mapped[str] = mapped_column(default="pending")
+    attempts: Mapped[int] = mapped_column(default=0)
+    last_error: Mapped[str | None] = mapped_column(default=None)
+    available_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+
+
+class ProcessedEvent(Base):
+    __tablename__ = "processed_event"
+
+    key: Mapped[str] = mapped_column(primary_key=True)
+    # set while the event is being processed, NULL once it is processed
+    claimed_until: Mapped[datetime | None] = mapped_column(default=None)
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc), index=True)
@@ -0,0 +1,70 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+# Replay lag of a standby, zero when it has replayed everything received from the primary
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+    " END"
+)
+
+
+class SessionRouter:
+    """Sends read-only work to the replica while it is fresh enough, everything else goes to the primary.
+
+    Readers fall back to the primary if there is no replica, it lags more than `max_lag_seconds` or is unavailable.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        replica: async_sessionmaker[AsyncSession] | None = None,
+        max_lag_seconds: float = 30.0,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag_seconds = max_lag_seconds
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.last_lag_seconds: float | None = None
+
+    async def replica_lag_seconds(self, session: AsyncSession) -> float:
+        if session.get_bind().dialect.name != "postgresql":
+            return 0.0
+        return float((await session.execute(REPLICA_LAG_QUERY)).scalar_one())
+
+    async def _replica_is_fresh(self, session: AsyncSession) -> bool:
+        try:
+            self.last_lag_seconds = await self.replica_lag_seconds(session)
+        except Exception as e:
+            logger.warning(f"Replica is unavailable, reading from the primary: {e!r}")
+            return False
+        if self.last_lag_seconds > self.max_lag_seconds:
+            logger.warning(f"Replica lags {self.last_lag_seconds:.1f}s behind, reading from the primary")
+            return False
+        return True
+
+    @asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+        if self.replica is not None:
+            async with self.replica() as session:
+                if await self._replica_is_fresh(session):
+                    self.replica_reads += 1
+                    yield session
+                    return
+        self.primary_reads += 1
+        async with self.primary() as session:
+            yield session
+
+    def stats(self) -> dict[str, int | float | bool | None]:
+        return {
+            "replica_configured": self.replica is not None,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "last_lag_seconds": self.last_lag_seconds,
+        }
@@ -1,23 +1,36 @@
-import os
 from typing import AsyncGenerator
 
-from loguru import logger
+from fastapi import Request
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
-    create_async_engine,
 )
 
-sessionmaker = async_sessionmaker(
-    bind=create_async_engine(url=os.environ["STORAGE_DSN"], echo=True)
-)
-logger.info("Engine created because of the import")
+from app.service.orm.routing import SessionRouter
+
 
+def get_engine(request: Request) -> AsyncEngine:
+    # The engine is created in app.main.lifespan and disposed on shutdown
+    engine: AsyncEngine = request.app.state.engine
+    return engine
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
+
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    sessionmaker: async_sessionmaker[AsyncSession] = request.app.state.sessionmaker
     async with sessionmaker() as session:
         try:
             yield session
         except Exception as e:
             await session.rollback()
             raise e
+
+
+def get_session_router(request: Request) -> SessionRouter:
+    session_router: SessionRouter = request.app.state.session_router
+    return session_router
+
+
+def get_replica_engine(request: Request) -> AsyncEngine | None:
+    engine: AsyncEngine | None = getattr(request.app.state, "replica_engine", None)
+    return engine
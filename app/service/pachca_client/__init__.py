@@ -1,3 +1,3 @@
-from app.service.pachca_client.client import PachcaClient, get_client
+from app.service.pachca_client.client import PachcaClient, UserNotFoundError, get_client
 
-__all__ = ["PachcaClient", "get_client"]
+__all__ = ["PachcaClient", "UserNotFoundError", "get_client"]
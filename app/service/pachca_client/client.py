@@ -1,52 +1,200 @@
-import os
+import asyncio
 from datetime import datetime, timezone
 from types import TracebackType
-from typing import AsyncGenerator, Any
+from typing import Any, AsyncIterator, Sized
 
 import aiohttp
+from fastapi import Request
 from loguru import logger
 
+from app.config import AppConfig
+from app.service.pachca_client.dispatcher import MessageDispatcher
 from app.service.pachca_client.models import Message, User
+from app.service.pachca_client.user_cache import UserCache
+from app.service.resilience import CircuitBreaker, hedge
+
+
+class UserNotFoundError(Exception):
+    def __init__(self, user_id: int):
+        super().__init__(f"Pachca user {user_id} does not exist")
+        self.user_id = user_id
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Errors telling that Pachca itself is unhealthy, as opposed to errors in our requests."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
 
 
 class PachcaClient:
     HOST = "https://api.pachca.com/api/shared/v1"
+    ENDPOINTS = ("/users", "/messages", "/chats")
 
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        pool_limit: int = 100,
+        pool_limit_per_host: int = 0,
+        keepalive_timeout_seconds: float = 30.0,
+        dns_cache_ttl_seconds: int = 300,
+        connect_timeout_seconds: float = 5.0,
+        request_timeout_seconds: float = 30.0,
+        user_cache_max_size: int = 10_000,
+        user_cache_ttl_seconds: float = 10 * 60,
+        user_cache_negative_ttl_seconds: float = 60,
+        send_rate_per_second: float = 5.0,
+        send_burst: int = 10,
+        send_concurrency: int = 5,
+        send_max_attempts: int = 5,
+        send_retry_base_delay_seconds: float = 0.5,
+        send_retry_max_delay_seconds: float = 30.0,
+        breaker_failure_threshold: int = 5,
+        breaker_recovery_timeout_seconds: float = 30.0,
+        hedge_delay_seconds: float | None = None,
+    ):
         self._token = token
+        self._pool_limit = pool_limit
+        self._pool_limit_per_host = pool_limit_per_host
+        self._keepalive_timeout_seconds = keepalive_timeout_seconds
+        self._dns_cache_ttl_seconds = dns_cache_ttl_seconds
+        self._connect_timeout_seconds = connect_timeout_seconds
+        self._request_timeout_seconds = request_timeout_seconds
+        self._connector: aiohttp.TCPConnector | None = None
+        self._hedge_delay_seconds = hedge_delay_seconds
+        self.breakers = {
+            endpoint: CircuitBreaker(
+                name=f"pachca{endpoint}",
+                failure_threshold=breaker_failure_threshold,
+                recovery_timeout_seconds=breaker_recovery_timeout_seconds,
+                is_failure=is_upstream_failure,
+            )
+            for endpoint in self.ENDPOINTS
+        }
+        self.user_cache = UserCache(
+            max_size=user_cache_max_size,
+            ttl_seconds=user_cache_ttl_seconds,
+            negative_ttl_seconds=user_cache_negative_ttl_seconds,
+        )
+        self.dispatcher = MessageDispatcher(
+            send=self._post_message,
+            rate_per_second=send_rate_per_second,
+            burst=send_burst,
+            max_concurrency=send_concurrency,
+            max_attempts=send_max_attempts,
+            retry_base_delay_seconds=send_retry_base_delay_seconds,
+            retry_max_delay_seconds=send_retry_max_delay_seconds,
+        )
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> "PachcaClient":
+        return cls(
+            token=config.pachca_token,
+            pool_limit=config.pachca_pool_limit,
+            pool_limit_per_host=config.pachca_pool_limit_per_host,
+            keepalive_timeout_seconds=config.pachca_keepalive_timeout_seconds,
+            dns_cache_ttl_seconds=config.pachca_dns_cache_ttl_seconds,
+            connect_timeout_seconds=config.pachca_connect_timeout_seconds,
+            request_timeout_seconds=config.pachca_request_timeout_seconds,
+            user_cache_max_size=config.user_cache_max_size,
+            user_cache_ttl_seconds=config.user_cache_ttl_seconds,
+            user_cache_negative_ttl_seconds=config.user_cache_negative_ttl_seconds,
+            send_rate_per_second=config.pachca_send_rate_per_second,
+            send_burst=config.pachca_send_burst,
+            send_concurrency=config.pachca_send_concurrency,
+            send_max_attempts=config.pachca_send_max_attempts,
+            send_retry_base_delay_seconds=config.pachca_send_retry_base_delay_seconds,
+            send_retry_max_delay_seconds=config.pachca_send_retry_max_delay_seconds,
+            breaker_failure_threshold=config.pachca_breaker_failure_threshold,
+            breaker_recovery_timeout_seconds=config.pachca_breaker_recovery_timeout_seconds,
+            hedge_delay_seconds=config.pachca_hedge_delay_seconds,
+        )
 
     def _get_headers(self) -> dict[str, str]:
         return {"Authorization": f"Bearer {self._token}"}
 
-    async def get_messages(
+    def pool_stats(self) -> dict[str, int]:
+        """Snapshot of the underlying connection pool, suitable for monitoring.
+
+        `acquired` and `idle` are reported only while aiohttp keeps the internals they are computed from.
+        """
+        if self._connector is None or self._connector.closed:
+            return {"limit": self._pool_limit, "limit_per_host": self._pool_limit_per_host, "acquired": 0, "idle": 0}
+        stats = {"limit": self._connector.limit, "limit_per_host": self._connector.limit_per_host}
+        # aiohttp has no public usage counters, the internals are read only if this aiohttp version still has them
+        acquired = getattr(self._connector, "_acquired", None)
+        if isinstance(acquired, Sized):
+            stats["acquired"] = len(acquired)
+        conns = getattr(self._connector, "_conns", None)
+        if isinstance(conns, dict):
+            stats["idle"] = sum(len(host_conns) for host_conns in conns.values())
+        return stats
+
+    async def _get(self, path: str, params: dict[str, Any] | None = None, not_found_ok: bool = False) -> Any:
+        """GET with circuit breaking per endpoint and optional hedging, returns None on 404 if `not_found_ok`."""
+
+        async def request() -> Any:
+            async with self._session.get(
+                url=f"{self.HOST}{path}",
+                headers=self._get_headers(),
+                params=params,
+            ) as response:
+                if response.status == 404 and not_found_ok:
+                    return None
+                if response.status != 200:
+                    logger.error(await response.text())
+                    response.raise_for_status()
+                return await response.json()
+
+        breaker = self.breakers["/" + path.split("/")[1]]
+        return await hedge(lambda: breaker.call(request), self._hedge_delay_seconds)
+
+    async def _get_messages_page(self, chat_id: int, page: int, per_page: int) -> list[Message]:
+        raw_messages = await self._get("/messages", params={"chat_id": chat_id, "per": per_page, "page": page})
+        return [Message(**raw_message) for raw_message in raw_messages["data"]]
+
+    async def iter_messages(
         self,
         chat_id: int,
         sent_after: datetime = datetime(1970, 1, 1, tzinfo=timezone.utc),
         per_page: int = 50,
-    ) -> list[Message]:
+        prefetch: bool = False,
+    ) -> AsyncIterator[Message]:
+        """Yields chat messages from newest to oldest until the first one sent before `sent_after`.
+
+        With `prefetch` the next page is requested while the caller processes the current one.
+        """
         page = 1
-        messages = []
-        while True:
-            response = await self._session.get(
-                url=f"{self.HOST}/messages",
-                headers=self._get_headers(),
-                params={"chat_id": chat_id, "per": per_page, "page": page},
-            )
-            if response.status != 200:
-                logger.error(response.content)
-                response.raise_for_status()
-            raw_messages = await response.json()
-            for raw_message in raw_messages["data"]:
-                message = Message(**raw_message)
-                if message.created_at >= sent_after:
-                    messages.append(message)
-                else:
-                    break
-            if len(raw_messages) < per_page:
-                break
-            else:
+        next_page: asyncio.Task[list[Message]] | None = None
+        try:
+            messages = await self._get_messages_page(chat_id, page, per_page)
+            while True:
+                has_next_page = len(messages) >= per_page and messages[-1].created_at >= sent_after
+                if prefetch and has_next_page:
+                    next_page = asyncio.create_task(self._get_messages_page(chat_id, page + 1, per_page))
+                for message in messages:
+                    if message.created_at < sent_after:
+                        return
+                    yield message
+                if not has_next_page:
+                    return
                 page += 1
-        return messages
+                if next_page is not None:
+                    messages = await next_page
+                    next_page = None
+                else:
+                    messages = await self._get_messages_page(chat_id, page, per_page)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def get_messages(
+        self,
+        chat_id: int,
+        sent_after: datetime = datetime(1970, 1, 1, tzinfo=timezone.utc),
+        per_page: int = 50,
+    ) -> list[Message]:
+        return [message async for message in self.iter_messages(chat_id, sent_after, per_page)]
 
     async def send_message(
         self,
@@ -54,7 +202,16 @@ class PachcaClient:
         text: str,
         parent_message_id: int | None,
     ) -> None:
-        body = {
+        # Delivery goes through the dispatcher to respect Pachca rate limits and keep per chat order
+        await self.dispatcher.send(chat_id, text, parent_message_id)
+
+    async def _post_message(
+        self,
+        chat_id: int,
+        text: str,
+        parent_message_id: int | None,
+    ) -> None:
+        body: dict[str, Any] = {
             "message": {
                 "entity_id": chat_id,
                 "content": text,
@@ -62,41 +219,55 @@ class PachcaClient:
         }
         if parent_message_id is not None:
             body["message"]["parent_message_id"] = parent_message_id
-        response = await self._session.post(
-            url=f"{self.HOST}/messages",
-            headers=self._get_headers(),
-            json=body,
-        )
-        if response.status != 200:
-            logger.error(await response.text())
-            response.raise_for_status()
-        else:
-            json = await response.json()
-            logger.info(f"Message {json['data']['id']} successfuly sent")
+
+        async def request() -> None:
+            async with self._session.post(
+                url=f"{self.HOST}/messages",
+                headers=self._get_headers(),
+                json=body,
+            ) as response:
+                if response.status != 200:
+                    logger.error(await response.text())
+                    response.raise_for_status()
+                else:
+                    json = await response.json()
+                    logger.info(f"Message {json['data']['id']} successfuly sent")
+
+        await self.breakers["/messages"].call(request)
 
     async def get_user(self, user_id: int) -> User:
-        response = await self._session.get(
-            url=f"{self.HOST}/users/{user_id}",
-            headers=self._get_headers(),
-        )
-        if response.status != 200:
-            logger.error(response.content)
-            response.raise_for_status()
-        raw_user = await response.json()
+        user = await self.user_cache.get(user_id, self._fetch_user)
+        if user is None:
+            raise UserNotFoundError(user_id)
+        return user
+
+    async def _fetch_user(self, user_id: int) -> User | None:
+        raw_user = await self._get(f"/users/{user_id}", not_found_ok=True)
+        if raw_user is None:
+            logger.warning(f"User {user_id} is not found")
+            return None
         return User(**raw_user["data"])
 
     async def get_chat_info(self, chat_id: int) -> Any:
-        response = await self._session.get(
-            url=f"{self.HOST}/chats/{chat_id}",
-            headers=self._get_headers(),
-        )
-        if response.status != 200:
-            logger.error(response.content)
-            response.raise_for_status()
-        return await response.json()
+        return await self._get(f"/chats/{chat_id}")
+
+    def breaker_stats(self) -> dict[str, dict[str, str | int]]:
+        return {endpoint: breaker.stats() for endpoint, breaker in self.breakers.items()}
 
     async def __aenter__(self) -> "PachcaClient":
-        self._session = aiohttp.ClientSession()
+        self._connector = aiohttp.TCPConnector(
+            limit=self._pool_limit,
+            limit_per_host=self._pool_limit_per_host,
+            keepalive_timeout=self._keepalive_timeout_seconds,
+            ttl_dns_cache=self._dns_cache_ttl_seconds,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(
+                total=self._request_timeout_seconds,
+                connect=self._connect_timeout_seconds,
+            ),
+        )
         return self
 
     async def __aexit__(
@@ -105,9 +276,11 @@ class PachcaClient:
         exc: BaseException | None,
         tb: TracebackType,
     ) -> None:
+        await self.dispatcher.close()
         await self._session.close()
 
 
-async def get_client() -> AsyncGenerator[PachcaClient, None]:
-    async with PachcaClient(token=os.environ["PACHCA_TOKEN"]) as client:
-        yield client
+def get_client(request: Request) -> PachcaClient:
+    # The client and its connection pool live for the whole application lifetime, see app.main.lifespan
+    client: PachcaClient = request.app.state.pachca_client
+    return client
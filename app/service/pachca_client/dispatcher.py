@@ -0,0 +1,185 @@
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable
+
+import aiohttp
+from loguru import logger
+
+from app.service.resilience import CircuitOpenError
+
+SendCallable = Callable[[int, str, int | None], Awaitable[None]]
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self._rate_per_second = rate_per_second
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        # asyncio.Lock wakes waiters in FIFO order, so tokens are handed out fairly
+        self._lock = asyncio.Lock()
+
+    def block_for(self, seconds: float) -> None:
+        """Stops handing out tokens for the given period, e.g. when upstream asked us to back off."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate_per_second)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate_per_second)
+
+
+@dataclass
+class _OutboundMessage:
+    chat_id: int
+    text: str
+    parent_message_id: int | None
+    future: "asyncio.Future[None]"
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class MessageDispatcher:
+    """Delivers outbound messages under a rate limit, keeping messages to one chat in FIFO order.
+
+    Every chat gets its own queue drained by a single worker, while a token bucket and a semaphore
+    bound the request rate and the number of requests in flight across all chats.
+    Failed requests are retried with jittered exponential backoff, honoring Retry-After on 429.
+    """
+
+    def __init__(
+        self,
+        send: SendCallable,
+        rate_per_second: float,
+        burst: int,
+        max_concurrency: int,
+        max_attempts: int,
+        retry_base_delay_seconds: float,
+        retry_max_delay_seconds: float,
+    ):
+        self._send = send
+        self._bucket = TokenBucket(rate_per_second=rate_per_second, capacity=burst)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_attempts = max_attempts
+        self._retry_base_delay_seconds = retry_base_delay_seconds
+        self._retry_max_delay_seconds = retry_max_delay_seconds
+        self._queues: defaultdict[int, deque[_OutboundMessage]] = defaultdict(deque)
+        self._workers: dict[int, asyncio.Task[None]] = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def send(self, chat_id: int, text: str, parent_message_id: int | None) -> None:
+        """Waits until the message is delivered, raises the last error if all attempts failed."""
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._queues[chat_id].append(_OutboundMessage(chat_id, text, parent_message_id, future))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+        await future
+
+    async def _drain(self, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                message = queue[0]
+                # the caller gave up waiting before we started, nobody needs this message anymore
+                if not message.future.cancelled():
+                    try:
+                        await self._deliver(message)
+                    except Exception as e:
+                        if not message.future.done():
+                            message.future.set_exception(e)
+                    else:
+                        if not message.future.done():
+                            message.future.set_result(None)
+                queue.popleft()
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _deliver(self, message: _OutboundMessage) -> None:
+        attempt = 1
+        while True:
+            await self._bucket.acquire()
+            async with self._semaphore:
+                try:
+                    await self._send(message.chat_id, message.text, message.parent_message_id)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None or attempt >= self._max_attempts:
+                        self.failed += 1
+                        raise
+                    logger.warning(f"Attempt {attempt} to send message to chat {message.chat_id} failed: {e!r}")
+                else:
+                    self.sent += 1
+                    return
+            self.retried += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float | None:
+        """Returns how long to wait before the next attempt, or None if the error is not retryable."""
+        backoff = random.uniform(
+            0, min(self._retry_max_delay_seconds, self._retry_base_delay_seconds * 2 ** (attempt - 1))
+        )
+        if isinstance(error, CircuitOpenError):
+            return max(error.retry_after_seconds, backoff)
+        if isinstance(error, aiohttp.ClientResponseError):
+            if error.status == 429:
+                retry_after = _parse_retry_after(error.headers.get("Retry-After") if error.headers else None)
+                if retry_after is None:
+                    return backoff
+                self._bucket.block_for(retry_after)
+                return retry_after
+            if error.status >= 500:
+                return backoff
+            return None
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return backoff
+        return None
+
+    async def close(self) -> None:
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for message in queue:
+                message.future.cancel()
+        self._queues.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "active_chats": len(self._workers),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
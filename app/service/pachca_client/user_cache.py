@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from app.service.pachca_client.models import User
+
+
+class UserCache:
+    """Bounded TTL/LRU cache of Pachca users with single-flight loading.
+
+    ``None`` values are cached as well (for a shorter TTL) to remember users that do not exist.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._negative_ttl_seconds = negative_ttl_seconds
+        self._entries: OrderedDict[int, tuple[float, User | None]] = OrderedDict()
+        self._in_flight: dict[int, asyncio.Task[User | None]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, user_id: int) -> tuple[bool, User | None]:
+        """Returns (found, user) without calling upstream; expired entries are dropped."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, user
+
+    def put(self, user_id: int, user: User | None) -> None:
+        ttl = self._ttl_seconds if user is not None else self._negative_ttl_seconds
+        self._entries[user_id] = (time.monotonic() + ttl, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+    async def get(self, user_id: int, loader: Callable[[int], Awaitable[User | None]]) -> User | None:
+        found, user = self.lookup(user_id)
+        if found:
+            self.hits += 1
+            return user
+        task = self._in_flight.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(loader(user_id))
+            self._in_flight[user_id] = task
+            task.add_done_callback(lambda t: self._on_loaded(user_id, t))
+        # shield so that a cancelled caller does not cancel the load shared with other callers
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, user_id: int, task: "asyncio.Task[User | None]") -> None:
+        self._in_flight.pop(user_id, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(user_id, task.result())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "in_flight": len(self._in_flight),
+        }
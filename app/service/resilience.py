@@ -0,0 +1,121 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after_seconds: float):
+        super().__init__(f"Circuit {name} is open, retry in {retry_after_seconds:.1f}s")
+        self.name = name
+        self.retry_after_seconds = retry_after_seconds
+
+
+class CircuitBreaker:
+    """Fails calls fast after `failure_threshold` consecutive upstream failures.
+
+    After `recovery_timeout_seconds` in the open state up to `half_open_max_calls` probe calls are let through,
+    the circuit closes on a successful probe and opens again on a failed one.
+    Exceptions for which `is_failure` returns False are passed to the caller without affecting the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        recovery_timeout_seconds: float,
+        half_open_max_calls: int = 1,
+        is_failure: Callable[[BaseException], bool] = lambda e: isinstance(e, Exception),
+    ):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout_seconds = recovery_timeout_seconds
+        self._half_open_max_calls = half_open_max_calls
+        self._is_failure = is_failure
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self._recovery_timeout_seconds:
+            self._state = STATE_HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def _before_call(self) -> None:
+        state = self.state
+        if state == STATE_OPEN:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self._opened_at + self._recovery_timeout_seconds - time.monotonic())
+        if state == STATE_HALF_OPEN:
+            if self._half_open_calls >= self._half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._recovery_timeout_seconds)
+            self._half_open_calls += 1
+
+    def _on_success(self) -> None:
+        self._state = STATE_CLOSED
+        self._failures = 0
+
+    def _on_failure(self) -> None:
+        self._failures += 1
+        if self._state == STATE_HALF_OPEN or self._failures >= self._failure_threshold:
+            self._state = STATE_OPEN
+            self._opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self._before_call()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # a cancelled probe (e.g. a lost hedge) tells nothing about upstream health
+            if self._state == STATE_HALF_OPEN:
+                self._half_open_calls -= 1
+            raise
+        except BaseException as e:
+            if self._is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        self._on_success()
+        return result
+
+    def stats(self) -> dict[str, str | int]:
+        return {"state": self.state, "failures": self._failures, "rejected": self.rejected}
+
+
+async def hedge(fn: Callable[[], Awaitable[T]], delay_seconds: float | None) -> T:
+    """Runs `fn` and, if it has not finished in `delay_seconds`, a second copy of it; the first success wins.
+
+    Only suitable for idempotent requests. With `delay_seconds=None` this is a plain call.
+    """
+    if delay_seconds is None:
+        return await fn()
+    tasks: set[asyncio.Future[T]] = {asyncio.ensure_future(fn())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay_seconds)
+        if not done:
+            tasks.add(asyncio.ensure_future(fn()))
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
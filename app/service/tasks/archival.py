@@ -0,0 +1,111 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from loguru import logger
+from sqlalchemy import delete, exists, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.service.event_processing.message_groups import GROUP_ANSWERED
+from app.service.orm import dialect
+from app.service.orm.models import MessageGroup, StudentMessage, StudentMessageArchive, StudentMessageText
+
+
+async def archive_student_messages(session: AsyncSession, older_than: datetime, batch_size: int) -> tuple[int, int]:
+    """Moves one batch of reacted messages sent before `older_than` to student_message_archive.
+
+    Rows are deleted together with their texts and inserted into the archive in one transaction,
+    answered groups left without messages are deleted in it too. Returns the numbers of moved rows and deleted groups.
+    """
+    batch = (
+        select(StudentMessage.message_id)
+        .where(StudentMessage.received_reaction)
+        .where(StudentMessage.sent_at < older_than)
+        .order_by(StudentMessage.message_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        delete(StudentMessage)
+        .where(StudentMessage.message_id.in_(batch.scalar_subquery()))
+        .returning(*StudentMessage.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+    rows = [row._asdict() for row in await session.execute(stmt)]
+    n_groups = 0
+    if len(rows) > 0:
+        text_stmt = (
+            delete(StudentMessageText)
+            .where(StudentMessageText.message_id.in_([row["message_id"] for row in rows]))
+            .returning(StudentMessageText.message_id, StudentMessageText.text)
+        )
+        texts = {row.message_id: row.text for row in await session.execute(text_stmt)}
+        for row in rows:
+            row["text"] = texts.get(row["message_id"], "")
+        # rows of a replayed batch may already be archived
+        await session.execute(
+            dialect.insert(session, StudentMessageArchive)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[StudentMessageArchive.message_id])
+        )
+        group_stmt = (
+            delete(MessageGroup)
+            .where(MessageGroup.id.in_({row["message_group_id"] for row in rows}))
+            .where(MessageGroup.status == GROUP_ANSWERED)
+            .where(~exists().where(StudentMessage.message_group_id == MessageGroup.id))
+            .execution_options(synchronize_session=False)
+        )
+        n_groups = (await session.execute(group_stmt)).rowcount
+    await session.commit()
+    return len(rows), n_groups
+
+
+class StudentMessageArchiver:
+    """Periodically moves old reacted messages and their answered groups out of the live tables in bounded batches."""
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        max_age_seconds: int,
+        batch_size: int,
+    ):
+        self._sessionmaker = sessionmaker
+        self._max_age_seconds = max_age_seconds
+        self._batch_size = batch_size
+        self.runs = 0
+        self.moved_total = 0
+        self.moved_last_run = 0
+        self.groups_deleted_total = 0
+        self.last_run_seconds = 0.0
+
+    async def run(self) -> int:
+        """Archives everything that is old enough batch by batch, returns the number of moved rows."""
+        started_at = time.monotonic()
+        older_than = datetime.now(timezone.utc) - timedelta(seconds=self._max_age_seconds)
+        moved = 0
+        groups_deleted = 0
+        while True:
+            async with self._sessionmaker() as session:
+                n_moved, n_groups = await archive_student_messages(session, older_than, self._batch_size)
+            moved += n_moved
+            groups_deleted += n_groups
+            if n_moved < self._batch_size:
+                break
+        self.runs += 1
+        self.moved_total += moved
+        self.moved_last_run = moved
+        self.groups_deleted_total += groups_deleted
+        self.last_run_seconds = time.monotonic() - started_at
+        logger.info(
+            f"Archived {moved} student messages, deleted {groups_deleted} answered groups "
+            f"in {self.last_run_seconds:.1f}s"
+        )
+        return moved
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "runs": self.runs,
+            "moved_total": self.moved_total,
+            "moved_last_run": self.moved_last_run,
+            "groups_deleted_total": self.groups_deleted_total,
+            "last_run_seconds": self.last_run_seconds,
+        }
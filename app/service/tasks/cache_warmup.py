@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import AppConfig
+from app.service.event_processing.user_roles import save_user_role
+from app.service.orm.models import UserRole
+from app.service.pachca_client import PachcaClient, UserNotFoundError
+from app.service.pachca_client.models import User
+
+
+async def warm_up_user_cache(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    config: AppConfig,
+) -> int:
+    """Pre-populates user cache and user_role table with members of the configured chats.
+
+    Returns the number of users fetched from Pachca.
+    """
+    chat_ids = sorted(config.warmup_chat_ids)
+    semaphore = asyncio.Semaphore(config.warmup_concurrency)
+
+    async def get_chat_members(chat_id: int) -> list[int]:
+        async with semaphore:
+            chat_info = await pachca_client.get_chat_info(chat_id)
+        member_ids: list[int] = chat_info["data"]["member_ids"]
+        logger.info(f"Chat {chat_id} has {len(member_ids)} members")
+        return member_ids
+
+    async def get_user(user_id: int) -> User | None:
+        async with semaphore:
+            try:
+                return await pachca_client.get_user(user_id)
+            except UserNotFoundError:
+                return None
+
+    chat_results = await asyncio.gather(
+        *(get_chat_members(chat_id) for chat_id in chat_ids), return_exceptions=True
+    )
+    member_ids: set[int] = set()
+    for chat_id, chat_result in zip(chat_ids, chat_results):
+        if isinstance(chat_result, BaseException):
+            logger.error(f"Failed to get members of chat {chat_id}: {chat_result}")
+        else:
+            member_ids.update(chat_result)
+    if len(member_ids) == 0:
+        logger.info("No chat members to warm up")
+        return 0
+
+    now = datetime.now(timezone.utc)
+    stmt = (
+        select(UserRole.user_id)
+        .where(UserRole.user_id.in_(member_ids))
+        .where(UserRole.refreshed_at > now - timedelta(seconds=config.user_role_max_age_seconds))
+    )
+    fresh_ids = set((await session.execute(stmt)).scalars().all())
+    stale_ids = sorted(member_ids - fresh_ids)
+    logger.info(f"Warming up {len(stale_ids)} users, {len(fresh_ids)} are already fresh")
+
+    user_results = await asyncio.gather(*(get_user(user_id) for user_id in stale_ids), return_exceptions=True)
+    n_fetched = 0
+    for user_id, user_result in zip(stale_ids, user_results):
+        if isinstance(user_result, BaseException):
+            logger.error(f"Failed to get user {user_id}: {user_result}")
+        elif user_result is not None:
+            await save_user_role(session, user_result, refreshed_at=now)
+            n_fetched += 1
+    await session.commit()
+    logger.info(f"Cache warm-up finished, {n_fetched} users fetched")
+    return n_fetched
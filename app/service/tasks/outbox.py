@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from loguru import logger
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.service.orm.models import OutboxMessage
+from app.service.pachca_client import PachcaClient
+
+
+async def deliver_outbox(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    batch_size: int,
+    max_attempts: int,
+    lease_seconds: float = 5 * 60,
+) -> int:
+    """Sends one batch of pending outbox messages, returns the number of delivered messages.
+
+    Messages are leased for `lease_seconds` and the attempt is counted in a short transaction, then they are
+    sent without holding a transaction, and delivered ones are deleted in another one. A crash between sending
+    and deleting leads to a resend after the lease expires rather than a lost message. Messages which failed
+    `max_attempts` times are kept in the table with their last error for manual inspection.
+    """
+    now = datetime.now(timezone.utc)
+    due_ids = (
+        select(OutboxMessage.id)
+        .where(OutboxMessage.attempts < max_attempts)
+        .where(or_(OutboxMessage.locked_until.is_(None), OutboxMessage.locked_until <= now))
+        .order_by(OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(due_ids.scalar_subquery()))
+        .values(locked_until=now + timedelta(seconds=lease_seconds), attempts=OutboxMessage.attempts + 1)
+        .returning(
+            OutboxMessage.id,
+            OutboxMessage.chat_id,
+            OutboxMessage.text,
+            OutboxMessage.parent_message_id,
+            OutboxMessage.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    messages = sorted((await session.execute(stmt)).all(), key=lambda message: message.id)
+    await session.commit()
+    if len(messages) == 0:
+        return 0
+    # Messages are submitted in id order, the client dispatcher keeps that order within every chat
+    results = await asyncio.gather(
+        *(
+            pachca_client.send_message(
+                chat_id=message.chat_id,
+                text=message.text,
+                parent_message_id=message.parent_message_id,
+            )
+            for message in messages
+        ),
+        return_exceptions=True,
+    )
+    delivered_ids = []
+    for message, result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to deliver outbox message {message.id} (attempt {message.attempts}): {result!r}")
+            # the attempt is already counted, the message is due again with the next batch
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == message.id)
+                .values(last_error=repr(result), locked_until=None)
+            )
+        else:
+            delivered_ids.append(message.id)
+    if delivered_ids:
+        await session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(delivered_ids)))
+    await session.commit()
+    logger.info(f"Outbox batch processed: {len(delivered_ids)} delivered, {len(messages) - len(delivered_ids)} failed")
+    return len(delivered_ids)
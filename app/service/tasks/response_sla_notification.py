@@ -1,5 +1,5 @@
 import asyncio
-from datetime import datetime, time, timedelta, timezone
+from datetime import datetime, time, timezone
 from zoneinfo import ZoneInfo
 
 from loguru import logger
@@ -7,7 +7,8 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import AppConfig
-from app.service.orm.models import StudentMessage
+from app.service.event_processing.message_groups import GROUP_PENDING
+from app.service.orm.models import MessageGroup
 from app.service.telegram_client import TelegramClient
 
 
@@ -16,24 +17,18 @@ async def notify_about_pending_questions(
     telegram_client: TelegramClient,
     config: AppConfig,
     check_time: datetime = datetime.now(tz=timezone.utc),
-) -> None:
+) -> int:
+    """Sends links to pending message groups past their deadline to the shift chat, returns their number."""
     stmt = (
-        select(StudentMessage)
-        .where(~StudentMessage.received_reaction)
-        .where(StudentMessage.sent_at <= check_time - timedelta(seconds=config.response_sla_seconds))
+        select(MessageGroup)
+        .where(MessageGroup.status == GROUP_PENDING)
+        .where(MessageGroup.deadline <= check_time)
+        .order_by(MessageGroup.first_sent_at, MessageGroup.first_message_id)
     )
-    result = (await session.execute(stmt)).scalars().all()
-    if len(result) == 0:
+    groups = (await session.execute(stmt)).scalars().all()
+    if len(groups) == 0:
         logger.info("There are no pending questions with violated SLA.")
-        return
-    groups: dict[int, StudentMessage] = {}
-    for message in result:
-        if message.message_group_id in groups:
-            cur_msg = groups[message.message_group_id]
-            if message.created_at < cur_msg.created_at:
-                groups[message.message_group_id] = message
-        else:
-            groups[message.message_group_id] = message
+        return 0
     logger.info(f"Pending message groups: {len(groups)}")
     tasks = []
     for course in ("HardDE", "StartDE"):
@@ -64,14 +59,15 @@ async def notify_about_pending_questions(
             continue
 
         msg_links = []
-        for msg in sorted(filter(lambda msg: msg.course == course, groups.values()), key=lambda m: m.created_at):
-            if msg.thread_message_id is None:
-                msg_links.append(f"https://app.pachca.com/chats/{msg.chat_id}?message={msg.message_id}")
+        for group in filter(lambda group: group.course == course, groups):
+            if group.thread_message_id is None:
+                msg_links.append(f"https://app.pachca.com/chats/{group.chat_id}?message={group.first_message_id}")
             else:
                 msg_links.append(
-                    f"https://app.pachca.com/chats?thread_message_id={msg.thread_message_id}&sidebar_message={msg.message_id}"
+                    f"https://app.pachca.com/chats?thread_message_id={group.thread_message_id}"
+                    f"&sidebar_message={group.first_message_id}"
                 )
-            logger.info(f"Message {msg.message_id} is added to notification list")
+            logger.info(f"Message {group.first_message_id} is added to notification list")
         if len(msg_links) == 0:
             logger.info(f"No pending messages for {course}")
             continue
@@ -93,3 +89,4 @@ async def notify_about_pending_questions(
             if isinstance(r, Exception):
                 logger.error(r)
         raise RuntimeError("Some errors occured during sending notifications to telegram")
+    return len(groups)
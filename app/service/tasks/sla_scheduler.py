@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Sequence
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage
+from app.service.event_processing.events import EVENT_MESSAGE, Payload
+from app.service.event_processing.message_groups import GROUP_PENDING
+from app.service.orm import dialect
+from app.service.orm.models import MessageGroup
+
+# Runs the SLA check at the given time, returns the number of pending groups past their deadline
+SlaCheck = Callable[[datetime], Awaitable[int]]
+
+
+class SlaScheduler:
+    """Runs the SLA check when the nearest deadline of a pending message group comes instead of polling.
+
+    Deadlines are loaded from message_group on start and pushed by new student messages afterwards.
+    A message either opens a group with exactly this deadline or joins a group whose deadline is already known.
+    Answered groups are dropped lazily, when their deadline comes and the check finds nothing to report.
+    While reported groups stay pending, the check is repeated every `reminder_period_seconds`.
+    """
+
+    def __init__(
+        self,
+        check: SlaCheck,
+        response_sla_seconds: int,
+        reminder_period_seconds: float,
+        retry_delay_seconds: float = 10.0,
+    ):
+        self._check = check
+        self._response_sla = timedelta(seconds=response_sla_seconds)
+        self._reminder_period = timedelta(seconds=reminder_period_seconds)
+        self._retry_delay = timedelta(seconds=retry_delay_seconds)
+        self._deadlines: list[datetime] = []
+        self._changed = asyncio.Event()
+        # the first check runs right away and reports what was missed while the app was down
+        self._recheck_at: datetime | None = datetime.now(timezone.utc)
+        self.checks = 0
+        self.last_check_delay_seconds = 0.0
+
+    async def load(self, session: AsyncSession) -> None:
+        """Adds deadlines of pending groups to the heap.
+
+        Deadlines pushed by messages processed while the query runs are kept, a duplicate only costs an extra check.
+        """
+        stmt = select(MessageGroup.deadline).where(MessageGroup.status == GROUP_PENDING)
+        deadlines = [dialect.as_utc(deadline) for deadline in (await session.execute(stmt)).scalars()]
+        self._deadlines.extend(deadlines)
+        heapq.heapify(self._deadlines)
+        self._changed.set()
+        logger.info(f"Loaded {len(deadlines)} deadlines of pending message groups")
+
+    def add(self, deadline: datetime) -> None:
+        heapq.heappush(self._deadlines, deadline)
+        if self._deadlines[0] == deadline:
+            # the nearest deadline moved, the sleeping loop has to recompute its timeout
+            self._changed.set()
+
+    def observe(self, kind: str, payloads: Sequence[Payload]) -> None:
+        """Pushes deadlines of processed new messages, the check itself tells student messages from others."""
+        if kind != EVENT_MESSAGE:
+            return
+        for payload in payloads:
+            if isinstance(payload, PachcaMessage) and payload.event == "new":
+                self.add(payload.created_at + self._response_sla)
+
+    def _next_wake_up(self) -> datetime | None:
+        candidates = [at for at in (self._deadlines[0] if self._deadlines else None, self._recheck_at) if at]
+        return min(candidates, default=None)
+
+    async def run(self) -> None:
+        logger.info("SLA scheduler started")
+        while True:
+            now = datetime.now(timezone.utc)
+            wake_up_at = self._next_wake_up()
+            if wake_up_at is not None and wake_up_at <= now:
+                while self._deadlines and self._deadlines[0] <= now:
+                    heapq.heappop(self._deadlines)
+                self._recheck_at = None
+                self.checks += 1
+                self.last_check_delay_seconds = (now - wake_up_at).total_seconds()
+                try:
+                    n_overdue = await self._check(now)
+                except Exception:
+                    logger.error(traceback.format_exc())
+                    self._recheck_at = now + self._retry_delay
+                else:
+                    if n_overdue > 0:
+                        self._recheck_at = now + self._reminder_period
+                continue
+            self._changed.clear()
+            timeout = (wake_up_at - now).total_seconds() if wake_up_at is not None else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict[str, int | float | str | None]:
+        next_wake_up = self._next_wake_up()
+        return {
+            "deadlines": len(self._deadlines),
+            "next_wake_up": next_wake_up.isoformat() if next_wake_up is not None else None,
+            "checks": self.checks,
+            "last_check_delay_seconds": self.last_check_delay_seconds,
+        }
@@ -1,15 +1,39 @@
+import asyncio
 import os
 from typing import AsyncGenerator
 
-from aiogram import Bot
+from app.service.resilience import CircuitBreaker
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    # aiogram is heavy to import, it is loaded only once the client is used
+    from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+    return isinstance(error, (TelegramNetworkError, TelegramServerError, TelegramRetryAfter, asyncio.TimeoutError))
 
 
 class TelegramClient:
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        breaker_failure_threshold: int = 3,
+        breaker_recovery_timeout_seconds: float = 60.0,
+    ):
+        from aiogram import Bot
+
         self.bot = Bot(token=token)
+        self.breaker = CircuitBreaker(
+            name="telegram/send_message",
+            failure_threshold=breaker_failure_threshold,
+            recovery_timeout_seconds=breaker_recovery_timeout_seconds,
+            is_failure=is_upstream_failure,
+        )
 
     async def send_message(self, chat_id: int, message: str) -> None:
-        await self.bot.send_message(chat_id=chat_id, text=message)
+        async def request() -> None:
+            await self.bot.send_message(chat_id=chat_id, text=message)
+
+        await self.breaker.call(request)
 
 
 async def get_client() -> AsyncGenerator[TelegramClient, None]:
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage, PachcaReaction
+from app.config import AppConfig
+from app.service.orm.models import MessageGroup, StudentMessage
+from app.service.pachca_client.models import User as PachcaUser
+
+
+def pachca_message_factory(
+    id=1,
+    type="message",
+    event="new",
+    entity_type="discussion",
+    entity_id=1,
+    content="default_content",
+    user_id=1,
+    created_at=datetime.now(timezone.utc),
+    chat_id=1,
+    parent_message_id=None,
+    thread=None,
+) -> PachcaMessage:
+    return PachcaMessage(
+        type=type,
+        id=id,
+        event=event,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        content=content,
+        user_id=user_id,
+        created_at=created_at,
+        chat_id=chat_id,
+        parent_message_id=parent_message_id,
+        thread=thread,
+    )
+
+
+def pachca_user_factory(
+    id=1,
+    first_name="default_first_name",
+    last_name="default_last_name",
+    nickname="default_nickname",
+    email="default_email",
+    phone_number="default_phone_number",
+    department="default_department",
+    title="default_title",
+    role="default_role",
+    suspended=False,
+    invite_status="default_invite_status",
+    list_tags=("tag1",),
+    bot=False,
+    created_at=datetime.now(timezone.utc).isoformat(),
+    last_activity_at=datetime.now(timezone.utc).isoformat(),
+    time_zone="MSK",
+    image_url="default_image_url",
+) -> PachcaUser:
+    return PachcaUser(
+        id=id,
+        first_name=first_name,
+        last_name=last_name,
+        nickname=nickname,
+        email=email,
+        phone_number=phone_number,
+        department=department,
+        title=title,
+        role=role,
+        suspended=suspended,
+        invite_status=invite_status,
+        list_tags=list_tags,
+        bot=bot,
+        created_at=created_at,
+        last_activity_at=last_activity_at,
+        time_zone=time_zone,
+        image_url=image_url,
+    )
+
+
+def pachca_reaction_factory(
+    type="reaction",
+    event="new",
+    message_id=1,
+    code="default_code",
+    user_id=1,
+    created_at=datetime.now(timezone.utc),
+    webhook_timestamp=datetime.now(timezone.utc),
+) -> PachcaReaction:
+    return PachcaReaction(
+        type=type,
+        event=event,
+        message_id=message_id,
+        code=code,
+        user_id=user_id,
+        created_at=created_at,
+        webhook_timestamp=webhook_timestamp,
+    )
+
+
+async def add_message_groups(session: AsyncSession, config: AppConfig) -> None:
+    """Commits added student messages together with rows of their message groups."""
+    messages = sorted(
+        (obj for obj in session.new if isinstance(obj, StudentMessage)),
+        key=lambda m: (m.sent_at, m.message_id),
+    )
+    groups: dict[int, MessageGroup] = {}
+    for m in messages:
+        if m.message_group_id in groups:
+            groups[m.message_group_id].last_sent_at = m.sent_at
+            continue
+        groups[m.message_group_id] = MessageGroup(
+            id=m.message_group_id,
+            user_id=m.user_id,
+            chat_id=m.chat_id,
+            thread_message_id=m.thread_message_id,
+            thread_chat_id=m.thread_chat_id,
+            course=m.course,
+            first_message_id=m.message_id,
+            first_sent_at=m.sent_at,
+            last_sent_at=m.sent_at,
+            deadline=m.sent_at + timedelta(seconds=config.response_sla_seconds),
+            status="answered" if m.received_reaction else "pending",
+        )
+    session.add_all(groups.values())
+    await session.commit()
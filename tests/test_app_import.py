@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Records what the import does instead of timing it, timings are too noisy on shared CI runners
+SCRIPT = """
+import json, socket, sys
+import aiohttp
+import sqlalchemy
+import sqlalchemy.ext.asyncio
+
+calls = []
+
+def record(name, original):
+    def wrapper(*args, **kwargs):
+        calls.append(name)
+        return original(*args, **kwargs)
+    return wrapper
+
+sqlalchemy.create_engine = record("create_engine", sqlalchemy.create_engine)
+sqlalchemy.ext.asyncio.create_async_engine = record("create_async_engine", sqlalchemy.ext.asyncio.create_async_engine)
+aiohttp.ClientSession.__init__ = record("ClientSession", aiohttp.ClientSession.__init__)
+aiohttp.TCPConnector.__init__ = record("TCPConnector", aiohttp.TCPConnector.__init__)
+socket.socket.connect = record("connect", socket.socket.connect)
+socket.getaddrinfo = record("getaddrinfo", socket.getaddrinfo)
+
+import app.main
+print(json.dumps({
+    "calls": calls,
+    "state": sorted(vars(app.main.app.state)["_state"]),
+    "modules": [name for name in ("aiogram", "asyncpg", "aiosqlite") if name in sys.modules],
+}))
+"""
+
+
+def test_app_import_is_side_effect_free():
+    # no STORAGE_DSN and tokens: config and engine must not be touched on import
+    env = {key: value for key, value in os.environ.items() if key in ("PATH", "HOME", "PYTHONPATH")}
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=Path(__file__).parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(result.stdout.splitlines()[-1])
+    # no engine, HTTP client or connection is created before the lifespan starts
+    assert report["calls"] == []
+    assert report["state"] == []
+    # drivers and the bot framework are imported lazily
+    assert report["modules"] == []
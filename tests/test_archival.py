@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import AppConfig
+from app.service.orm.models import MessageGroup, StudentMessage, StudentMessageArchive, StudentMessageText
+from app.service.tasks.archival import StudentMessageArchiver
+from tests.factories import add_message_groups
+
+
+@pytest.mark.asyncio
+async def test_archiver_moves_old_reacted_messages(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=2)
+    for message_id, message_group_id, received_reaction, sent_at in (
+        (1, 1, True, old),
+        (2, 1, True, old),
+        (3, 3, True, old),
+        # still waiting for a reaction
+        (4, 4, False, old),
+        # reacted, but too recent, so its group stays
+        (5, 3, True, now),
+    ):
+        session.add(
+            StudentMessage(
+                message_id=message_id,
+                message_group_id=message_group_id,
+                user_id=1,
+                chat_id=1,
+                received_reaction=received_reaction,
+                sent_at=sent_at,
+            )
+        )
+        session.add(StudentMessageText(message_id=message_id, text=f"text {message_id}"))
+    await add_message_groups(session, app_config)
+
+    archiver = StudentMessageArchiver(sessionmaker, max_age_seconds=24 * 60 * 60, batch_size=2)
+    assert await archiver.run() == 3
+    assert await archiver.run() == 0
+    assert archiver.stats()["moved_total"] == 3
+    assert archiver.stats()["moved_last_run"] == 0
+    assert archiver.stats()["groups_deleted_total"] == 1
+
+    session.expunge_all()
+    live = (await session.execute(select(StudentMessage.message_id).order_by(StudentMessage.message_id))).scalars()
+    assert list(live) == [4, 5]
+    archived = (
+        await session.execute(select(StudentMessageArchive).order_by(StudentMessageArchive.message_id))
+    ).scalars().all()
+    assert [a.message_id for a in archived] == [1, 2, 3]
+    assert archived[0].text == "text 1"
+    assert archived[0].received_reaction
+    texts = (await session.execute(select(StudentMessageText.message_id))).scalars()
+    assert sorted(texts) == [4, 5]
+    groups = (await session.execute(select(MessageGroup.id).order_by(MessageGroup.id))).scalars()
+    assert list(groups) == [3, 4]
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage, TicketStatusChange
+from app.config import AppConfig
+from app.service.event_processing.batch_events import (
+    process_event_batch,
+    process_message_batch,
+    process_reaction_batch,
+    process_ticket_status_change_batch,
+)
+from app.service.event_processing.events import EVENT_MESSAGE, EVENT_REACTION
+from app.service.event_processing.user_roles import get_user_roles
+from app.service.orm.models import StudentMessage, ThreadTicketSub
+from app.service.pachca_client import PachcaClient, UserNotFoundError
+from tests.factories import pachca_message_factory, pachca_reaction_factory, pachca_user_factory
+
+STUDENT_ID = 1
+OTHER_STUDENT_ID = 2
+EXPERT_ID = 3
+USERS = {
+    STUDENT_ID: pachca_user_factory(id=STUDENT_ID, list_tags=("StartDE_1",)),
+    OTHER_STUDENT_ID: pachca_user_factory(id=OTHER_STUDENT_ID, list_tags=("HardDE_1",)),
+    EXPERT_ID: pachca_user_factory(id=EXPERT_ID, list_tags=("expert_StartDE",)),
+}
+
+
+async def get_user(user_id: int):
+    if user_id not in USERS:
+        raise UserNotFoundError(user_id)
+    return USERS[user_id]
+
+
+async def stored_messages(session: AsyncSession) -> dict[int, StudentMessage]:
+    result = (await session.execute(select(StudentMessage))).scalars().all()
+    return {r.message_id: r for r in result}
+
+
+@pytest.mark.asyncio
+async def test_get_user_roles(session: AsyncSession, pachca_client: PachcaClient):
+    with patch("app.service.pachca_client.PachcaClient.get_user", side_effect=get_user) as mocked_get_user:
+        user_roles = await get_user_roles(session, pachca_client, [STUDENT_ID, EXPERT_ID, STUDENT_ID, 404], 60)
+        assert {user_id: r.role for user_id, r in user_roles.items()} == {STUDENT_ID: "student", EXPERT_ID: "expert"}
+        assert mocked_get_user.await_count == 3
+        user_roles = await get_user_roles(session, pachca_client, [STUDENT_ID, EXPERT_ID], 60)
+        assert user_roles[STUDENT_ID].course == "StartDE"
+        assert mocked_get_user.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_process_message_batch(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    now = datetime.now(timezone.utc)
+    messages = [
+        pachca_message_factory(id=1, user_id=STUDENT_ID, chat_id=1, created_at=now),
+        pachca_message_factory(id=2, user_id=OTHER_STUDENT_ID, chat_id=1, created_at=now + timedelta(seconds=1)),
+        pachca_message_factory(id=3, user_id=STUDENT_ID, chat_id=1, created_at=now + timedelta(seconds=2)),
+        pachca_message_factory(
+            id=4, user_id=EXPERT_ID, chat_id=1, parent_message_id=3, created_at=now + timedelta(seconds=3)
+        ),
+        # the previous group is answered, so this one starts a new group
+        pachca_message_factory(id=5, user_id=STUDENT_ID, chat_id=1, created_at=now + timedelta(seconds=4)),
+        pachca_message_factory(id=6, user_id=404, chat_id=1, created_at=now + timedelta(seconds=5)),
+    ]
+    with patch("app.service.pachca_client.PachcaClient.get_user", side_effect=get_user):
+        await process_message_batch(messages, app_config, session, pachca_client)
+        # replaying the batch changes nothing
+        await process_event_batch(EVENT_MESSAGE, messages, app_config, session, pachca_client)
+    stored = await stored_messages(session)
+    assert sorted(stored) == [1, 2, 3, 5]
+    assert stored[1].message_group_id == stored[3].message_group_id
+    assert stored[2].message_group_id != stored[1].message_group_id
+    assert stored[5].message_group_id != stored[1].message_group_id
+    assert stored[1].received_reaction and stored[3].received_reaction
+    assert stored[3].reaction_message_id == 4
+    assert not stored[2].received_reaction and not stored[5].received_reaction
+    assert stored[2].course == "HardDE"
+
+
+@pytest.mark.asyncio
+async def test_process_reaction_batch(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    now = datetime.now(timezone.utc)
+    for message_id, message_group_id in ((1, 10), (2, 10), (3, 20), (4, 30)):
+        session.add(
+            StudentMessage(
+                message_id=message_id,
+                message_group_id=message_group_id,
+                user_id=STUDENT_ID,
+                chat_id=1,
+                sent_at=now,
+            )
+        )
+    await session.commit()
+    reactions = [
+        pachca_reaction_factory(message_id=2, user_id=EXPERT_ID, created_at=now + timedelta(minutes=2)),
+        pachca_reaction_factory(message_id=1, user_id=EXPERT_ID, created_at=now + timedelta(minutes=1)),
+        pachca_reaction_factory(message_id=3, user_id=OTHER_STUDENT_ID, created_at=now),
+        pachca_reaction_factory(message_id=4, user_id=EXPERT_ID, created_at=now, event="delete"),
+        pachca_reaction_factory(message_id=404, user_id=EXPERT_ID, created_at=now),
+    ]
+    with patch("app.service.pachca_client.PachcaClient.get_user", side_effect=get_user):
+        await process_reaction_batch(reactions, app_config, session, pachca_client)
+    session.expunge_all()
+    stored = await stored_messages(session)
+    assert stored[1].received_reaction and stored[2].received_reaction
+    assert stored[1].received_reaction_at is not None
+    assert abs(stored[1].received_reaction_at.replace(tzinfo=timezone.utc) - (now + timedelta(minutes=1))) < timedelta(
+        seconds=1
+    )
+    assert stored[2].received_reaction_at == stored[1].received_reaction_at
+    assert not stored[3].received_reaction
+    assert not stored[4].received_reaction
+
+
+@pytest.mark.asyncio
+async def test_process_ticket_status_change_batch(session: AsyncSession, pachca_client: PachcaClient):
+    session.add(ThreadTicketSub(issue_key="TEST-1", chat_id=1, message_id=11))
+    session.add(ThreadTicketSub(issue_key="TEST-1", chat_id=2, message_id=12))
+    session.add(ThreadTicketSub(issue_key="TEST-2", chat_id=1, message_id=13))
+    await session.commit()
+    ticket_events = [
+        TicketStatusChange(issue_key="TEST-1", status="Closed"),
+        TicketStatusChange(issue_key="TEST-2", status="In Progress"),
+        TicketStatusChange(issue_key="TEST-3", status="Closed"),
+    ]
+    with patch("app.service.pachca_client.PachcaClient.send_message", new=AsyncMock()) as send_message:
+        await process_ticket_status_change_batch(ticket_events, {"Closed"}, session, pachca_client)
+    assert sorted(call.kwargs["parent_message_id"] for call in send_message.await_args_list) == [11, 12]
+
+
+@pytest.mark.asyncio
+async def test_process_event_batch_rejects_mismatched_payloads(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    payloads: list[PachcaMessage] = [pachca_message_factory()]
+    with pytest.raises(ValueError):
+        await process_event_batch(EVENT_REACTION, payloads, app_config, session, pachca_client)
@@ -0,0 +1,202 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.api.models import PachcaMessage
+from app.config import AppConfig
+from app.service.event_processing.batch_writer import StudentMessageWriter, insert_student_messages
+from app.service.event_processing.message_groups import assign_message_groups
+from app.service.event_processing.pachca_events import process_new_student_message
+from app.service.event_processing.user_roles import ROLE_STUDENT
+from app.service.orm.models import Base, MessageGroup, StudentMessage, UserRole
+from tests.factories import pachca_message_factory
+
+
+def student_role(user_id: int = 1) -> UserRole:
+    return UserRole(
+        user_id=user_id,
+        role=ROLE_STUDENT,
+        course="de",
+        tags_hash="",
+        refreshed_at=datetime.now(timezone.utc),
+    )
+
+
+def new_message(message_id: int, created_at: datetime | None = None) -> PachcaMessage:
+    return pachca_message_factory(
+        id=message_id,
+        user_id=1,
+        chat_id=1,
+        created_at=created_at or datetime.now(timezone.utc),
+    )
+
+
+async def stored_message_ids(session: AsyncSession) -> list[int]:
+    stmt = select(StudentMessage.message_id).order_by(StudentMessage.message_id)
+    return list((await session.execute(stmt)).scalars().all())
+
+
+@pytest.mark.asyncio
+async def test_writer_inserts_concurrent_rows_in_one_batch(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=0.01, max_batch_size=100)
+    await asyncio.gather(*(writer.write(new_message(i), student_role()) for i in range(1, 6)))
+    assert await stored_message_ids(session) == [1, 2, 3, 4, 5]
+    assert writer.stats() == {"pending": 0, "flushed_batches": 1, "flushed_rows": 5, "failed_rows": 0}
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_full_batch_without_waiting(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=60, max_batch_size=2)
+    writes = asyncio.gather(*(writer.write(new_message(i), student_role()) for i in range(1, 5)))
+    await asyncio.wait_for(writes, timeout=5)
+    assert await stored_message_ids(session) == [1, 2, 3, 4]
+    assert writer.stats()["flushed_batches"] == 2
+
+
+@pytest.mark.asyncio
+async def test_writer_fails_only_the_bad_row(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=0.01, max_batch_size=100)
+    await writer.write(new_message(1), student_role())
+    results = await asyncio.gather(
+        writer.write(new_message(1), student_role()),
+        writer.write(new_message(2), student_role()),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], Exception)
+    assert results[1] is None
+    assert await stored_message_ids(session) == [1, 2]
+    assert writer.stats()["failed_rows"] == 1
+
+
+@pytest.mark.asyncio
+async def test_message_joins_group_of_batch_being_flushed(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=60, max_batch_size=100)
+    release = asyncio.Event()
+
+    async def slow_insert(session: AsyncSession, rows: list[dict]) -> None:
+        await release.wait()
+        await insert_student_messages(session, rows)
+
+    created_at = datetime.now(timezone.utc)
+    with patch("app.service.event_processing.batch_writer.insert_student_messages", side_effect=slow_insert):
+        first = asyncio.create_task(writer.write(new_message(1, created_at), student_role()))
+        await asyncio.sleep(0)
+        first_flush = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0.01)
+        # the first batch is assigned but not committed yet, the second one waits for it
+        second = asyncio.create_task(writer.write(new_message(2, created_at + timedelta(seconds=1)), student_role()))
+        await asyncio.sleep(0)
+        second_flush = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(first, first_flush, second, second_flush)
+    result = (await session.execute(select(StudentMessage).order_by(StudentMessage.message_id))).scalars().all()
+    assert [message.message_id for message in result] == [1, 2]
+    assert result[0].message_group_id == result[1].message_group_id
+    assert len((await session.execute(select(MessageGroup))).scalars().all()) == 1
+
+
+@pytest.mark.asyncio
+async def test_pending_rows_join_message_group(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=0.05, max_batch_size=100)
+    user_role = student_role()
+    created_at = datetime.now(timezone.utc)
+
+    async def process(message_id: int, delay_seconds: float) -> None:
+        await asyncio.sleep(delay_seconds)
+        message = pachca_message_factory(
+            id=message_id,
+            user_id=1,
+            chat_id=1,
+            created_at=created_at + timedelta(seconds=message_id),
+        )
+        async with sessionmaker() as own_session:
+            await process_new_student_message(message, app_config, own_session, user_role, writer)
+
+    # the second message arrives before the first one is inserted
+    await asyncio.gather(process(1, 0), process(2, 0.01))
+    result = (await session.execute(select(StudentMessage))).scalars().all()
+    assert len(result) == 2
+    assert result[0].message_group_id == result[1].message_group_id
+    assert writer.stats()["flushed_batches"] == 1
+    group = (await session.execute(select(MessageGroup))).scalar_one()
+    assert group.id == result[0].message_group_id
+    assert group.first_message_id == 1
+    assert group.last_sent_at.replace(tzinfo=timezone.utc) == created_at + timedelta(seconds=2)
+
+
+@pytest.mark.asyncio
+async def test_writer_waits_without_request_connection(tmp_path: Path, app_config: AppConfig):
+    # the only connection of the pool is taken by the request session until it waits for the writer
+    engine = create_async_engine(
+        url=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=1,
+    )
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(engine)
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=0.01, max_batch_size=100)
+    async with sessionmaker() as request_session:
+        # e.g. the author role lookup opens the transaction
+        await request_session.get(UserRole, 1)
+        await process_new_student_message(new_message(1), app_config, request_session, student_role(), writer)
+    async with sessionmaker() as session:
+        assert await stored_message_ids(session) == [1]
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_writer_flushes_batches_in_order(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    writer = StudentMessageWriter(sessionmaker, app_config, flush_interval_seconds=60, max_batch_size=1)
+    calls = 0
+
+    async def slow_first_assign(*args, **kwargs) -> list[dict]:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            # the second batch must not overtake the first one
+            await asyncio.sleep(0.05)
+        return await assign_message_groups(*args, **kwargs)
+
+    created_at = datetime.now(timezone.utc)
+    with patch("app.service.event_processing.batch_writer.assign_message_groups", side_effect=slow_first_assign):
+        await asyncio.gather(
+            writer.write(new_message(1, created_at), student_role()),
+            writer.write(new_message(2, created_at + timedelta(seconds=1)), student_role()),
+        )
+    group = (await session.execute(select(MessageGroup))).scalar_one()
+    assert group.first_message_id == 1
+    assert group.first_sent_at.replace(tzinfo=timezone.utc) == created_at
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import AppConfig
+from app.service.event_processing.user_roles import ROLE_EXPERT, ROLE_OTHER, ROLE_STUDENT, tags_hash
+from app.service.orm.models import UserRole
+from app.service.pachca_client import PachcaClient, UserNotFoundError
+from app.service.pachca_client.models import User
+from app.service.tasks.cache_warmup import warm_up_user_cache
+from tests.factories import pachca_user_factory
+
+USER_TAGS = {
+    1: ("StartDE_1",),
+    2: ("expert_StartDE",),
+    3: ("tag1",),
+    4: ("HardDE_1",),
+}
+
+
+@pytest.mark.asyncio
+async def test_warm_up_user_cache(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    app_config.warmup_chat_ids = {10, 20}
+    app_config.warmup_concurrency = 2
+    session.add(
+        UserRole(
+            user_id=4,
+            role=ROLE_STUDENT,
+            course="HardDE",
+            tags_hash=tags_hash(["HardDE_1"]),
+            refreshed_at=datetime.now(timezone.utc),
+        )
+    )
+    await session.commit()
+    running = 0
+    max_running = 0
+
+    async def get_chat_info(chat_id: int) -> dict[str, dict[str, list[int]]]:
+        return {"data": {"member_ids": [1, 2, 4] if chat_id == 10 else [2, 3, 5]}}
+
+    async def get_user(user_id: int) -> User:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0)
+        running -= 1
+        if user_id not in USER_TAGS:
+            raise UserNotFoundError(user_id)
+        return pachca_user_factory(id=user_id, list_tags=USER_TAGS[user_id])
+
+    with (
+        patch("app.service.pachca_client.PachcaClient.get_chat_info", side_effect=get_chat_info),
+        patch("app.service.pachca_client.PachcaClient.get_user", side_effect=get_user) as get_user_mock,
+    ):
+        n_fetched = await warm_up_user_cache(session, pachca_client, app_config)
+
+    assert n_fetched == 3
+    assert max_running <= app_config.warmup_concurrency
+    assert sorted(c.args[0] for c in get_user_mock.await_args_list) == [1, 2, 3, 5]
+    roles = {r.user_id: r.role for r in (await session.execute(select(UserRole))).scalars()}
+    assert roles == {1: ROLE_STUDENT, 2: ROLE_EXPERT, 3: ROLE_OTHER, 4: ROLE_STUDENT}
+
+
+@pytest.mark.asyncio
+async def test_warm_up_user_cache_without_chats(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    with patch("app.service.pachca_client.PachcaClient.get_chat_info") as get_chat_info:
+        assert await warm_up_user_cache(session, pachca_client, app_config) == 0
+    get_chat_info.assert_not_called()
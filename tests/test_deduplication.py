@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.ingestion import EventIngestion
+from app.api.models import TicketStatusChange
+from app.config import AppConfig
+from app.service.event_processing.deduplication import EventDeduplicator, event_key
+from app.service.event_processing.durable_queue import DurableEventWorkers
+from app.service.event_processing.events import EVENT_MESSAGE, EVENT_REACTION, EVENT_SUBSCRIBE
+from app.service.orm.models import InboundEvent, ProcessedEvent
+from app.service.pachca_client import PachcaClient
+from tests.factories import pachca_message_factory, pachca_reaction_factory
+
+
+def test_event_key():
+    message = pachca_message_factory(id=5, user_id=7, event="new")
+    assert event_key(EVENT_MESSAGE, message) == "message:message:new:5:7"
+    assert event_key(EVENT_SUBSCRIBE, message) != event_key(EVENT_MESSAGE, message)
+    assert event_key(EVENT_REACTION, pachca_reaction_factory(message_id=5, user_id=7)) == "reaction:reaction:new:5:7"
+    assert event_key("ticket_status_change", TicketStatusChange(issue_key="TEST-1", status="Closed")) is None
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_memory_and_db(session: AsyncSession):
+    deduplicator = EventDeduplicator(max_size=10)
+    assert await deduplicator.claim(session, "key")
+    await deduplicator.complete_many(session, ["key"])
+    assert not await deduplicator.claim(session, "key")
+
+    # a fresh process only has the database
+    restarted = EventDeduplicator(max_size=10)
+    assert not await restarted.claim(session, "key")
+    assert restarted.stats() == {"size": 0, "unique": 0, "duplicates_memory": 0, "duplicates_db": 1}
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_claims_key_once(session: AsyncSession):
+    # two processes receive the same delivery at once
+    claims = [await EventDeduplicator(max_size=10).claim(session, "key") for _ in range(2)]
+    assert claims == [True, False]
+    assert len((await session.execute(select(ProcessedEvent))).scalars().all()) == 1
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_release(session: AsyncSession):
+    deduplicator = EventDeduplicator(max_size=10)
+    assert await deduplicator.claim(session, "key")
+    await deduplicator.release_many(session, ["key"])
+    # the failed event is processed when it is delivered again
+    assert await deduplicator.claim(session, "key")
+    assert deduplicator.stats()["unique"] == 1
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_claim_lease_expires(session: AsyncSession):
+    deduplicator = EventDeduplicator(max_size=10, claim_lease_seconds=0)
+    assert await deduplicator.claim(session, "key")
+    await session.commit()
+    # the process died before completing the event, its redelivery is processed after the lease
+    assert await EventDeduplicator(max_size=10).claim(session, "key")
+    await session.commit()
+    await deduplicator.complete_many(session, ["key"])
+    assert not await EventDeduplicator(max_size=10).claim(session, "key")
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_claim_without_lease_is_rolled_back(session: AsyncSession):
+    deduplicator = EventDeduplicator(max_size=10)
+    assert await deduplicator.claim(session, "key", lease=False)
+    # e.g. the durable event was not stored
+    await session.rollback()
+    assert await EventDeduplicator(max_size=10).claim(session, "key", lease=False)
+    await session.commit()
+    assert not await EventDeduplicator(max_size=10).claim(session, "key")
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_prune(session: AsyncSession):
+    session.add_all(
+        (
+            ProcessedEvent(key="old", created_at=datetime.now(timezone.utc) - timedelta(days=2)),
+            ProcessedEvent(key="new", created_at=datetime.now(timezone.utc)),
+        )
+    )
+    await session.commit()
+    assert await EventDeduplicator(max_size=10).prune(session, retention_seconds=24 * 60 * 60) == 1
+    keys = (await session.execute(select(ProcessedEvent.key))).scalars().all()
+    assert keys == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_batch(session: AsyncSession):
+    deduplicator = EventDeduplicator(max_size=10)
+    assert await deduplicator.claim_many(session, ["a", "b"]) == {"a", "b"}
+    await deduplicator.complete_many(session, ["a", "b"])
+    restarted = EventDeduplicator(max_size=10)
+    assert await restarted.claim(session, "c")
+    await restarted.complete_many(session, ["c"])
+    assert await restarted.claim_many(session, ["a", "c", "d", "a"]) == {"d"}
+    assert restarted.stats() == {"size": 1, "unique": 2, "duplicates_memory": 1, "duplicates_db": 1}
+
+
+@pytest.mark.asyncio
+async def test_durable_ingestion_stores_key_with_event(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    deduplicator = EventDeduplicator(max_size=10)
+    worker_pool = DurableEventWorkers(
+        sessionmaker=sessionmaker,
+        handler=AsyncMock(),
+        n_workers=1,
+        batch_size=10,
+        max_attempts=1,
+        retry_delay_seconds=0,
+        poll_interval_seconds=1,
+    )
+    ingestion = EventIngestion(app_config, session, pachca_client, worker_pool, deduplicator)
+    message = pachca_message_factory(id=1)
+    with patch("app.api.ingestion.enqueue_events", side_effect=RuntimeError("crash")):
+        with pytest.raises(RuntimeError):
+            await ingestion.handle(EVENT_MESSAGE, message, Response())
+    await session.rollback()
+    # the event was not stored, so neither was its key
+    assert (await session.execute(select(ProcessedEvent))).scalars().all() == []
+
+    await ingestion.handle(EVENT_MESSAGE, message, Response())
+    await ingestion.handle(EVENT_MESSAGE, message, Response())
+    assert len((await session.execute(select(InboundEvent))).scalars().all()) == 1
+    processed = (await session.execute(select(ProcessedEvent))).scalar_one()
+    assert processed.claimed_until is None
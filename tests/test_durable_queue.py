@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.models import TicketStatusChange
+from app.service.event_processing.durable_queue import (
+    STATUS_DEAD,
+    STATUS_PENDING,
+    DurableEventWorkers,
+    enqueue_event,
+)
+from app.service.event_processing.events import EVENT_MESSAGE, EVENT_TICKET_STATUS_CHANGE, Payload
+from app.service.orm.models import InboundEvent
+from tests.factories import pachca_message_factory
+
+
+def workers_factory(sessionmaker: async_sessionmaker[AsyncSession], handler, max_attempts=2) -> DurableEventWorkers:
+    return DurableEventWorkers(
+        sessionmaker=sessionmaker,
+        handler=handler,
+        n_workers=1,
+        batch_size=10,
+        max_attempts=max_attempts,
+        retry_delay_seconds=0,
+        poll_interval_seconds=0.01,
+    )
+
+
+@pytest.mark.asyncio
+async def test_durable_queue_processes_events_in_order(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+):
+    message = pachca_message_factory(id=1, created_at=datetime(2025, 1, 1, tzinfo=timezone.utc))
+    ticket_event = TicketStatusChange(issue_key="TEST-1", status="Closed")
+    await enqueue_event(session, EVENT_MESSAGE, message)
+    await enqueue_event(session, EVENT_TICKET_STATUS_CHANGE, ticket_event)
+    processed: list[tuple[str, Payload]] = []
+
+    async def handler(kind: str, payload: Payload) -> None:
+        processed.append((kind, payload))
+
+    workers = workers_factory(sessionmaker, handler)
+    assert await workers.process_batch(session) == 2
+    assert processed == [(EVENT_MESSAGE, message), (EVENT_TICKET_STATUS_CHANGE, ticket_event)]
+    assert (await session.execute(select(InboundEvent))).scalars().all() == []
+    assert workers.stats()["processed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_durable_queue_retries_and_dead_letters(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+):
+    await enqueue_event(session, EVENT_MESSAGE, pachca_message_factory(id=1))
+
+    async def handler(kind: str, payload: Payload) -> None:
+        raise RuntimeError("boom")
+
+    workers = workers_factory(sessionmaker, handler, max_attempts=2)
+    assert await workers.process_batch(session) == 1
+    event = (await session.execute(select(InboundEvent))).scalar_one()
+    assert event.status == STATUS_PENDING
+    assert event.attempts == 1
+    assert event.last_error is not None and "boom" in event.last_error
+
+    assert await workers.process_batch(session) == 1
+    event = (await session.execute(select(InboundEvent))).scalar_one()
+    assert event.status == STATUS_DEAD
+    assert event.attempts == 2
+
+    # dead events are not claimed anymore
+    assert await workers.process_batch(session) == 0
+    assert workers.stats()["failed"] == 1
+    assert workers.stats()["dead"] == 1
+
+
+@pytest.mark.asyncio
+async def test_durable_queue_leases_events_outside_of_processing(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+):
+    await enqueue_event(session, EVENT_MESSAGE, pachca_message_factory(id=1))
+    workers = workers_factory(sessionmaker, None)
+    leased = []
+
+    async def handler(kind: str, payload: Payload) -> None:
+        # the claim is committed before processing, other workers skip the leased event
+        async with sessionmaker() as own_session:
+            stmt = select(InboundEvent.attempts, InboundEvent.available_at)
+            leased.extend((await own_session.execute(stmt)).all())
+            assert await workers.process_batch(own_session) == 0
+
+    workers._handler = handler
+    assert await workers.process_batch(session) == 1
+    assert len(leased) == 1
+    attempts, available_at = leased[0]
+    assert attempts == 1
+    assert available_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    assert (await session.execute(select(InboundEvent))).scalars().all() == []
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import ConnectionPoolEntry, Pool
+
+from app.config import AppConfig
+from app.service.orm.engine import TimedQueuePool, create_engine, pool_stats
+
+
+def test_create_engine_applies_pool_settings(app_config: AppConfig):
+    config = app_config.model_copy(update={"db_pool_size": 3, "db_max_overflow": 2, "db_statement_timeout_ms": 5000})
+    engine = create_engine("postgresql+asyncpg://postgres@localhost/test", config)
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert pool_stats(engine)["size"] == 3
+    assert engine.pool._max_overflow == 2
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_report_waits(tmp_path: Path):
+    engine = create_async_engine(
+        url=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+
+    async def hold_connection() -> None:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(hold_connection(), hold_connection())
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 2
+    assert stats["wait_seconds_max"] >= 0.04
+    # the pool of one connection opens it once
+    assert stats["connects"] == 1
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_report_connect_time_separately(tmp_path: Path):
+    engine = create_async_engine(
+        url=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    create_connection = Pool._create_connection
+
+    def slow_create_connection(pool: Pool) -> ConnectionPoolEntry:
+        time.sleep(0.05)
+        return create_connection(pool)
+
+    with patch.object(Pool, "_create_connection", slow_create_connection):
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    stats = pool_stats(engine)
+    assert stats["connects"] == 1
+    assert stats["connect_seconds_max"] >= 0.05
+    assert stats["wait_seconds_max"] < 0.05
+    await engine.dispose()
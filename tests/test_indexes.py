@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import Select, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.service.orm.models import StudentMessage
+
+NOW = datetime.now(timezone.utc)
+
+
+async def explain(session: AsyncSession, stmt: Select) -> str:
+    connection = await session.connection()
+    if connection.dialect.name == "postgresql":
+        # the test table is still small, sequential scan would be cheaper than any index
+        await connection.exec_driver_sql("SET enable_seqscan = off")
+        prefix = "EXPLAIN"
+    else:
+        prefix = "EXPLAIN QUERY PLAN"
+    compiled = stmt.compile(dialect=connection.dialect)
+    params = []
+    for name in compiled.positiontup or ():
+        # driver level execution skips type conversions, e.g. of intervals on SQLite
+        processor = compiled.binds[name].type.dialect_impl(connection.dialect).bind_processor(connection.dialect)
+        value = compiled.params[name]
+        params.append(processor(value) if processor is not None else value)
+    result = await connection.exec_driver_sql(f"{prefix} {compiled}", tuple(params))
+    return "\n".join(str(row[-1]) for row in result)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("stmt", "index"),
+    (
+        (
+            # group update of react_to_message_group
+            select(StudentMessage.message_id)
+            .where(StudentMessage.message_group_id == 1)
+            .where(~StudentMessage.received_reaction),
+            "ix_student_message_pending_message_group_id",
+        ),
+    ),
+)
+async def test_pending_message_queries_use_partial_indexes(session: AsyncSession, stmt: Select, index: str):
+    # mostly answered messages of many students, so that planner statistics resemble production
+    rows = [
+        dict(
+            message_id=i,
+            message_group_id=i // 3,
+            user_id=i % 200,
+            chat_id=i % 7,
+            received_reaction=i % 10 != 0,
+            sent_at=NOW - timedelta(minutes=i),
+        )
+        for i in range(3000)
+    ]
+    await session.execute(insert(StudentMessage), rows)
+    await session.commit()
+    await (await session.connection()).exec_driver_sql("ANALYZE")
+    assert index in await explain(session, stmt)
@@ -0,0 +1,107 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import aiohttp
+import pytest
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from app.service.pachca_client.dispatcher import MessageDispatcher
+
+
+def dispatcher_factory(send, max_concurrency=5, max_attempts=3) -> MessageDispatcher:
+    return MessageDispatcher(
+        send=send,
+        rate_per_second=1000,
+        burst=1000,
+        max_concurrency=max_concurrency,
+        max_attempts=max_attempts,
+        retry_base_delay_seconds=0.001,
+        retry_max_delay_seconds=0.01,
+    )
+
+
+def response_error(status: int, headers: dict[str, str] | None = None) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(
+        request_info=MagicMock(),
+        history=(),
+        status=status,
+        headers=CIMultiDictProxy(CIMultiDict(headers or {})),
+    )
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_keeps_per_chat_order():
+    delivered: list[tuple[int, str]] = []
+
+    async def send(chat_id: int, text: str, parent_message_id: int | None) -> None:
+        # later messages to a chat complete faster, order must still be preserved
+        await asyncio.sleep(0.001 * (10 - int(text)))
+        delivered.append((chat_id, text))
+
+    dispatcher = dispatcher_factory(send)
+    await asyncio.gather(*(dispatcher.send(chat_id, str(i), None) for i in range(10) for chat_id in (1, 2)))
+    for chat_id in (1, 2):
+        assert [text for c, text in delivered if c == chat_id] == [str(i) for i in range(10)]
+    assert dispatcher.stats() == {"queued": 0, "active_chats": 0, "sent": 20, "retried": 0, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_bounds_concurrency():
+    running = 0
+    max_running = 0
+
+    async def send(chat_id: int, text: str, parent_message_id: int | None) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+
+    dispatcher = dispatcher_factory(send, max_concurrency=2)
+    await asyncio.gather(*(dispatcher.send(chat_id, "text", None) for chat_id in range(10)))
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_honors_retry_after():
+    attempts = 0
+
+    async def send(chat_id: int, text: str, parent_message_id: int | None) -> None:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise response_error(429, {"Retry-After": "0.05"})
+
+    dispatcher = dispatcher_factory(send)
+    with patch("app.service.pachca_client.dispatcher.asyncio.sleep", side_effect=asyncio.sleep) as sleep:
+        await dispatcher.send(1, "text", None)
+    assert attempts == 2
+    sleep.assert_any_await(0.05)
+    assert dispatcher.stats()["retried"] == 1
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_gives_up_after_max_attempts():
+    async def send(chat_id: int, text: str, parent_message_id: int | None) -> None:
+        raise response_error(503)
+
+    dispatcher = dispatcher_factory(send, max_attempts=3)
+    with pytest.raises(aiohttp.ClientResponseError):
+        await dispatcher.send(1, "text", None)
+    assert dispatcher.stats()["retried"] == 2
+    assert dispatcher.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_does_not_retry_client_errors():
+    attempts = 0
+
+    async def send(chat_id: int, text: str, parent_message_id: int | None) -> None:
+        nonlocal attempts
+        attempts += 1
+        raise response_error(400)
+
+    dispatcher = dispatcher_factory(send)
+    with pytest.raises(aiohttp.ClientResponseError):
+        await dispatcher.send(1, "text", None)
+    assert attempts == 1
@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.models import ThreadInfo
+from app.config import AppConfig
+from app.service.event_processing.message_groups import GROUP_ANSWERED, GROUP_PENDING
+from app.service.event_processing.pachca_events import (
+    insert_new_student_messages,
+    process_message,
+    process_new_student_message,
+)
+from app.service.event_processing.user_roles import ROLE_STUDENT
+from app.service.orm.models import MessageGroup, StudentMessage, StudentMessageText, UserRole
+from app.service.pachca_client import PachcaClient
+from tests.factories import pachca_message_factory, pachca_user_factory
+
+STUDENT = pachca_user_factory(id=1, list_tags=("HardDE_1",))
+EXPERT = pachca_user_factory(id=2, list_tags=("expert_HardDE",))
+
+
+async def get_user(user_id: int):
+    return {STUDENT.id: STUDENT, EXPERT.id: EXPERT}[user_id]
+
+
+async def stored_groups(session: AsyncSession) -> list[MessageGroup]:
+    session.expunge_all()
+    return list((await session.execute(select(MessageGroup).order_by(MessageGroup.first_sent_at))).scalars().all())
+
+
+@pytest.mark.asyncio
+async def test_message_group_lifecycle(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    now = datetime.now(timezone.utc)
+    time_frame = timedelta(seconds=app_config.message_group_time_frame_seconds)
+    messages = [
+        pachca_message_factory(id=1, user_id=STUDENT.id, chat_id=1, created_at=now),
+        # continues the group in a thread under the first message
+        pachca_message_factory(
+            id=2,
+            user_id=STUDENT.id,
+            chat_id=100,
+            created_at=now + time_frame / 2,
+            thread=ThreadInfo(message_id=1, message_chat_id=1),
+        ),
+        # too late to continue the group
+        pachca_message_factory(id=3, user_id=STUDENT.id, chat_id=1, created_at=now + 2 * time_frame),
+    ]
+    with patch("app.service.pachca_client.PachcaClient.get_user", side_effect=get_user):
+        for message in messages:
+            await process_message(message, app_config, session, pachca_client)
+        groups = await stored_groups(session)
+        assert [(g.first_message_id, g.status) for g in groups] == [(1, GROUP_PENDING), (3, GROUP_PENDING)]
+        assert groups[0].course == "HardDE"
+        assert groups[0].last_sent_at.replace(tzinfo=timezone.utc) == now + time_frame / 2
+        assert groups[0].deadline.replace(tzinfo=timezone.utc) == now + timedelta(seconds=app_config.response_sla_seconds)
+
+        reply = pachca_message_factory(
+            id=4, user_id=EXPERT.id, chat_id=1, parent_message_id=1, created_at=now + time_frame
+        )
+        await process_message(reply, app_config, session, pachca_client)
+        groups = await stored_groups(session)
+        assert [(g.first_message_id, g.status) for g in groups] == [(1, GROUP_ANSWERED), (3, GROUP_PENDING)]
+        assert groups[0].reaction_message_id == 4
+
+        # a deleted message moves the group start to the next message, an empty group is removed
+        await process_message(
+            pachca_message_factory(id=3, user_id=STUDENT.id, event="delete"), app_config, session, pachca_client
+        )
+        await process_message(
+            pachca_message_factory(id=1, user_id=STUDENT.id, event="delete"), app_config, session, pachca_client
+        )
+    groups = await stored_groups(session)
+    assert [(g.first_message_id, g.status) for g in groups] == [(2, GROUP_ANSWERED)]
+    messages_left = (await session.execute(select(StudentMessage.message_id))).scalars().all()
+    assert list(messages_left) == [2]
+    texts_left = (await session.execute(select(StudentMessageText.message_id))).scalars().all()
+    assert list(texts_left) == [2]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_messages_open_one_group(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    app_config: AppConfig,
+):
+    now = datetime.now(timezone.utc)
+    user_role = UserRole(user_id=STUDENT.id, role=ROLE_STUDENT, course="HardDE", tags_hash="", refreshed_at=now)
+
+    async def process(message_id: int) -> None:
+        message = pachca_message_factory(
+            id=message_id, user_id=STUDENT.id, chat_id=1, created_at=now + timedelta(seconds=message_id)
+        )
+        async with sessionmaker() as own_session:
+            await process_new_student_message(message, app_config, own_session, user_role)
+
+    commit = AsyncSession.commit
+
+    async def slow_commit(self: AsyncSession) -> None:
+        # keep transactions open long enough to overlap
+        await asyncio.sleep(0.05)
+        await commit(self)
+
+    with patch.object(AsyncSession, "commit", slow_commit):
+        await asyncio.gather(*(process(message_id) for message_id in range(1, 6)))
+    group = (await stored_groups(session))[0]
+    assert len(await stored_groups(session)) == 1
+    assert group.last_sent_at.replace(tzinfo=timezone.utc) == now + timedelta(seconds=5)
+    group_ids = (await session.execute(select(StudentMessage.message_group_id))).scalars().all()
+    assert set(group_ids) == {group.id}
+
+
+@pytest.mark.asyncio
+async def test_batch_message_joins_group_of_thread_root_from_same_batch(
+    session: AsyncSession,
+    app_config: AppConfig,
+):
+    now = datetime.now(timezone.utc)
+    user_role = UserRole(user_id=STUDENT.id, role=ROLE_STUDENT, course="HardDE", tags_hash="", refreshed_at=now)
+    messages = [
+        pachca_message_factory(id=1, user_id=STUDENT.id, chat_id=1, created_at=now),
+        pachca_message_factory(
+            id=2,
+            user_id=STUDENT.id,
+            chat_id=100,
+            created_at=now + timedelta(seconds=1),
+            thread=ThreadInfo(message_id=1, message_chat_id=1),
+        ),
+    ]
+    await insert_new_student_messages([(message, user_role) for message in messages], app_config, session)
+    groups = await stored_groups(session)
+    assert [(g.first_message_id, g.last_sent_at.replace(tzinfo=timezone.utc)) for g in groups] == [
+        (1, now + timedelta(seconds=1))
+    ]
+    group_ids = (await session.execute(select(StudentMessage.message_group_id))).scalars().all()
+    assert set(group_ids) == {groups[0].id}
@@ -0,0 +1,85 @@
+from unittest.mock import call, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.service.orm.models import OutboxMessage
+from app.service.pachca_client import PachcaClient
+from app.service.tasks.outbox import deliver_outbox
+
+
+@pytest.mark.asyncio
+async def test_deliver_outbox(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+):
+    session.add_all(
+        (
+            OutboxMessage(chat_id=1, text="first", parent_message_id=10),
+            OutboxMessage(chat_id=1, text="second", parent_message_id=None),
+            OutboxMessage(chat_id=2, text="dead", parent_message_id=None, attempts=3),
+        )
+    )
+    await session.commit()
+    n_delivered = await deliver_outbox(session, pachca_client, batch_size=10, max_attempts=3)
+    assert n_delivered == 2
+    pachca_client.send_message.assert_has_awaits(
+        (
+            call(chat_id=1, text="first", parent_message_id=10),
+            call(chat_id=1, text="second", parent_message_id=None),
+        )
+    )
+    left = (await session.execute(select(OutboxMessage))).scalars().all()
+    assert [m.text for m in left] == ["dead"]
+
+
+@pytest.mark.asyncio
+async def test_deliver_outbox_keeps_failed_messages(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+):
+    session.add_all(
+        (
+            OutboxMessage(chat_id=1, text="fails", parent_message_id=None),
+            OutboxMessage(chat_id=2, text="succeeds", parent_message_id=None),
+        )
+    )
+    await session.commit()
+    with patch("app.service.pachca_client.PachcaClient.send_message", side_effect=(Exception("boom"), None)):
+        n_delivered = await deliver_outbox(session, pachca_client, batch_size=10, max_attempts=3)
+    assert n_delivered == 1
+    left = (await session.execute(select(OutboxMessage))).scalars().all()
+    assert len(left) == 1
+    assert left[0].text == "fails"
+    assert left[0].attempts == 1
+    assert left[0].last_error == repr(Exception("boom"))
+
+
+@pytest.mark.asyncio
+async def test_deliver_outbox_respects_batch_size(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+):
+    session.add_all(OutboxMessage(chat_id=1, text=str(i), parent_message_id=None) for i in range(5))
+    await session.commit()
+    assert await deliver_outbox(session, pachca_client, batch_size=3, max_attempts=3) == 3
+    assert await deliver_outbox(session, pachca_client, batch_size=3, max_attempts=3) == 2
+    assert await deliver_outbox(session, pachca_client, batch_size=3, max_attempts=3) == 0
+
+
+@pytest.mark.asyncio
+async def test_deliver_outbox_skips_leased_messages(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+):
+    session.add(OutboxMessage(chat_id=1, text="first", parent_message_id=None))
+    await session.commit()
+
+    async def send_message(**kwargs) -> None:
+        # the lease is committed before sending, a concurrent sender does not pick the message up
+        assert await deliver_outbox(session, pachca_client, batch_size=10, max_attempts=3) == 0
+
+    with patch("app.service.pachca_client.PachcaClient.send_message", side_effect=send_message):
+        assert await deliver_outbox(session, pachca_client, batch_size=10, max_attempts=3) == 1
+    assert (await session.execute(select(OutboxMessage))).scalars().all() == []
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator
+from unittest.mock import MagicMock, patch
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from app.service.pachca_client.client import PachcaClient, UserNotFoundError, get_client
+
+RAW_USER = {
+    "id": 1,
+    "first_name": None,
+    "last_name": None,
+    "nickname": None,
+    "email": None,
+    "phone_number": None,
+    "department": None,
+    "title": None,
+    "role": None,
+    "suspended": False,
+    "invite_status": None,
+    "list_tags": ["StartDE_1"],
+    "bot": False,
+    "created_at": "2025-01-01T00:00:00Z",
+    "last_activity_at": None,
+    "time_zone": None,
+    "image_url": None,
+}
+MESSAGES_START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+N_MESSAGES = 25
+
+
+def raw_message(message_id: int) -> dict[str, object]:
+    return {
+        "id": message_id,
+        "entity_type": "discussion",
+        "entity_id": 1,
+        "chat_id": 1,
+        "content": "text",
+        "user_id": 1,
+        "created_at": (MESSAGES_START + timedelta(minutes=message_id)).isoformat(),
+        "thread": None,
+    }
+
+
+@pytest_asyncio.fixture()
+async def pachca_server() -> AsyncGenerator[tuple[str, list[tuple[str, int]]], None]:
+    peers: list[tuple[str, int]] = []
+
+    async def get_user(request: web.Request) -> web.Response:
+        assert request.transport is not None
+        peers.append(request.transport.get_extra_info("peername"))
+        if request.match_info["user_id"] == "404":
+            return web.json_response({"errors": []}, status=404)
+        return web.json_response({"data": {**RAW_USER, "id": int(request.match_info["user_id"])}})
+
+    async def get_messages(request: web.Request) -> web.Response:
+        peers.append(("messages", int(request.query["page"])))
+        per_page, page = int(request.query["per"]), int(request.query["page"])
+        # newest first, like Pachca does
+        ids = list(range(N_MESSAGES, 0, -1))[(page - 1) * per_page : page * per_page]
+        return web.json_response({"data": [raw_message(i) for i in ids]})
+
+    server_app = web.Application()
+    server_app.router.add_get("/users/{user_id}", get_user)
+    server_app.router.add_get("/messages", get_messages)
+    runner = web.AppRunner(server_app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    yield f"http://127.0.0.1:{port}", peers
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_pachca_client_reuses_connections(pachca_server: tuple[str, list[tuple[str, int]]]):
+    host, peers = pachca_server
+    with patch.object(PachcaClient, "HOST", host):
+        async with PachcaClient(token="test_token", pool_limit=10) as client:
+            for user_id in (1, 2, 3):
+                user = await client.get_user(user_id)
+                assert user.id == user_id
+            stats = client.pool_stats()
+    assert len(peers) == 3
+    assert len(set(peers)) == 1
+    assert stats["limit"] == 10
+    assert stats["acquired"] == 0
+    assert stats["idle"] == 1
+
+
+def test_pool_stats_without_connector_internals():
+    client = PachcaClient(token="test_token", pool_limit=10)
+    # a connector of an aiohttp version which dropped the private bookkeeping
+    client._connector = MagicMock(spec=["closed", "limit", "limit_per_host"], closed=False, limit=10, limit_per_host=0)
+    assert client.pool_stats() == {"limit": 10, "limit_per_host": 0}
+
+
+@pytest.mark.asyncio
+async def test_get_client_returns_app_lifetime_client():
+    client = PachcaClient(token="test_token")
+    request = MagicMock()
+    request.app.state.pachca_client = client
+    assert get_client(request) is client
+    assert client.pool_stats()["acquired"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pachca_client_caches_missing_users(pachca_server: tuple[str, list[tuple[str, int]]]):
+    host, peers = pachca_server
+    with patch.object(PachcaClient, "HOST", host):
+        async with PachcaClient(token="test_token") as client:
+            for _ in range(2):
+                with pytest.raises(UserNotFoundError):
+                    await client.get_user(404)
+    assert len(peers) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefetch", (False, True))
+async def test_pachca_client_iter_messages(pachca_server: tuple[str, list[tuple[str, int]]], prefetch: bool):
+    host, requests = pachca_server
+    with patch.object(PachcaClient, "HOST", host):
+        async with PachcaClient(token="test_token") as client:
+            messages = [
+                m.id
+                async for m in client.iter_messages(
+                    chat_id=1,
+                    sent_after=MESSAGES_START + timedelta(minutes=14),
+                    per_page=5,
+                    prefetch=prefetch,
+                )
+            ]
+    assert messages == list(range(25, 13, -1))
+    # the third page crosses sent_after, so the fourth one is never requested
+    assert requests == [("messages", 1), ("messages", 2), ("messages", 3)]
+
+
+@pytest.mark.asyncio
+async def test_pachca_client_get_messages_stops_on_last_page(pachca_server: tuple[str, list[tuple[str, int]]]):
+    host, requests = pachca_server
+    with patch.object(PachcaClient, "HOST", host):
+        async with PachcaClient(token="test_token") as client:
+            messages = await client.get_messages(chat_id=1, per_page=10)
+    assert [m.id for m in messages] == list(range(25, 0, -1))
+    assert requests == [("messages", 1), ("messages", 2), ("messages", 3)]
@@ -13,98 +13,17 @@ from app.service.event_processing.pachca_events import (
     process_reaction,
     process_subscribe,
     process_unsubscribe,
+    react_to_message_group,
 )
-from app.service.orm.models import StudentMessage, ThreadTicketSub
+from app.service.orm.models import OutboxMessage, StudentMessage, ThreadTicketSub
 from app.service.pachca_client import PachcaClient
 from app.service.pachca_client.models import User as PachcaUser
+from tests.factories import pachca_message_factory, pachca_reaction_factory, pachca_user_factory
 
 
-def pachca_message_factory(
-    id=1,
-    type="message",
-    event="new",
-    entity_type="discussion",
-    entity_id=1,
-    content="default_content",
-    user_id=1,
-    created_at=datetime.now(timezone.utc),
-    chat_id=1,
-    parent_message_id=None,
-    thread=None,
-) -> PachcaMessage:
-    return PachcaMessage(
-        type=type,
-        id=id,
-        event=event,
-        entity_type=entity_type,
-        entity_id=entity_id,
-        content=content,
-        user_id=user_id,
-        created_at=created_at,
-        chat_id=chat_id,
-        parent_message_id=parent_message_id,
-        thread=thread,
-    )
-
-
-def pachca_user_factory(
-    id=1,
-    first_name="default_first_name",
-    last_name="default_last_name",
-    nickname="default_nickname",
-    email="default_email",
-    phone_number="default_phone_number",
-    department="default_department",
-    title="default_title",
-    role="default_role",
-    suspended=False,
-    invite_status="default_invite_status",
-    list_tags=("tag1",),
-    bot=False,
-    created_at=datetime.now(timezone.utc).isoformat(),
-    last_activity_at=datetime.now(timezone.utc).isoformat(),
-    time_zone="MSK",
-    image_url="default_image_url",
-) -> PachcaUser:
-    return PachcaUser(
-        id=id,
-        first_name=first_name,
-        last_name=last_name,
-        nickname=nickname,
-        email=email,
-        phone_number=phone_number,
-        department=department,
-        title=title,
-        role=role,
-        suspended=suspended,
-        invite_status=invite_status,
-        list_tags=list_tags,
-        bot=bot,
-        created_at=created_at,
-        last_activity_at=last_activity_at,
-        time_zone=time_zone,
-        image_url=image_url,
-    )
-
-
-def pachca_reaction_factory(
-    type="reaction",
-    event="new",
-    message_id=1,
-    code="default_code",
-    user_id=1,
-    created_at=datetime.now(timezone.utc),
-    webhook_timestamp=datetime.now(timezone.utc),
-) -> PachcaReaction:
-    return PachcaReaction(
-        type=type,
-        event=event,
-        message_id=message_id,
-        code=code,
-        user_id=user_id,
-        created_at=created_at,
-        webhook_timestamp=webhook_timestamp,
-    )
+async def outbox_replies(session: AsyncSession) -> list[tuple[int, str, int | None]]:
+    stmt = select(OutboxMessage).order_by(OutboxMessage.id)
+    return [(m.chat_id, m.text, m.parent_message_id) for m in (await session.execute(stmt)).scalars()]
 
 
 @pytest.mark.asyncio
@@ -127,13 +46,11 @@ async def test_process_subscribe(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     await process_subscribe(
         message=message,
         tracker_queue_key=tracker_queue_key,
         session=session,
-        pachca_client=pachca_client,
     )
     stmt = (
         select(ThreadTicketSub)
@@ -145,11 +62,9 @@ async def test_process_subscribe(
     assert sub.issue_key == issue_key
     assert sub.chat_id == message.chat_id
     assert sub.message_id == message.id
-    pachca_client.send_message.assert_awaited_with(
-        chat_id=message.chat_id,
-        text=f"Я сообщу вам об изменении статуса тикета {issue_key}",
-        parent_message_id=message.id,
-    )
+    assert await outbox_replies(session) == [
+        (message.chat_id, f"Я сообщу вам об изменении статуса тикета {issue_key}", message.id),
+    ]
 
 
 @pytest.mark.asyncio
@@ -172,7 +87,6 @@ async def test_process_unsubscribe(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     sub = ThreadTicketSub(
         issue_key=issue_key,
@@ -185,7 +99,6 @@ async def test_process_unsubscribe(
         message=message,
         tracker_queue_key=tracker_queue_key,
         session=session,
-        pachca_client=pachca_client,
     )
     stmt = (
         select(ThreadTicketSub)
@@ -194,11 +107,9 @@ async def test_process_unsubscribe(
     )
     result = await session.execute(stmt)
     assert len(result.scalars().all()) == 0
-    pachca_client.send_message.assert_awaited_with(
-        chat_id=message.chat_id,
-        text=f"Тикет {issue_key} больше не отслеживается в этом треде",
-        parent_message_id=message.id,
-    )
+    assert await outbox_replies(session) == [
+        (message.chat_id, f"Тикет {issue_key} больше не отслеживается в этом треде", message.id),
+    ]
 
 
 @pytest.mark.asyncio
@@ -221,20 +132,17 @@ async def test_subscribe_already_subscribed(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     for _ in range(2):
         await process_subscribe(
             message=message,
             tracker_queue_key=tracker_queue_key,
             session=session,
-            pachca_client=pachca_client,
         )
-    pachca_client.send_message.assert_awaited_with(
-        chat_id=message.chat_id,
-        text=f"Тикет {issue_key} уже отслеживается в этом треде",
-        parent_message_id=message.id,
-    )
+    assert await outbox_replies(session) == [
+        (message.chat_id, f"Я сообщу вам об изменении статуса тикета {issue_key}", message.id),
+        (message.chat_id, f"Тикет {issue_key} уже отслеживается в этом треде", message.id),
+    ]
 
 
 @pytest.mark.asyncio
@@ -257,19 +165,44 @@ async def test_process_unsubscribe_non_existing(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     await process_unsubscribe(
         message=message,
         tracker_queue_key=tracker_queue_key,
         session=session,
-        pachca_client=pachca_client,
-    )
-    pachca_client.send_message.assert_awaited_with(
-        chat_id=message.chat_id,
-        text=f"Тикет {issue_key} не отслеживался в этом треде",
-        parent_message_id=message.id,
     )
+    assert await outbox_replies(session) == [
+        (message.chat_id, f"Тикет {issue_key} не отслеживался в этом треде", message.id),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_process_subscribe_multiple_issue_keys(session: AsyncSession):
+    session.add(ThreadTicketSub(issue_key="BACKLOG-2", chat_id=1, message_id=1))
+    await session.commit()
+    message = pachca_message_factory(id=2, chat_id=1, content="/subscribe BACKLOG-1 BACKLOG-2 BACKLOG-1")
+    await process_subscribe(message=message, tracker_queue_key="BACKLOG", session=session)
+    subs = (await session.execute(select(ThreadTicketSub.issue_key, ThreadTicketSub.message_id))).all()
+    assert sorted(subs) == [("BACKLOG-1", 2), ("BACKLOG-2", 1)]
+
+    unsubscribe = pachca_message_factory(id=3, chat_id=1, content="/unsubscribe BACKLOG-1 BACKLOG-2 BACKLOG-3")
+    await process_unsubscribe(message=unsubscribe, tracker_queue_key="BACKLOG", session=session)
+    assert (await session.execute(select(ThreadTicketSub))).scalars().all() == []
+    assert await outbox_replies(session) == [
+        (
+            1,
+            "Я сообщу вам об изменении статуса тикета BACKLOG-1\n"
+            "Тикет BACKLOG-2 уже отслеживается в этом треде",
+            2,
+        ),
+        (
+            1,
+            "Тикет BACKLOG-1 больше не отслеживается в этом треде\n"
+            "Тикет BACKLOG-2 больше не отслеживается в этом треде\n"
+            "Тикет BACKLOG-3 не отслеживался в этом треде",
+            3,
+        ),
+    ]
 
 
 @pytest.mark.asyncio
@@ -292,7 +225,6 @@ async def test_process_subscribe_is_transactional_with_broken_orm(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     patcher = patch("sqlalchemy.ext.asyncio.AsyncSession.add")
     patcher.start().side_effect = Exception()
@@ -301,7 +233,6 @@ async def test_process_subscribe_is_transactional_with_broken_orm(
             message=message,
             tracker_queue_key=tracker_queue_key,
             session=session,
-            pachca_client=pachca_client,
         )
     except Exception:
         patcher.stop()
@@ -314,7 +245,7 @@ async def test_process_subscribe_is_transactional_with_broken_orm(
         result = await session.execute(stmt)
         sub = result.scalar_one_or_none()
         assert sub is None
-        pachca_client.send_message.assert_not_awaited()
+        assert await outbox_replies(session) == []
     else:
         assert False, "Exception was not raised, but it should"
 
@@ -334,14 +265,13 @@ async def test_process_subscribe_is_transactional_with_broken_orm(
         ),
     ),
 )
-async def test_process_subscribe_is_transactional_with_broken_pachca(
+async def test_process_subscribe_is_transactional_with_broken_commit(
     issue_key: str,
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
-    patcher = patch("app.service.pachca_client.PachcaClient.send_message")
+    patcher = patch("sqlalchemy.ext.asyncio.AsyncSession.commit")
     method = patcher.start()
     method.side_effect = Exception()
     try:
@@ -349,7 +279,6 @@ async def test_process_subscribe_is_transactional_with_broken_pachca(
             message=message,
             tracker_queue_key=tracker_queue_key,
             session=session,
-            pachca_client=pachca_client,
         )
     except Exception:
         patcher.stop()
@@ -363,6 +292,7 @@ async def test_process_subscribe_is_transactional_with_broken_pachca(
         sub = result.scalar_one_or_none()
         assert sub is None
         method.assert_awaited_once()
+        assert await outbox_replies(session) == []
     else:
         assert False, "Exception was not raised, but it should"
 
@@ -387,7 +317,6 @@ async def test_process_unsubscribe_is_transactional_with_broken_orm(
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     sub = ThreadTicketSub(
         issue_key=issue_key,
@@ -396,14 +325,14 @@ async def test_process_unsubscribe_is_transactional_with_broken_orm(
     )
     session.add(sub)
     await session.commit()
-    patcher = patch("sqlalchemy.ext.asyncio.AsyncSession.delete")
+    # the subscription is deleted with a DELETE statement, so the reply added afterwards is broken
+    patcher = patch("sqlalchemy.ext.asyncio.AsyncSession.add")
     patcher.start().side_effect = Exception()
     try:
         await process_unsubscribe(
             message=message,
             tracker_queue_key=tracker_queue_key,
             session=session,
-            pachca_client=pachca_client,
         )
     except Exception:
         patcher.stop()
@@ -418,7 +347,7 @@ async def test_process_unsubscribe_is_transactional_with_broken_orm(
         assert sub.issue_key == issue_key
         assert sub.chat_id == message.chat_id
         assert sub.message_id == message.id
-        pachca_client.send_message.assert_not_awaited()
+        assert await outbox_replies(session) == []
     else:
         assert False, "Exception was not raised, but it should"
 
@@ -438,12 +367,11 @@ async def test_process_unsubscribe_is_transactional_with_broken_orm(
         ),
     ),
 )
-async def test_process_unsubscribe_is_transactional_with_broken_pachca(
+async def test_process_unsubscribe_is_transactional_with_broken_commit(
     issue_key: str,
     message: PachcaMessage,
     tracker_queue_key: str,
     session: AsyncSession,
-    pachca_client: PachcaClient,
 ):
     sub = ThreadTicketSub(
         issue_key=issue_key,
@@ -452,7 +380,7 @@ async def test_process_unsubscribe_is_transactional_with_broken_pachca(
     )
     session.add(sub)
     await session.commit()
-    patcher = patch("app.service.pachca_client.PachcaClient.send_message")
+    patcher = patch("sqlalchemy.ext.asyncio.AsyncSession.commit")
     method = patcher.start()
     method.side_effect = Exception()
     try:
@@ -460,7 +388,6 @@ async def test_process_unsubscribe_is_transactional_with_broken_pachca(
             message=message,
             tracker_queue_key=tracker_queue_key,
             session=session,
-            pachca_client=pachca_client,
         )
     except Exception:
         patcher.stop()
@@ -476,6 +403,7 @@ async def test_process_unsubscribe_is_transactional_with_broken_pachca(
         assert sub.chat_id == message.chat_id
         assert sub.message_id == message.id
         method.assert_awaited_once()
+        assert await outbox_replies(session) == []
     else:
         assert False, "Exception was not raised, but it should"
 
@@ -674,6 +602,7 @@ async def test_process_other_message(
 )
 async def test_process_reaction_to_student_message(
     session: AsyncSession,
+    app_config: AppConfig,
     pachca_client: PachcaClient,
     reaction: PachcaReaction,
     user: PachcaUser,
@@ -686,7 +615,6 @@ async def test_process_reaction_to_student_message(
         chat_id=228,
         thread_message_id=322,
         thread_chat_id=1488,
-        text="niggers",
         sent_at=datetime.now(timezone.utc),
     )
     message2 = StudentMessage(
@@ -696,14 +624,13 @@ async def test_process_reaction_to_student_message(
         chat_id=228,
         thread_message_id=322,
         thread_chat_id=1488,
-        text="niggers",
         sent_at=datetime.now(timezone.utc),
     )
     session.add(message1)
     session.add(message2)
     await session.commit()
     with patch("app.service.pachca_client.PachcaClient.get_user", return_value=user):
-        await process_reaction(reaction, session, pachca_client)
+        await process_reaction(reaction, app_config, session, pachca_client)
     stmt = select(StudentMessage).where(StudentMessage.message_group_id == message_group_id)
     result = (await session.execute(stmt)).scalars().all()
     for r in result:
@@ -723,7 +650,6 @@ async def test_process_reply_to_student_message(
         chat_id=228,
         thread_message_id=322,
         thread_chat_id=1488,
-        text="niggers",
         sent_at=datetime.now(timezone.utc),
         course="StartDE",
     )
@@ -748,6 +674,7 @@ async def test_process_reply_to_student_message(
     for r in result:
         assert r.received_reaction
 
+
 @pytest.mark.asyncio
 async def test_process_reply_in_thread_to_student_message(
     session: AsyncSession,
@@ -759,7 +686,6 @@ async def test_process_reply_in_thread_to_student_message(
         message_group_id=1,
         user_id=69,
         chat_id=228,
-        text="niggers",
         sent_at=datetime.now(timezone.utc),
         course="StartDE",
     )
@@ -786,3 +712,28 @@ async def test_process_reply_in_thread_to_student_message(
     result = (await session.execute(stmt)).scalars().all()
     for r in result:
         assert r.received_reaction
+
+
+@pytest.mark.asyncio
+async def test_react_to_message_group_returns_updated_messages(session: AsyncSession):
+    sent_at = datetime.now(timezone.utc)
+    for message_id, message_group_id, received_reaction in ((1, 1, False), (2, 1, True), (3, 1, False), (4, 2, False)):
+        session.add(
+            StudentMessage(
+                message_id=message_id,
+                message_group_id=message_group_id,
+                user_id=1,
+                chat_id=1,
+                received_reaction=received_reaction,
+                sent_at=sent_at,
+            )
+        )
+    await session.commit()
+    student_message = await session.get(StudentMessage, 1)
+    assert student_message is not None
+    message_ids = await react_to_message_group(session, student_message, sent_at, reaction_message_id=5)
+    await session.commit()
+    assert sorted(message_ids) == [1, 3]
+    session.expunge_all()
+    result = (await session.execute(select(StudentMessage).order_by(StudentMessage.message_id))).scalars().all()
+    assert [(r.received_reaction, r.reaction_message_id) for r in result] == [(True, 5), (True, None), (True, 5), (False, None)]
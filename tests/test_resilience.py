@@ -0,0 +1,115 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.service.resilience import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    hedge,
+)
+
+
+class UpstreamError(Exception):
+    pass
+
+
+async def failing() -> None:
+    raise UpstreamError()
+
+
+async def succeeding() -> str:
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(
+        name="test",
+        failure_threshold=2,
+        recovery_timeout_seconds=10,
+        is_failure=lambda e: isinstance(e, UpstreamError),
+    )
+    with patch("app.service.resilience.time.monotonic", return_value=0):
+        for _ in range(2):
+            with pytest.raises(UpstreamError):
+                await breaker.call(failing)
+        assert breaker.state == STATE_OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(succeeding)
+    with patch("app.service.resilience.time.monotonic", return_value=11):
+        assert breaker.state == STATE_HALF_OPEN
+        assert await breaker.call(succeeding) == "ok"
+        assert breaker.state == STATE_CLOSED
+    assert breaker.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(name="test", failure_threshold=1, recovery_timeout_seconds=10)
+    with patch("app.service.resilience.time.monotonic", return_value=0):
+        with pytest.raises(UpstreamError):
+            await breaker.call(failing)
+    with patch("app.service.resilience.time.monotonic", return_value=11):
+        with pytest.raises(UpstreamError):
+            await breaker.call(failing)
+        assert breaker.state == STATE_OPEN
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_ignores_non_upstream_errors():
+    breaker = CircuitBreaker(
+        name="test",
+        failure_threshold=1,
+        recovery_timeout_seconds=10,
+        is_failure=lambda e: isinstance(e, UpstreamError),
+    )
+
+    async def bad_request() -> None:
+        raise ValueError()
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await breaker.call(bad_request)
+    assert breaker.state == STATE_CLOSED
+
+
+@pytest.mark.asyncio
+async def test_hedge_returns_first_success():
+    calls = 0
+
+    async def slow_then_fast() -> int:
+        nonlocal calls
+        calls += 1
+        attempt = calls
+        await asyncio.sleep(1 if attempt == 1 else 0)
+        return attempt
+
+    assert await hedge(slow_then_fast, delay_seconds=0.01) == 2
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_hedge_is_not_fired_for_fast_calls():
+    calls = 0
+
+    async def fast() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await hedge(fast, delay_seconds=1) == 1
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_raises_when_all_attempts_fail():
+    async def slow_failing() -> None:
+        await asyncio.sleep(0.02)
+        raise UpstreamError()
+
+    with pytest.raises(UpstreamError):
+        await hedge(slow_failing, delay_seconds=0.01)
@@ -0,0 +1,36 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.service.orm.routing import SessionRouter
+
+
+@pytest.mark.asyncio
+async def test_read_session_uses_fresh_replica(sessionmaker: async_sessionmaker[AsyncSession]):
+    replica = async_sessionmaker(create_async_engine(url="sqlite+aiosqlite://"))
+    session_router = SessionRouter(primary=sessionmaker, replica=replica, max_lag_seconds=10)
+    async with session_router.read_session() as session:
+        assert session.get_bind() is replica.kw["bind"].sync_engine
+    assert session_router.stats()["replica_reads"] == 1
+
+    # too stale replica
+    with patch.object(SessionRouter, "replica_lag_seconds", return_value=60.0):
+        async with session_router.read_session() as session:
+            assert session.get_bind() is sessionmaker.kw["bind"].sync_engine
+    assert session_router.stats()["primary_reads"] == 1
+    assert session_router.stats()["last_lag_seconds"] == 60.0
+
+    # unavailable replica
+    with patch.object(SessionRouter, "replica_lag_seconds", side_effect=ConnectionRefusedError()):
+        async with session_router.read_session() as session:
+            assert session.get_bind() is sessionmaker.kw["bind"].sync_engine
+    assert session_router.stats()["primary_reads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_read_session_without_replica(engine: AsyncEngine, sessionmaker: async_sessionmaker[AsyncSession]):
+    session_router = SessionRouter(primary=sessionmaker)
+    async with session_router.read_session() as session:
+        assert session.get_bind() is engine.sync_engine
+    assert session_router.stats()["primary_reads"] == 1
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import AppConfig
+from app.service.event_processing.events import EVENT_MESSAGE, EVENT_REACTION
+from app.service.orm.models import StudentMessage
+from app.service.tasks.sla_scheduler import SlaScheduler
+from tests.factories import add_message_groups, pachca_message_factory
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    """Polls the condition instead of sleeping for a fixed time, the timeout only bounds a failing test."""
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_sla_scheduler_wakes_up_at_deadlines():
+    check = AsyncMock(return_value=0)
+    sla_scheduler = SlaScheduler(check=check, response_sla_seconds=0, reminder_period_seconds=0.01)
+    task = asyncio.create_task(sla_scheduler.run())
+    try:
+        # startup check, then nothing to wait for
+        await wait_until(lambda: check.await_count == 1 and sla_scheduler.stats()["next_wake_up"] is None)
+
+        deadline = datetime.now(timezone.utc) + timedelta(seconds=0.1)
+        sla_scheduler.observe(EVENT_MESSAGE, [pachca_message_factory(created_at=deadline)])
+        sla_scheduler.observe(EVENT_REACTION, [])
+        assert sla_scheduler.stats()["deadlines"] == 1
+        assert sla_scheduler.stats()["next_wake_up"] == deadline.isoformat()
+        await wait_until(lambda: check.await_count == 2)
+        # the check runs at the deadline, not before it
+        assert check.await_args is not None and check.await_args.args[0] >= deadline
+
+        # overdue groups are reminded about until they are answered
+        check.return_value = 1
+        sla_scheduler.add(datetime.now(timezone.utc))
+        await wait_until(lambda: check.await_count >= 4)
+        check.return_value = 0
+        n_checks = check.await_count
+        await wait_until(lambda: check.await_count > n_checks and sla_scheduler.stats()["next_wake_up"] is None)
+        assert sla_scheduler.stats()["deadlines"] == 0
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_sla_scheduler_loads_pending_deadlines(session: AsyncSession, app_config: AppConfig):
+    now = datetime.now(timezone.utc)
+    for message_id, received_reaction in ((1, False), (2, True), (3, False)):
+        session.add(
+            StudentMessage(
+                message_id=message_id,
+                message_group_id=message_id,
+                user_id=1,
+                chat_id=1,
+                received_reaction=received_reaction,
+                sent_at=now + timedelta(minutes=message_id),
+            )
+        )
+    await add_message_groups(session, app_config)
+    sla_scheduler = SlaScheduler(
+        check=AsyncMock(return_value=0),
+        response_sla_seconds=app_config.response_sla_seconds,
+        reminder_period_seconds=60,
+    )
+    # a message processed while the deadlines are loaded keeps its deadline
+    sla_scheduler.add(now)
+    await sla_scheduler.load(session)
+    assert sla_scheduler.stats()["deadlines"] == 3
+    assert sla_scheduler.stats()["next_wake_up"] == now.isoformat()
@@ -1,13 +1,14 @@
 from datetime import datetime, timedelta, timezone
+from unittest.mock import call
 
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
-from unittest.mock import call
 
 from app.config import AppConfig
 from app.service.orm.models import StudentMessage
 from app.service.tasks.response_sla_notification import notify_about_pending_questions
 from app.service.telegram_client import TelegramClient
+from tests.factories import add_message_groups
 
 
 @pytest.mark.asyncio
@@ -40,7 +41,6 @@ async def test_notify_about_pending_questions_not_violated_sla(
                 chat_id=1,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time,
             ),
@@ -51,7 +51,6 @@ async def test_notify_about_pending_questions_not_violated_sla(
                 chat_id=1,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time,
             ),
@@ -62,13 +61,12 @@ async def test_notify_about_pending_questions_not_violated_sla(
                 chat_id=2,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello2",
                 received_reaction=False,
                 sent_at=test_time,
             ),
         )
     )
-    await session.commit()
+    await add_message_groups(session, app_config)
     await notify_about_pending_questions(
         session=session,
         telegram_client=telegram_client,
@@ -93,13 +91,12 @@ async def test_notify_about_pending_questions_violated_sla(
             chat_id=1,
             thread_message_id=None,
             thread_chat_id=None,
-            text="hello",
             received_reaction=False,
             sent_at=test_time,
             course="HardDE",
         )
     )
-    await session.commit()
+    await add_message_groups(session, app_config)
     await notify_about_pending_questions(
         session=session,
         telegram_client=telegram_client,
@@ -131,7 +128,6 @@ async def test_notify_about_pending_questions_violated_sla_multiple(
                 chat_id=1,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time,
                 course="HardDE",
@@ -143,7 +139,6 @@ async def test_notify_about_pending_questions_violated_sla_multiple(
                 chat_id=1,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time + timedelta(seconds=app_config.response_sla_seconds),
                 course="HardDE",
@@ -155,7 +150,6 @@ async def test_notify_about_pending_questions_violated_sla_multiple(
                 chat_id=1,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time,
                 course="HardDE",
@@ -167,7 +161,6 @@ async def test_notify_about_pending_questions_violated_sla_multiple(
                 chat_id=2,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time + timedelta(seconds=app_config.response_sla_seconds),
                 course="HardDE",
@@ -179,14 +172,13 @@ async def test_notify_about_pending_questions_violated_sla_multiple(
                 chat_id=3,
                 thread_message_id=None,
                 thread_chat_id=None,
-                text="hello",
                 received_reaction=False,
                 sent_at=test_time,
                 course="StartDE",
             ),
         )
     )
-    await session.commit()
+    await add_message_groups(session, app_config)
     await notify_about_pending_questions(
         session=session,
         telegram_client=telegram_client,
@@ -1,6 +1,7 @@
+from unittest.mock import call, patch
+
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
-from unittest.mock import call, patch
 
 from app.api.models import TicketStatusChange
 from app.service.event_processing.tracker_events import process_ticket_status_change
@@ -0,0 +1,82 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.service.pachca_client.models import User
+from app.service.pachca_client.user_cache import UserCache
+from tests.factories import pachca_user_factory
+
+
+@pytest.mark.asyncio
+async def test_user_cache_hit_after_miss():
+    cache = UserCache(max_size=10, ttl_seconds=60, negative_ttl_seconds=10)
+    calls: list[int] = []
+
+    async def loader(user_id: int) -> User | None:
+        calls.append(user_id)
+        return pachca_user_factory(id=user_id)
+
+    assert (await cache.get(1, loader)).id == 1
+    assert (await cache.get(1, loader)).id == 1
+    assert calls == [1]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_user_cache_single_flight():
+    cache = UserCache(max_size=10, ttl_seconds=60, negative_ttl_seconds=10)
+    calls: list[int] = []
+    release = asyncio.Event()
+
+    async def loader(user_id: int) -> User | None:
+        calls.append(user_id)
+        await release.wait()
+        return pachca_user_factory(id=user_id)
+
+    waiters = [asyncio.create_task(cache.get(1, loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    users = await asyncio.gather(*waiters)
+    assert all(u.id == 1 for u in users)
+    assert calls == [1]
+    assert cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_user_cache_does_not_cache_errors():
+    cache = UserCache(max_size=10, ttl_seconds=60, negative_ttl_seconds=10)
+
+    async def failing_loader(user_id: int) -> User | None:
+        raise RuntimeError()
+
+    with pytest.raises(RuntimeError):
+        await cache.get(1, failing_loader)
+    assert len(cache) == 0
+    assert cache.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_user_cache_negative_entries_expire_separately():
+    cache = UserCache(max_size=10, ttl_seconds=60, negative_ttl_seconds=10)
+    with patch("app.service.pachca_client.user_cache.time.monotonic", return_value=0):
+        cache.put(1, None)
+        cache.put(2, pachca_user_factory(id=2))
+    with patch("app.service.pachca_client.user_cache.time.monotonic", return_value=30):
+        assert cache.lookup(1) == (False, None)
+        found, user = cache.lookup(2)
+    assert found
+    assert user is not None and user.id == 2
+
+
+def test_user_cache_evicts_least_recently_used():
+    cache = UserCache(max_size=2, ttl_seconds=60, negative_ttl_seconds=10)
+    cache.put(1, pachca_user_factory(id=1))
+    cache.put(2, pachca_user_factory(id=2))
+    cache.lookup(1)
+    cache.put(3, pachca_user_factory(id=3))
+    assert cache.lookup(2) == (False, None)
+    assert cache.lookup(1)[0]
+    assert cache.lookup(3)[0]
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.service.event_processing.user_roles import (
+    ROLE_EXPERT,
+    ROLE_OTHER,
+    ROLE_STUDENT,
+    classify_user,
+    get_user_role,
+    get_user_roles,
+    tags_hash,
+)
+from app.service.orm.models import UserRole
+from app.service.pachca_client import PachcaClient, UserNotFoundError
+from app.service.resilience import CircuitOpenError
+from tests.factories import pachca_user_factory
+
+
+@pytest.mark.parametrize(
+    ("tags", "role", "course"),
+    (
+        (("HardDE_12",), ROLE_STUDENT, "HardDE"),
+        (("StartDE_3", "other"), ROLE_STUDENT, "StartDE"),
+        (("expert_HardDE",), ROLE_EXPERT, None),
+        (("curator_StartDE",), ROLE_EXPERT, None),
+        (("tag1",), ROLE_OTHER, None),
+    ),
+)
+def test_classify_user(tags: tuple[str, ...], role: str, course: str | None):
+    assert classify_user(pachca_user_factory(list_tags=tags)) == (role, course)
+
+
+@pytest.mark.asyncio
+async def test_get_user_role_persists_classification(session: AsyncSession, pachca_client: PachcaClient):
+    user = pachca_user_factory(id=1, list_tags=("HardDE_1",))
+    with patch("app.service.pachca_client.PachcaClient.get_user", return_value=user) as get_user:
+        user_role = await get_user_role(session, pachca_client, 1, max_age_seconds=60)
+        assert user_role is not None
+        assert user_role.role == ROLE_STUDENT
+        assert user_role.course == "HardDE"
+        user_role = await get_user_role(session, pachca_client, 1, max_age_seconds=60)
+        assert user_role is not None
+        assert user_role.role == ROLE_STUDENT
+    get_user.assert_awaited_once_with(1)
+    session.expunge_all()
+    stored = await session.get(UserRole, 1)
+    assert stored is not None
+    assert stored.tags_hash == tags_hash(["HardDE_1"])
+
+
+@pytest.mark.asyncio
+async def test_get_user_role_refreshes_stale_rows(session: AsyncSession, pachca_client: PachcaClient):
+    session.add(
+        UserRole(
+            user_id=1,
+            role=ROLE_STUDENT,
+            course="StartDE",
+            tags_hash=tags_hash(["StartDE_1"]),
+            refreshed_at=datetime.now(timezone.utc) - timedelta(seconds=120),
+        )
+    )
+    await session.commit()
+    user = pachca_user_factory(id=1, list_tags=("expert_StartDE",))
+    with patch("app.service.pachca_client.PachcaClient.get_user", return_value=user) as get_user:
+        user_role = await get_user_role(session, pachca_client, 1, max_age_seconds=60)
+    get_user.assert_awaited_once_with(1)
+    assert user_role is not None
+    assert user_role.role == ROLE_EXPERT
+    assert user_role.course is None
+
+
+@pytest.mark.asyncio
+async def test_get_user_role_of_missing_user(session: AsyncSession, pachca_client: PachcaClient):
+    with patch("app.service.pachca_client.PachcaClient.get_user", side_effect=UserNotFoundError(1)):
+        assert await get_user_role(session, pachca_client, 1, max_age_seconds=60) is None
+
+
+@pytest.mark.asyncio
+async def test_get_user_role_keeps_classification_of_same_tags(session: AsyncSession, pachca_client: PachcaClient):
+    refreshed_at = datetime.now(timezone.utc) - timedelta(seconds=120)
+    session.add(
+        UserRole(
+            user_id=1,
+            # classified before the rules changed, tags are the same since then
+            role=ROLE_OTHER,
+            course=None,
+            tags_hash=tags_hash(["HardDE_1"]),
+            refreshed_at=refreshed_at,
+        )
+    )
+    await session.commit()
+    user = pachca_user_factory(id=1, list_tags=("HardDE_1",))
+    with (
+        patch("app.service.pachca_client.PachcaClient.get_user", return_value=user),
+        patch("app.service.event_processing.user_roles.classify_user") as classify,
+    ):
+        user_role = await get_user_role(session, pachca_client, 1, max_age_seconds=60)
+    classify.assert_not_called()
+    assert user_role is not None
+    assert user_role.role == ROLE_OTHER
+    assert user_role.refreshed_at > refreshed_at
+
+
+@pytest.mark.asyncio
+async def test_get_user_role_leaves_commit_to_caller(session: AsyncSession, pachca_client: PachcaClient):
+    user = pachca_user_factory(id=1, list_tags=("HardDE_1",))
+    with patch("app.service.pachca_client.PachcaClient.get_user", return_value=user):
+        assert await get_user_role(session, pachca_client, 1, max_age_seconds=60) is not None
+    await session.rollback()
+    assert await session.get(UserRole, 1) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", (CircuitOpenError("/users", 10), asyncio.TimeoutError()))
+async def test_get_user_role_falls_back_to_stale_row(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    error: Exception,
+):
+    refreshed_at = datetime.now(timezone.utc) - timedelta(seconds=120)
+    session.add(
+        UserRole(
+            user_id=1,
+            role=ROLE_STUDENT,
+            course="HardDE",
+            tags_hash=tags_hash(["HardDE_1"]),
+            refreshed_at=refreshed_at,
+        )
+    )
+    await session.commit()
+    with patch("app.service.pachca_client.PachcaClient.get_user", side_effect=error):
+        user_role = await get_user_role(session, pachca_client, 1, max_age_seconds=60)
+        assert user_role is not None
+        assert user_role.role == ROLE_STUDENT
+        user_roles = await get_user_roles(session, pachca_client, [1], max_age_seconds=60)
+        assert user_roles[1].role == ROLE_STUDENT
+        # nothing to fall back to
+        with pytest.raises(type(error)):
+            await get_user_role(session, pachca_client, 2, max_age_seconds=60)
+        with pytest.raises(type(error)):
+            await get_user_roles(session, pachca_client, [1, 2], max_age_seconds=60)
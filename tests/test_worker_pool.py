@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.models import PachcaMessage, PachcaReaction, ThreadInfo, TicketStatusChange
+from app.config import AppConfig
+from app.service.event_processing.events import (
+    EVENT_MESSAGE,
+    EVENT_REACTION,
+    EVENT_SUBSCRIBE,
+    partition_key,
+    process_event,
+)
+from app.service.event_processing.worker_pool import EventWorkerPool, QueuedEvent
+from app.service.orm.models import ThreadTicketSub
+from app.service.pachca_client import PachcaClient
+from tests.factories import pachca_message_factory, pachca_reaction_factory
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_processes_events():
+    processed: list[str] = []
+
+    async def handler(event: QueuedEvent) -> None:
+        if event.kind == "fail":
+            raise RuntimeError()
+        processed.append(event.kind)
+
+    worker_pool = EventWorkerPool(handler=handler, max_size=10, n_workers=2)
+    worker_pool.start()
+    for kind in ("a", "fail", "b"):
+        assert worker_pool.submit(QueuedEvent(kind=kind, payload=pachca_message_factory()))
+    await worker_pool.stop(timeout_seconds=1)
+    assert sorted(processed) == ["a", "b"]
+    stats = worker_pool.stats()
+    assert stats["processed"] == 2
+    assert stats["failed"] == 1
+    assert stats["depth"] == 0
+    assert stats["workers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_rejects_when_full():
+    release = asyncio.Event()
+
+    async def handler(event: QueuedEvent) -> None:
+        await release.wait()
+
+    worker_pool = EventWorkerPool(handler=handler, max_size=1, n_workers=1)
+    worker_pool.start()
+    assert worker_pool.submit(QueuedEvent(kind="a", payload=pachca_message_factory()))
+    await asyncio.sleep(0)  # the only worker takes the first event
+    assert worker_pool.submit(QueuedEvent(kind="b", payload=pachca_message_factory()))
+    assert not worker_pool.submit(QueuedEvent(kind="c", payload=pachca_message_factory()))
+    assert worker_pool.stats()["rejected"] == 1
+    release.set()
+    await worker_pool.stop(timeout_seconds=1)
+    assert worker_pool.stats()["processed"] == 2
+
+
+def test_partition_key():
+    in_chat = pachca_message_factory(user_id=1, chat_id=10)
+    in_thread = pachca_message_factory(user_id=1, chat_id=20, thread=ThreadInfo(message_id=5, message_chat_id=10))
+    assert partition_key(EVENT_MESSAGE, in_chat) == partition_key(EVENT_MESSAGE, in_thread)
+    # an expert reply goes with the student messages it answers
+    reply = pachca_message_factory(user_id=2, chat_id=10, parent_message_id=5)
+    assert partition_key(EVENT_MESSAGE, in_chat) == partition_key(EVENT_MESSAGE, reply)
+    assert partition_key(EVENT_MESSAGE, in_chat) != partition_key(EVENT_MESSAGE, pachca_message_factory(chat_id=11))
+    assert partition_key(EVENT_SUBSCRIBE, in_chat) == partition_key(EVENT_SUBSCRIBE, pachca_message_factory(user_id=2, chat_id=10))
+    assert partition_key(EVENT_REACTION, pachca_reaction_factory(message_id=5)) == "message:5"
+    assert partition_key("ticket_status_change", TicketStatusChange(issue_key="TEST-1", status="Closed")) == "ticket:TEST-1"
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_keeps_order_within_conversation():
+    processed: dict[int, list[int]] = {1: [], 2: []}
+    in_flight: set[int] = set()
+    max_in_flight = 0
+
+    async def handler(event: QueuedEvent) -> None:
+        nonlocal max_in_flight
+        assert isinstance(event.payload, PachcaMessage)
+        in_flight.add(event.payload.id)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        # later events of a conversation finish faster, they would overtake earlier ones if run concurrently
+        await asyncio.sleep(0.01 * (10 - event.payload.id % 10))
+        processed[event.payload.user_id].append(event.payload.id)
+        in_flight.discard(event.payload.id)
+
+    worker_pool = EventWorkerPool(handler=handler, max_size=100, n_workers=8)
+    user_ids = (1, 2)  # chats of these users land on different lanes out of 8
+    worker_pool.start()
+    for i in range(5):
+        for user_id in user_ids:
+            message = pachca_message_factory(id=user_id * 10 + i, user_id=user_id, chat_id=user_id)
+            assert worker_pool.submit(QueuedEvent(kind=EVENT_MESSAGE, payload=message))
+    await worker_pool.stop(timeout_seconds=5)
+    assert processed == {1: [10, 11, 12, 13, 14], 2: [20, 21, 22, 23, 24]}
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_process_event(
+    session: AsyncSession,
+    pachca_client: PachcaClient,
+    app_config: AppConfig,
+):
+    message = pachca_message_factory(id=1, chat_id=1, content="/subscribe TEST-1")
+    await process_event(EVENT_SUBSCRIBE, message, app_config, session, pachca_client)
+    sub = (await session.execute(select(ThreadTicketSub))).scalar_one()
+    assert sub.issue_key == "TEST-1"
+    with pytest.raises(ValueError):
+        await process_event(
+            EVENT_MESSAGE,
+            TicketStatusChange(issue_key="TEST-1", status="Closed"),
+            app_config,
+            session,
+            pachca_client,
+        )
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_keeps_conversation_order():
+    processed: list[tuple[str, int]] = []
+
+    async def handler(event: QueuedEvent) -> None:
+        if isinstance(event.payload, PachcaReaction):
+            processed.append(("reaction", event.payload.message_id))
+        elif isinstance(event.payload, PachcaMessage) and event.payload.parent_message_id is not None:
+            processed.append(("reply", event.payload.parent_message_id))
+        elif isinstance(event.payload, PachcaMessage):
+            # the student message is slow to write
+            await asyncio.sleep(0.01)
+            processed.append(("student", event.payload.id))
+
+    worker_pool = EventWorkerPool(handler=handler, max_size=100, n_workers=8)
+    worker_pool.start()
+    message_ids = range(1, 9)
+    for message_id in message_ids:
+        chat_id = 10 + message_id
+        student_message = pachca_message_factory(id=message_id, user_id=1, chat_id=chat_id)
+        reply = pachca_message_factory(id=100 + message_id, user_id=2, chat_id=chat_id, parent_message_id=message_id)
+        reaction = pachca_reaction_factory(message_id=message_id, user_id=3)
+        assert worker_pool.submit(QueuedEvent(kind=EVENT_MESSAGE, payload=student_message))
+        assert worker_pool.submit(QueuedEvent(kind=EVENT_MESSAGE, payload=reply))
+        assert worker_pool.submit(QueuedEvent(kind=EVENT_REACTION, payload=reaction))
+    await worker_pool.stop(timeout_seconds=5)
+    assert len(processed) == 3 * len(message_ids)
+    # answers never overtake the message they answer, whatever lanes the conversations landed in
+    for message_id in message_ids:
+        student_at = processed.index(("student", message_id))
+        assert processed.index(("reply", message_id)) > student_at
+        assert processed.index(("reaction", message_id)) > student_at